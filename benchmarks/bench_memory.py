@@ -0,0 +1,77 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Measures the memory used per pending transaction.
+#               Transactions are built as they are received from peers (decoded from the wire) then kept in memory, like in the pending pool.
+#               The compact classes (__slots__ and shared public key texts) are compared to the previous layout
+#               (one __dict__ per object and one copy of the key text per input and output)
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.codec import encode, decode
+from blockchain.crypto_tools import generateKeys, hash
+import argparse
+import gc
+import time
+import tracemalloc
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', "--transactions", default=20000, type=int, help="number of transactions kept in memory")
+parser.add_argument('-w', "--wallets", default=50, type=int, help="number of distinct wallets sending and receiving coins")
+args = parser.parse_args()
+
+
+# Previous layout of the data classes
+class LegacyInput():
+    def __init__(self, inp):
+        # Every decoded input had its own copy of the key text
+        self.public_key = bytes(bytearray(inp.public_key))
+        self.amount = inp.amount
+        self.prev_tx_hash = inp.prev_tx_hash
+        self.prev_index = inp.prev_index
+        self.signature = inp.signature
+
+class LegacyOutput():
+    def __init__(self, outp):
+        self.public_key = bytes(bytearray(outp.public_key))
+        self.amount = outp.amount
+
+class LegacyTransaction():
+    def __init__(self, transaction):
+        self.id = transaction.id
+        self.timestamp = transaction.timestamp
+        self.inputs = [LegacyInput(i) for i in transaction.inputs]
+        self.outputs = [LegacyOutput(o) for o in transaction.outputs]
+        self.hash = transaction.hash
+        self.signature = transaction.signature
+
+
+wallets = [generateKeys() for _ in range(args.wallets)]
+encoded = []
+for i in range(args.transactions):
+    sender_private_key, sender_public_key = wallets[i % args.wallets]
+    _, receiver_public_key = wallets[(i * 7 + 1) % args.wallets]
+    outputs = [Output(receiver_public_key, 60), Output(sender_public_key, 40)]
+    inp = Input(sender_private_key, sender_public_key, 100, hash(str(i).encode()), 0, outputs)
+    transaction = Transaction(i, time.time(), [inp], outputs)
+    encoded.append(encode(transaction))
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    kept = [build(data) for data in encoded]
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return (end - start) / len(encoded)
+
+# Measure the legacy layout first, keys are interned by the decoder so the legacy objects copy them
+legacy = measure(lambda data: LegacyTransaction(decode(data)))
+compact = measure(lambda data: decode(data))
+
+print(f"{args.transactions} transactions (1 input, 2 outputs) between {args.wallets} wallets")
+print(f"{'layout':<12}{'bytes/transaction':>20}")
+print(f"{'previous':<12}{legacy:>20.0f}")
+print(f"{'compact':<12}{compact:>20.0f}")
+print(f"Saved {100*(1-compact/legacy):.0f}%")
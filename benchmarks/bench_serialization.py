@@ -0,0 +1,63 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Measures the time spent building the serialized bytes of a block and of its transactions
+#               when a block is built, signed and checked (merkle root, signature checks, hash).
+#               Cached bytes (sealed objects) are compared to building the bytes again at every use.
+#               Signatures themselves are not checked, only the bytes they cover are built.
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.crypto_tools import generateKeys, hash
+import argparse
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-n', "--transactions", default=2000, type=int, help="number of transactions in the block")
+parser.add_argument('-i', "--inputs", default=3, type=int, help="number of inputs and outputs per transaction")
+parser.add_argument('-r', "--rounds", default=20, type=int, help="number of times the block is checked")
+args = parser.parse_args()
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+# Inputs are signed once and shared, signing is not what is measured here
+outputs = [Output(miner_public_key, 10) for _ in range(args.inputs)]
+inputs = [Input(sender_private_key, sender_public_key, 10, hash(bytes([i])), i, outputs) for i in range(args.inputs)]
+transactions = [Transaction(i, time.time(), list(inputs), list(outputs)) for i in range(args.transactions)]
+block = Block(1, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, hash(b"genesis"))
+
+
+def invalidate_all():
+    for transaction in transactions:
+        for part in transaction.inputs + transaction.outputs:
+            part.invalidate()
+        transaction.invalidate()
+    block.invalidate()
+
+def check(uncached):
+    """One pass of what Block.verify does with the bytes : merkle root, then every signed message, then the block hash
+    """
+    if uncached:
+        invalidate_all()
+    block.verify_merkle_root()
+    if uncached:
+        invalidate_all()
+    block.signature_checks()
+    if uncached:
+        invalidate_all()
+    hash(block.serialize())
+
+for uncached in [True, False]:
+    # Time spent dropping the caches is measured apart and removed
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        invalidate_all(); invalidate_all(); invalidate_all()
+    overhead = time.perf_counter() - start if uncached else 0.0
+
+    block.seal()
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        check(uncached)
+    elapsed = time.perf_counter() - start - overhead
+    print(f"{'Bytes built at every use' if uncached else 'Sealed (cached bytes)':<25} : {elapsed / args.rounds * 1000:8.2f} ms per block check ({args.transactions} transactions)")
@@ -0,0 +1,42 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Compares the signature schemes : signatures and verifications per second,
+#               size of the keys and signatures, and size of an encoded transaction (wire format) with keys of each scheme
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.codec import encode
+from blockchain.crypto_tools import generateKeys, sign, verify, publicKey2Text, schemes, hash
+import argparse
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-d', "--duration", default=1.0, type=float, help="time in seconds spent measuring each operation")
+parser.add_argument('-i', "--inputs", default=2, type=int, help="number of inputs and outputs of the measured transaction")
+args = parser.parse_args()
+
+message = bytes(range(200))
+
+def ops_per_second(operation):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        operation()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+print(f"{'Scheme':<10} {'sign/s':>10} {'verify/s':>10} {'key text':>9} {'signature':>10} {'transaction':>12}")
+for name in schemes():
+    private_key, public_key = generateKeys(name)
+    key_text = publicKey2Text(public_key)
+    signature = sign(private_key, message)
+    signs = ops_per_second(lambda: sign(private_key, message))
+    # Keys are given as texts, like when checking transactions (parsed keys come from the keys cache)
+    verifies = ops_per_second(lambda: verify(key_text, message, signature))
+
+    miner_private_key, miner_public_key = generateKeys(name)
+    outputs = [Output(miner_public_key, 10) for _ in range(args.inputs)]
+    transaction = Transaction(0, time.time(), [Input(private_key, public_key, 10, hash(bytes([i])), i, outputs) for i in range(args.inputs)], outputs)
+    transaction.sign(miner_private_key)
+    print(f"{name:<10} {signs:>10.0f} {verifies:>10.0f} {len(key_text):>8}B {len(signature):>9}B {len(encode(transaction)):>11}B")
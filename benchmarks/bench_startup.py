@@ -0,0 +1,52 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Startup time of a node : cold import of the package and of the data classes (each one in a new python process),
+#               and time to build a node when the NTP server and the known nodes can't be reached (the clock offset is
+#               measured in the background and the known nodes are connected at the same time, so this stays close
+#               to the connect timeout instead of growing with the number of known nodes)
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-r', "--repeat", default=5, type=int, help="number of runs of each measure (the median is shown)")
+parser.add_argument('-n', "--nodes", default=4, type=int, help="number of unreachable known nodes")
+parser.add_argument('-c', "--connect_timeout", default=1.0, type=float, help="time in seconds to wait for each known node")
+parser.add_argument('-p', "--port", default=46900, type=int)
+parser.add_argument("--unreachable", default="10.255.255.1", help="address that drops the connections (known nodes)")
+args = parser.parse_args()
+
+def median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+def cold_import(module):
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    return median([float(subprocess.check_output([sys.executable, "-c", code]).decode().strip()) for _ in range(args.repeat)])
+
+print(f"{'Measure':<40} {'median':>10}")
+for module in ["blockchain", "blockchain.data", "blockchain.node"]:
+    print(f"{'import ' + module:<40} {cold_import(module)*1000:>8.1f}ms")
+
+from blockchain import BlockChainNode
+from blockchain.crypto_tools import generateKeys
+
+work_dir = Path(tempfile.mkdtemp())
+with open(work_dir/"nodes.txt","w") as f:
+    f.write("\n".join(f"{args.unreachable}:{45000+i}" for i in range(args.nodes)))
+private_key, public_key = generateKeys()
+
+times = []
+for i in range(args.repeat):
+    start = time.perf_counter()
+    node = BlockChainNode(private_key, public_key, f"Node{i}", "127.0.0.1", args.port+i,
+                          ntp_server_address="ntp.invalid",
+                          known_nodes_file_name=work_dir/"nodes.txt", ledger_dir=work_dir/f"ledger{i}", pending_transactions_file_name=work_dir/f"pending{i}.journal",
+                          connect_timeout=args.connect_timeout)
+    times.append(time.perf_counter() - start)
+print(f"{f'node with {args.nodes} unreachable known nodes':<40} {median(times)*1000:>8.1f}ms")
+print(f"(sequential connects would wait up to {args.nodes*args.connect_timeout*1000:.0f}ms)")
@@ -0,0 +1,62 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Compares the binary wire format to the old pickle path for gossip frames.
+#               Measures the frame size and the encode/decode throughput for a hello frame, a ledger infos frame
+#               and a ledger block frame carrying blocks of different sizes
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.p2p.gossip_frame import GossipFrame, PeerIdentity
+from blockchain.p2p.wire_format import encode_frame, decode_frame_payload, FRAME_HEADER
+from blockchain.crypto_tools import generateKeys, publicKey2Text, sign, hash
+import argparse
+import pickle
+import time
+import timeit
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-t', "--transactions", default=[1, 100, 1000], type=int, nargs="+", help="block sizes (in transactions) to test")
+parser.add_argument('-d', "--duration", default=0.5, type=float, help="minimum duration of each measure in seconds")
+args = parser.parse_args()
+
+sender_private_key, sender_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+miner_private_key, miner_public_key = generateKeys()
+
+def build_block(n_transactions):
+    outp = Output(receiver_public_key, 100)
+    inp = Input(sender_private_key, sender_public_key, 100, hash(b"previous"), 0, [outp])
+    transaction = Transaction(0, time.time(), [inp], [outp])
+    transaction.sign(miner_private_key)
+    # Distinct objects as they would be after being received, otherwise pickle only stores the shared transaction once
+    transactions = [pickle.loads(pickle.dumps(transaction)) for _ in range(n_transactions)]
+    block = Block(0, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions)
+    block.sign(miner_private_key)
+    return block
+
+def ops_per_second(fn):
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    while elapsed < args.duration:
+        number *= 2
+        elapsed = timer.timeit(number)
+    return number / elapsed
+
+identity = PeerIdentity("Miner0", "127.0.0.1", 44444, publicKey2Text(miner_public_key), sign(miner_private_key, b"hello"))
+frames = [("hello", GossipFrame(0, identity)), ("ledger infos", GossipFrame(2, 1234))]
+frames += [(f"block {n} tx", GossipFrame(4, build_block(n))) for n in args.transactions]
+
+print(f"{'frame':<16}{'pickle B':>12}{'wire B':>12}{'pickle enc/s':>15}{'wire enc/s':>13}{'pickle dec/s':>15}{'wire dec/s':>13}")
+for name, frame in frames:
+    pickled = pickle.dumps(frame)
+    encoded = encode_frame(frame)
+    payload = encoded[FRAME_HEADER.size:]
+    print(
+        f"{name:<16}{len(pickled):>12}{len(encoded):>12}"
+        f"{ops_per_second(lambda: pickle.dumps(frame)):>15.0f}"
+        f"{ops_per_second(lambda: encode_frame(frame)):>13.0f}"
+        f"{ops_per_second(lambda: pickle.loads(pickled)):>15.0f}"
+        f"{ops_per_second(lambda: decode_frame_payload(payload)):>13.0f}"
+    )
@@ -0,0 +1,164 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : A small harness to run benchmark scenarios and save their results as json, so runs can be compared.
+#               Every scenario is run a few times, each run lasting at least a minimum duration, the median run is the result.
+#               Scenarios that measure their own time (network throughput for example) return the elapsed time of one run.
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RESULTS_VERSION = 1
+
+
+class Scenario():
+    def __init__(self, group, name, fn, items=1, unit="op", params=None, timed=False):
+        """A measured operation
+
+        Parameters
+        ----------
+        group   (str)       : the hot path measured (crypto, serialization, storage, replay, gossip)
+        name    (str)       : the name of the scenario
+        fn      (callable)  : the operation (called without arguments)
+        items   (int)       : number of items (transactions, blocks, frames) processed by one call
+        unit    (str)       : the name of the items
+        params  (dict)      : the parameters of the scenario (part of its identity when comparing runs)
+        timed   (bool)      : fn measures itself and returns the elapsed time of one call in seconds
+        """
+        self.group = group
+        self.name = name
+        self.fn = fn
+        self.items = items
+        self.unit = unit
+        self.params = params or {}
+        self.timed = timed
+
+    @property
+    def key(self):
+        params = ",".join(f"{k}={v}" for k, v in sorted(self.params.items()))
+        return f"{self.group}/{self.name}" + (f"[{params}]" if params else "")
+
+
+class BenchmarkSuite():
+    def __init__(self, duration=0.5, repeat=5, warmup=1):
+        """Builds an empty suite
+
+        Parameters
+        ----------
+        duration    (float) : minimum duration in seconds of a run (not used by timed scenarios)
+        repeat      (int)   : number of runs of each scenario
+        warmup      (int)   : number of calls before the runs (caches, lazy imports...)
+        """
+        self.duration = duration
+        self.repeat = repeat
+        self.warmup = warmup
+        self.scenarios = []
+
+    def add(self, group, name, fn, items=1, unit="op", params=None, timed=False):
+        self.scenarios.append(Scenario(group, name, fn, items, unit, params, timed))
+
+    def _run_once(self, scenario):
+        """Returns the time in seconds of one call of the scenario
+        """
+        if scenario.timed:
+            return scenario.fn()
+        fn = scenario.fn
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < self.duration:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+        return elapsed / calls
+
+    def run(self, groups=None):
+        """Runs the scenarios (only those of some groups if given) and returns their results
+        """
+        results = []
+        for scenario in self.scenarios:
+            if groups and scenario.group not in groups:
+                continue
+            for _ in range(self.warmup):
+                scenario.fn()
+            times = sorted(self._run_once(scenario) for _ in range(self.repeat))
+            median = statistics.median(times)
+            result = {
+                "key": scenario.key,
+                "group": scenario.group,
+                "name": scenario.name,
+                "params": scenario.params,
+                "unit": scenario.unit,
+                "items": scenario.items,
+                "median_s": median,
+                "min_s": times[0],
+                "max_s": times[-1],
+                "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+                "ops_per_second": 1 / median if median > 0 else 0.0,
+                "items_per_second": scenario.items / median if median > 0 else 0.0,
+            }
+            print(f"{scenario.key:<60} {result['items_per_second']:>14.1f} {scenario.unit}/s  (median {median*1000:.3f} ms, stdev {result['stdev_s']*1000:.3f} ms)")
+            results.append(result)
+        return results
+
+
+def environment():
+    """Describes the machine and the code measured, to know what two runs compare
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_results(file_name, results, settings):
+    with open(str(file_name), "w") as f:
+        json.dump({"version": RESULTS_VERSION, "environment": environment(), "settings": settings, "results": results}, f, indent=2)
+
+
+def load_results(file_name):
+    with open(str(file_name), "r") as f:
+        data = json.load(f)
+    if data.get("version") != RESULTS_VERSION:
+        raise ValueError(f"{file_name} has results version {data.get('version')}, expected {RESULTS_VERSION}")
+    return data
+
+
+def compare(baseline, results, threshold=0.15):
+    """Compares results to a baseline run
+
+    Parameters
+    ----------
+    baseline    (dict)  : a run loaded with load_results
+    results     (list)  : the results of the current run
+    threshold   (float) : relative slowdown above which a scenario is a regression (0.15 for 15% slower)
+
+    Returns the list of (key, baseline items/s, current items/s, relative change) of the regressions
+    """
+    previous = {result["key"]: result for result in baseline["results"]}
+    regressions = []
+    print(f"\n{'Scenario':<60} {'baseline':>14} {'current':>14} {'change':>8}")
+    for result in results:
+        old = previous.get(result["key"])
+        if old is None or old["items_per_second"] == 0:
+            continue
+        change = result["items_per_second"] / old["items_per_second"] - 1
+        flag = "  REGRESSION" if change < -threshold else ""
+        print(f"{result['key']:<60} {old['items_per_second']:>14.1f} {result['items_per_second']:>14.1f} {change*100:>7.1f}%{flag}")
+        if flag:
+            regressions.append((result["key"], old["items_per_second"], result["items_per_second"], change))
+    return regressions
@@ -0,0 +1,226 @@
+# Benchmark :
+# Author : ParisNeo
+# Description : Runs the benchmark suite of the hot paths and saves the results as json :
+#               - crypto        : sign, verify and hash
+#               - serialization : Transaction.serialize (cold and cached) and Transaction.verify
+#               - storage       : Block.save and Block.load with different block sizes
+#               - replay        : ledger replay (decoding the blocks and applying them to the unspent outputs) and full integrity check
+#               - gossip        : throughput of frames broadcast between GossipNode instances on localhost
+#               Everything runs offline on the local machine. Give a previous result file with --compare to find regressions.
+#
+# Examples :
+#   PYTHONPATH=src python benchmarks/run_benchmarks.py -o baseline.json
+#   PYTHONPATH=src python benchmarks/run_benchmarks.py -o current.json --compare baseline.json
+
+from harness import BenchmarkSuite, save_results, load_results, compare
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.block_chain import BlockChain
+from blockchain.data.signature_cache import verified_signatures
+from blockchain.data.utxo import UTXOSet
+from blockchain.p2p.gossip_net import GossipNode, GossipFrame
+from blockchain.crypto_tools import generateKeys, sign, verify, hash, hash_many, publicKey2Text, shutdown_verification_pool
+from threading import Lock
+from pathlib import Path
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+GROUPS = ["crypto", "serialization", "storage", "replay", "gossip"]
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-o', "--output", default="benchmark_results.json", help="json file to write the results to")
+parser.add_argument('-c', "--compare", default=None, help="json file of a previous run to compare to")
+parser.add_argument("--threshold", default=0.15, type=float, help="relative slowdown reported as a regression when comparing")
+parser.add_argument('-g', "--groups", default=GROUPS, nargs="+", choices=GROUPS, help="groups of scenarios to run")
+parser.add_argument('-d', "--duration", default=0.5, type=float, help="minimum duration of a run in seconds")
+parser.add_argument('-r', "--repeat", default=5, type=int, help="number of runs of each scenario")
+parser.add_argument('-s', "--scheme", default="rsa", help="signature scheme of the keys")
+parser.add_argument("--block-sizes", default=[1, 100, 1000], type=int, nargs="+", help="block sizes (in transactions) of the storage scenarios")
+parser.add_argument("--replay-blocks", default=20, type=int, help="number of blocks of the replayed ledger")
+parser.add_argument("--replay-transactions", default=50, type=int, help="number of transactions per block of the replayed ledger")
+parser.add_argument("--nodes", default=4, type=int, help="number of gossip nodes (one broadcasts to the others)")
+parser.add_argument("--frames", default=2000, type=int, help="number of frames broadcast per gossip run")
+parser.add_argument('-p', "--port", default=47600, type=int, help="first port used by the gossip nodes")
+parser.add_argument("--seed", default=0, type=int, help="seed of the random data")
+args = parser.parse_args()
+
+random.seed(args.seed)
+work_dir = Path(tempfile.mkdtemp())
+suite = BenchmarkSuite(duration=args.duration, repeat=args.repeat)
+
+miner_private_key, miner_public_key = generateKeys(args.scheme)
+sender_private_key, sender_public_key = generateKeys(args.scheme)
+miner_key_text = publicKey2Text(miner_public_key)
+
+def build_transaction(i, inputs=1, outputs=2):
+    transaction_outputs = [Output(miner_public_key, 10 * inputs) for _ in range(outputs)]
+    transaction = Transaction(i, 1700000000.0 + i,
+                              [Input(sender_private_key, sender_public_key, 10 * outputs, hash(bytes(str(i), "utf8")), k, transaction_outputs) for k in range(inputs)],
+                              transaction_outputs)
+    transaction.sign(miner_private_key)
+    return transaction
+
+def build_block(block_id, transactions, prev=hash(b"")):
+    block = Block(block_id, 1700000000.0 + block_id, Transaction(0, 1700000000.0 + block_id, [], [Output(miner_public_key, 60)]), transactions, prev)
+    block.sign(miner_private_key)
+    return block
+
+
+# ================= crypto ======================================
+if "crypto" in args.groups:
+    message = bytes(random.getrandbits(8) for _ in range(256))
+    signature = sign(miner_private_key, message)
+    suite.add("crypto", "sign", lambda: sign(miner_private_key, message), params={"scheme": args.scheme})
+    suite.add("crypto", "verify", lambda: verify(miner_key_text, message, signature), params={"scheme": args.scheme})
+    for size in [64, 4096]:
+        data = bytes(random.getrandbits(8) for _ in range(size))
+        suite.add("crypto", "hash", lambda data=data: hash(data), params={"bytes": size})
+    buffers = [bytes(random.getrandbits(8) for _ in range(64)) for _ in range(1000)]
+    suite.add("crypto", "hash_many", lambda: hash_many(buffers), items=len(buffers), unit="hashes", params={"bytes": 64})
+    # Block check with every signature, then with the input signatures already verified when the transactions were admitted.
+    # Scenarios run after all groups are set up : the block is bound now, later groups reuse the name
+    block = build_block(1, [build_transaction(i) for i in range(50)]).seal()
+    suite.add("crypto", "Block.verify", lambda block=block: block.verify(use_signature_cache=False), params={"transactions": 50, "scheme": args.scheme})
+    for transaction in block.transactions:
+        verified_signatures.add(transaction)
+    suite.add("crypto", "Block.verify signature cache", lambda block=block: block.verify(use_signature_cache=True), params={"transactions": 50, "scheme": args.scheme})
+
+
+# ================= serialization ======================================
+if "serialization" in args.groups:
+    transaction = build_transaction(0, inputs=3, outputs=3)
+
+    def serialize_cold():
+        for part in transaction.inputs + transaction.outputs:
+            part.invalidate()
+        transaction.invalidate()
+        transaction.serialize()
+
+    suite.add("serialization", "Transaction.serialize cold", serialize_cold, params={"inputs": 3})
+    suite.add("serialization", "Transaction.serialize cached", transaction.serialize, params={"inputs": 3})
+    suite.add("serialization", "Transaction.verify", lambda: transaction.verify(miner_key_text), params={"inputs": 3, "scheme": args.scheme})
+
+
+# ================= storage ======================================
+if "storage" in args.groups:
+    transaction = build_transaction(0)
+    for size in args.block_sizes:
+        block = build_block(0, [transaction] * size)
+        block_chain = BlockChain(work_dir/f"storage_{size}")
+
+        def save(block=block, block_chain=block_chain):
+            # The ledger only takes the next block id (the hash covers the id, the decoder refuses a stale one)
+            block.id = len(block_chain)
+            block.hash = hash(block.serialize())
+            block.save(block_chain)
+
+        def load(block_chain=block_chain):
+            Block.__new__(Block).load(block_chain, random.randrange(len(block_chain)))
+
+        suite.add("storage", "Block.save", save, items=size, unit="tx", params={"transactions": size})
+        suite.add("storage", "Block.load", load, items=size, unit="tx", params={"transactions": size})
+
+
+# ================= replay ======================================
+if "replay" in args.groups:
+    # A ledger where every transaction spends an output of the block before
+    replay_dir = work_dir/"replay"
+    n_tx = args.replay_transactions
+    with BlockChain(replay_dir) as block_chain:
+        genesis = Block(0, 1700000000.0, Transaction(0, 1700000000.0, [], [Output(sender_public_key, 10) for _ in range(n_tx)]), [], hash(b""))
+        # The block is signed by the owner of its coinbase
+        genesis.sign(sender_private_key)
+        block_chain.append(genesis)
+        previous = [(genesis.coinbase.hash, k) for k in range(n_tx)]
+        for block_id in range(1, args.replay_blocks):
+            transactions = []
+            for k, (prev_hash, prev_index) in enumerate(previous):
+                outputs = [Output(sender_public_key, 10)]
+                transaction = Transaction(block_id * n_tx + k, 1700000000.0 + block_id, [Input(sender_private_key, sender_public_key, 10, prev_hash, prev_index, outputs)], outputs)
+                transaction.sign(miner_private_key)
+                transactions.append(transaction)
+            block = build_block(block_id, transactions, block_chain.tip_hash)
+            block_chain.append(block)
+            previous = [(transaction.hash, 0) for transaction in transactions]
+
+    def replay():
+        block_chain = BlockChain(replay_dir)
+        utxo = UTXOSet()
+        for block in block_chain.iter_blocks():
+            utxo.apply_block(block)
+        block_chain.close()
+
+    def integrity():
+        with BlockChain(replay_dir) as block_chain:
+            if block_chain.check_integrity(full=True) is not None:
+                raise ValueError("The replayed ledger is corrupted")
+
+    params = {"blocks": args.replay_blocks, "transactions": n_tx}
+    suite.add("replay", "decode and apply", replay, items=args.replay_blocks, unit="blocks", params=params)
+    suite.add("replay", "full integrity check", integrity, items=args.replay_blocks, unit="blocks", params=dict(params, scheme=args.scheme))
+
+
+# ================= gossip ======================================
+class CountingNode(GossipNode):
+    """A gossip node that only counts the frames it receives
+    """
+    def __init__(self, *args, **kwargs):
+        self.received = 0
+        self.received_lock = Lock()
+        super().__init__(*args, **kwargs)
+
+    def process(self, node, data):
+        with self.received_lock:
+            self.received += 1
+
+if "gossip" in args.groups:
+    nodes = []
+    for i in range(args.nodes):
+        known_nodes_file = work_dir/f"nodes{i}.txt"
+        # Every node connects to the first one
+        known_nodes_file.write_text("" if i == 0 else f"127.0.0.1:{args.port}")
+        private_key, public_key = (miner_private_key, miner_public_key) if i == 0 else generateKeys(args.scheme)
+        nodes.append(CountingNode(private_key, public_key, f"Bench{i}", "127.0.0.1", args.port + i, known_nodes_file_name=known_nodes_file))
+    deadline = time.time() + 20
+    while sum(1 for peer in nodes[0].connected_peers if peer.public_key is not None) < args.nodes - 1:
+        if time.time() > deadline:
+            print("Gossip nodes couldn't connect")
+            sys.exit(1)
+        time.sleep(0.05)
+    payload = build_transaction(0)
+
+    def gossip():
+        frames = [GossipFrame(100, payload) for _ in range(args.frames)]
+        expected = [node.received + args.frames for node in nodes[1:]]
+        start = time.perf_counter()
+        for frame in frames:
+            nodes[0].broadcast(frame, fanout=None)
+        deadline = time.time() + 60
+        while any(node.received < count for node, count in zip(nodes[1:], expected)):
+            if time.time() > deadline:
+                raise TimeoutError("Frames lost between the gossip nodes")
+            time.sleep(0.001)
+        return time.perf_counter() - start
+
+    suite.add("gossip", "broadcast throughput", gossip, items=args.frames * (args.nodes - 1), unit="frames", params={"nodes": args.nodes, "frames": args.frames}, timed=True)
+
+
+results = suite.run()
+settings = {name: value for name, value in vars(args).items() if name not in ("output", "compare")}
+save_results(args.output, results, settings)
+print(f"Results saved to {args.output}")
+shutdown_verification_pool()
+shutil.rmtree(work_dir, ignore_errors=True)
+
+if args.compare is not None:
+    regressions = compare(load_results(args.compare), results, args.threshold)
+    if len(regressions) > 0:
+        print(f"{len(regressions)} regression(s) above {args.threshold*100:.0f}%")
+        sys.exit(1)
+    print("No regression")
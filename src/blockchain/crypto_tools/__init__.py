@@ -1,70 +1,291 @@
 """
 """
-from Crypto.PublicKey import RSA
-from Crypto.Hash import SHA256
-from Crypto.Signature import PKCS1_v1_5
 from base58 import b58encode, b58decode
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+import os
+
+from .signature_schemes import SignatureScheme, RSAScheme, Ed25519Scheme, register_scheme, get_scheme, schemes, set_default_scheme, default_scheme, scheme_of_key, scheme_of_text
 
 
 # ================= cryptography helpers ======================================
+# Size in bytes of the hashes
+HASH_SIZE = 32
+
 def hash(data):
     """Hash some data
+    Returns the raw SHA256 digest (32 bytes). Hashes are kept raw everywhere, use hash2Text to show them
     """
-    # Hash the stuff we need to hash
-    digest = SHA256.new()
-    digest.update(data)
-    hash= digest.hexdigest()
-    return hash
+    return sha256(data).digest()
 
-def generateKeys():
-    private_key = RSA.generate(1024)
-    public_key = private_key.public_key()
-    return private_key, public_key
+def hash_many(buffers):
+    """Hash many buffers in one call
+    Parameters
+    ----------
+    buffers (iterable)  : the data to hash (bytes)
 
-def sign(private_key:RSA.RsaKey, message):
+    Returns the list of the raw SHA256 digests of the buffers
+    """
+    return [sha256(data).digest() for data in buffers]
+
+def hash2Text(digest):
+    """Returns the hex text of a hash (to show it or to write it in a text file)
+    """
+    return digest.hex() if digest is not None else None
+
+def text2Hash(value):
+    """Returns the raw digest of a hash given as hex text (hashes that are already raw are returned as they are)
+    """
+    return bytes.fromhex(value) if isinstance(value, str) else value
+
+def generateKeys(scheme=None):
+    """Generates a (private key, public key) pair
+    Parameters
+    ----------
+    scheme      (str)               : the name of the signature scheme ("rsa", "ed25519"), None for the default scheme
+    """
+    scheme = default_scheme() if scheme is None else get_scheme(scheme)
+    return scheme.generate_keys()
+
+def sign(private_key, message):
     """Sign a message
     Parameters
     ----------
-    private_key (RSAPublicKey)   : The private key to sign the message with
-    message     (str)            : The message to be signed
+    private_key (RSAPrivateKey or EccKey)   : The private key to sign the message with
+    message     (bytes)                     : The message to be signed
+
+    Returns the signature, starting with the tag of the scheme of the key
     """
-    hasher = SHA256.new(message)
-    signer = PKCS1_v1_5.new(private_key)
-    signature = signer.sign(hasher)
-    return signature
+    return scheme_of_key(private_key).sign(private_key, message)
 
 def verify(public_key, message, signature):
     """Verify the message signature
     Parameters
     ----------
-    public_key (RSAPublicKey)   : The public key to verify that the sender is the right one 
-    message    (str)            : The signed message (used for verification)
-    signature  (str)            : The signature
+    public_key (key object or str)      : The public key to verify that the sender is the right one (or its text as returned by publicKey2Text)
+    message    (bytes)                  : The signed message (used for verification)
+    signature  (bytes)                  : The signature
+    """
+    if isinstance(public_key, (bytes, str)):
+        # Known keys are already parsed and have their verifier ready
+        _, verifier, scheme = public_key_cache.get(public_key)
+    else:
+        scheme = scheme_of_key(public_key)
+        verifier = scheme.new_verifier(public_key)
+    return scheme.verify(verifier, message, signature)
+
+
+def normalize_signature(public_key, signature):
+    """Returns the tagged form of a signature, the single encoding of a signature used to compare or remember it
+    (RSA signatures built before the tags existed are valid without their tag too)
+    Parameters
+    ----------
+    public_key (str or bytes)           : The text of the public key the signature belongs to
+    signature  (bytes)                  : The signature
+    """
+    try:
+        _, verifier, scheme = public_key_cache.get(public_key)
+    except (ValueError, TypeError, IndexError):
+        return signature
+    return scheme.normalize(verifier, signature)
+
+
+# ================= batch verification ======================================
+_verification_pool = None
+_verification_pool_workers = None
+
+def _verify_checks(checks):
+    """Verifies a list of (public key text, message, signature) triples, stops at the first failure
+    """
+    for key_text, message, signature in checks:
+        try:
+            if not verify(key_text, message, signature):
+                return False
+        except (ValueError, TypeError, IndexError):
+            return False
+    return True
+
+def get_verification_pool(workers=None):
+    """Returns the process pool used for batch verification (created on first use)
+    """
+    global _verification_pool, _verification_pool_workers
+    workers = workers or os.cpu_count() or 1
+    if _verification_pool is None or _verification_pool_workers != workers:
+        if _verification_pool is not None:
+            _verification_pool.shutdown(wait=False)
+        # Imported on first use, most processes never verify big batches
+        from concurrent.futures import ProcessPoolExecutor
+        import multiprocessing
+        # Nodes run many threads : a forked worker could inherit a lock held by one of them and wait on it forever,
+        # workers are started from a clean process instead (they import the main script, see verify_batch)
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(start_method)
+        _verification_pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        _verification_pool_workers = workers
+    return _verification_pool
+
+def shutdown_verification_pool():
+    """Stops the batch verification worker processes
+    """
+    global _verification_pool
+    if _verification_pool is not None:
+        _verification_pool.shutdown(wait=True)
+        _verification_pool = None
+
+def verify_batch(checks, workers=None, min_parallel=256):
+    """Verify many signatures at once, spreading them over a pool of worker processes
+    Parameters
+    ----------
+    checks          (list)  : a list of (public_key, message, signature) triples. Public keys can be key objects or texts (publicKey2Text)
+    workers         (int)   : the number of worker processes (None for one per cpu)
+    min_parallel    (int)   : under this number of checks, everything is verified in the calling thread (cheaper than using the pool)
+
+    The worker processes import the main script of the program : its code must be under if __name__ == "__main__"
+    Returns True if all signatures are valid. Stops and returns False as soon as one signature is invalid
     """
-    hasher = SHA256.new(message)
-    verifier = PKCS1_v1_5.new(public_key)
-    return verifier.verify(hasher, signature)
+    # Keys are sent to the workers as texts as key objects can't be pickled
+    key_texts = {}
+    normalized = []
+    for public_key, message, signature in checks:
+        if not isinstance(public_key, (bytes, str)):
+            key_text = key_texts.get(id(public_key))
+            if key_text is None:
+                key_text = key_texts[id(public_key)] = publicKey2Text(public_key)
+            public_key = key_text
+        normalized.append((public_key, message, signature))
+
+    workers = workers or os.cpu_count() or 1
+    if len(normalized) < min_parallel or workers < 2:
+        return _verify_checks(normalized)
+
+    from concurrent.futures import wait, FIRST_COMPLETED
+    pool = get_verification_pool(workers)
+    # A few chunks per worker so that a failure found early stops most of the work
+    chunk_size = max(1, len(normalized) // (workers * 4))
+    pending = {pool.submit(_verify_checks, normalized[i:i+chunk_size]) for i in range(0, len(normalized), chunk_size)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        if not all(future.result() for future in done):
+            for future in pending:
+                future.cancel()
+            return False
+    return True
 
 
 
-def privateKey2Text(key:RSA.RsaKey):
+def privateKey2Text(key):
     """Converts a private key to text
     """
-    return b58encode(key.exportKey('DER'))
+    return scheme_of_key(key).private_key_to_text(key)
 
-def publicKey2Text(key:RSA.RsaKey):
+def publicKey2Text(key):
     """Converts a public key to text
     """
-    return b58encode(key.exportKey('DER'))
+    return intern_key(scheme_of_key(key).public_key_to_text(key))
+
+
+# ================= interned keys ======================================
+# One shared copy of every public key text, so that the inputs and outputs of the same owner don't each hold their own copy.
+# Keys received from peers are interned before their transactions are checked, so only the most recently used ones are kept
+# (objects still holding a forgotten key keep their copy, the next decoded one gets a new shared copy)
+INTERNED_KEYS_MAX_SIZE = 65536
+_interned_keys = OrderedDict()
+_interned_keys_lock = Lock()
+
+def intern_key(key_text):
+    """Returns the shared copy of a public key text (the text itself if it is not interned yet)
+    """
+    if key_text is None:
+        return None
+    with _interned_keys_lock:
+        shared = _interned_keys.get(key_text)
+        if shared is not None:
+            _interned_keys.move_to_end(key_text)
+            return shared
+        _interned_keys[key_text] = key_text
+        if len(_interned_keys) > INTERNED_KEYS_MAX_SIZE:
+            _interned_keys.popitem(last=False)
+        return key_text
+
+def interned_keys_count():
+    """Returns the number of distinct public keys interned
+    """
+    return len(_interned_keys)
 
 
 def text2PrivateKey(text:str):
     """Convert a text to a private key
     """
-    return RSA.importKey(b58decode(text))
+    return scheme_of_text(text).text_to_private_key(text)
 
 def text2PublicKey(text:str):
     """Convert a text to a key
     """
-    return RSA.importKey(b58decode(text))
+    return public_key_cache.get(text)[0]
+
+
+# ================= public keys cache ======================================
+class KeyCache():
+    def __init__(self, max_size=4096):
+        """A least recently used cache of parsed public keys with their signature verifier and scheme
+
+        Parameters
+        ----------
+        max_size    (int)   : the maximum number of keys kept in the cache
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    def get(self, text):
+        """Returns the (key, verifier, scheme) triple of a public key text, parsing it only if it is not in the cache
+        """
+        text = text.encode("utf8") if isinstance(text, str) else bytes(text)
+        with self.lock:
+            entry = self.entries.get(text)
+            if entry is not None:
+                self.entries.move_to_end(text)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        # Parse outside of the lock, other threads can keep using the cache meanwhile
+        scheme = scheme_of_text(text)
+        key = scheme.text_to_public_key(text)
+        entry = (key, scheme.new_verifier(key), scheme)
+        with self.lock:
+            self.entries[text] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        """Returns the cache counters
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "hit_rate":self.hits/total if total>0 else 0,
+                "size":len(self.entries),
+                "max_size":self.max_size
+            }
+
+    def clear(self):
+        """Empties the cache and resets the counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+public_key_cache = KeyCache()
+
+def key_cache_stats():
+    """Returns the hits/misses counters of the public keys cache
+    """
+    return public_key_cache.stats()
 
@@ -0,0 +1,227 @@
+"""
+File   : signature_schemes.py
+Author : ParisNeo
+Description :
+    The signature schemes that can be used to sign transactions, blocks and peer identities.
+    A network uses one scheme (RSA by default), chosen when it is built.
+
+    Every scheme has a tag :
+        - signatures start with the one byte tag of their scheme
+        - key texts start with the text prefix of their scheme. RSA keys have no prefix,
+          so the keys of the ledgers built before the other schemes existed are still RSA keys
+    RSA signatures without tag (built before the tags existed) are still accepted, so the ledgers holding them stay valid.
+    The same RSA signature is then valid with and without its tag : normalize gives the tagged form, the only one
+    accepted for new transactions and the one used to compare or remember signatures.
+"""
+from Crypto.PublicKey import RSA, ECC
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5, eddsa
+from base58 import b58encode, b58decode
+
+
+class SignatureScheme():
+    """Base class of the signature schemes
+    """
+    name = None
+    # First byte of the signatures
+    tag = None
+    # Start of the key texts
+    key_prefix = b""
+
+    def generate_keys(self):
+        """Returns a new (private key, public key) pair
+        """
+        raise NotImplementedError()
+
+    def owns_key(self, key):
+        """Returns True if a key object belongs to this scheme
+        """
+        raise NotImplementedError()
+
+    def public_key_to_text(self, key):
+        return self.key_prefix + b58encode(self._export_public_key(key))
+
+    def private_key_to_text(self, key):
+        return self.key_prefix + b58encode(self._export_private_key(key))
+
+    def text_to_public_key(self, text):
+        return self._import_public_key(b58decode(text[len(self.key_prefix):]))
+
+    def text_to_private_key(self, text):
+        return self._import_private_key(b58decode(text[len(self.key_prefix):]))
+
+    def new_verifier(self, public_key):
+        """Returns the object that checks the signatures of a public key (kept with the key in the keys cache)
+        """
+        raise NotImplementedError()
+
+    def sign(self, private_key, message):
+        """Signs a message, returns the tagged signature
+        """
+        return bytes([self.tag]) + self._sign(private_key, message)
+
+    def verify(self, verifier, message, signature):
+        """Checks a tagged signature with the verifier of a public key
+        """
+        signature = self._untag(verifier, signature)
+        if signature is None:
+            return False
+        return self._verify(verifier, message, signature)
+
+    def normalize(self, verifier, signature):
+        """Returns the tagged form of a signature of this scheme (signatures of other schemes are returned as they are)
+        """
+        untagged = self._untag(verifier, signature)
+        return signature if untagged is None else bytes([self.tag]) + untagged
+
+    def _untag(self, verifier, signature):
+        """Returns the signature without its tag (None if it is not a signature of this scheme)
+        """
+        if len(signature) == 0 or signature[0] != self.tag:
+            return None
+        return signature[1:]
+
+
+class RSAScheme(SignatureScheme):
+    """RSA PKCS#1 v1.5 signatures of the SHA256 digest of the message
+    """
+    name = "rsa"
+    tag = 1
+    key_prefix = b""
+
+    def __init__(self, bits=1024):
+        self.bits = bits
+
+    def generate_keys(self):
+        private_key = RSA.generate(self.bits)
+        return private_key, private_key.public_key()
+
+    def owns_key(self, key):
+        return isinstance(key, RSA.RsaKey)
+
+    def _export_public_key(self, key):
+        return key.exportKey('DER')
+
+    _export_private_key = _export_public_key
+
+    def _import_public_key(self, data):
+        return RSA.importKey(data)
+
+    _import_private_key = _import_public_key
+
+    def new_verifier(self, public_key):
+        return PKCS1_v1_5.new(public_key)
+
+    def _sign(self, private_key, message):
+        return PKCS1_v1_5.new(private_key).sign(SHA256.new(message))
+
+    def _untag(self, verifier, signature):
+        # An untagged signature has exactly the size of the key
+        if len(signature) == verifier._key.size_in_bytes():
+            return signature
+        return super()._untag(verifier, signature)
+
+    def _verify(self, verifier, message, signature):
+        return verifier.verify(SHA256.new(message), signature)
+
+
+class Ed25519Scheme(SignatureScheme):
+    """Ed25519 signatures (RFC 8032) : 32 bytes keys, 64 bytes signatures and much faster signing than RSA
+    """
+    name = "ed25519"
+    tag = 2
+    key_prefix = b"ed25519:"
+
+    def generate_keys(self):
+        private_key = ECC.generate(curve="ed25519")
+        return private_key, private_key.public_key()
+
+    def owns_key(self, key):
+        return isinstance(key, ECC.EccKey) and key.curve == "Ed25519"
+
+    def _export_public_key(self, key):
+        return key.export_key(format="raw")
+
+    def _export_private_key(self, key):
+        return key.seed
+
+    def _import_public_key(self, data):
+        return eddsa.import_public_key(data)
+
+    def _import_private_key(self, data):
+        return eddsa.import_private_key(data)
+
+    def new_verifier(self, public_key):
+        return eddsa.new(public_key, "rfc8032")
+
+    def _sign(self, private_key, message):
+        return eddsa.new(private_key, "rfc8032").sign(message)
+
+    def _verify(self, verifier, message, signature):
+        try:
+            verifier.verify(message, signature)
+            return True
+        except ValueError:
+            return False
+
+
+# ================= schemes registry ======================================
+_schemes = {}
+_default_scheme = None
+
+def register_scheme(scheme):
+    """Makes a scheme available (its name, tag and key prefix must be unique)
+    """
+    for other in _schemes.values():
+        if other.tag == scheme.tag or other.key_prefix == scheme.key_prefix:
+            raise ValueError(f"Scheme {scheme.name} uses the tag or key prefix of scheme {other.name}")
+    _schemes[scheme.name] = scheme
+
+def get_scheme(name):
+    """Returns a registered scheme from its name
+    """
+    try:
+        return _schemes[name]
+    except KeyError:
+        raise ValueError(f"Unknown signature scheme {name} (known schemes : {', '.join(_schemes)})")
+
+def schemes():
+    """Returns the names of the registered schemes
+    """
+    return list(_schemes)
+
+def set_default_scheme(name):
+    """Sets the scheme used to generate new keys when none is given
+    """
+    global _default_scheme
+    _default_scheme = get_scheme(name)
+
+def default_scheme():
+    return _default_scheme
+
+def scheme_of_key(key):
+    """Returns the scheme of a key object
+    """
+    for scheme in _schemes.values():
+        if scheme.owns_key(key):
+            return scheme
+    raise TypeError(f"No signature scheme for keys of type {type(key).__name__}")
+
+def scheme_of_text(text):
+    """Returns the scheme of a key text (from its prefix)
+    """
+    text = text.encode("utf8") if isinstance(text, str) else bytes(text)
+    unprefixed = None
+    for scheme in _schemes.values():
+        if scheme.key_prefix == b"":
+            unprefixed = scheme
+        elif text.startswith(scheme.key_prefix):
+            return scheme
+    if unprefixed is None:
+        raise ValueError("Key text without a known scheme prefix")
+    return unprefixed
+
+
+register_scheme(RSAScheme())
+register_scheme(Ed25519Scheme())
+set_default_scheme("rsa")
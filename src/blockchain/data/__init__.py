@@ -7,3 +7,8 @@ from .register_smart_contract_transaction import RegisterSCT
 from .transaction import Transaction
 from .smart_contract import SmartContract
 from .mempool import MemPool
+from .utxo import UTXOSet
+from .compact_block import CompactBlock
+from .block_reader import BlockReader, LazyBlock
+from .block_cache import BlockCache
+from .signature_cache import SignatureCache, verified_signatures
@@ -10,12 +10,23 @@ import time
 from .transaction import Transaction
 
 
-from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, text2PublicKey, verify
-import pickle
-from pathlib import Path
+from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, text2PublicKey, verify, verify_batch, text2Hash
+from .block_chain import BlockChain
+from .merkle import merkle_root, merkle_proof, verify_merkle_proof
+from .sealed import Sealable
+from .signature_cache import verified_signatures
+from blockchain.metrics import counter, histogram
+
+VERIFY_TIME = histogram("block_verify_seconds", "Time spent checking a block (merkle root, amounts and signatures)")
+VERIFY_RESULTS = counter("block_verify_total", "Blocks checked, by result")
 
-class Block():
-    def __init__(self, id = 0, ts = time.time(), coinbase:Transaction=Transaction(),transactions=[], prevH=hash(b"")):
+class Block(Sealable):
+    __slots__ = ("id", "timestamp", "coinbase", "transactions", "prevH", "merkle_root", "hash", "signature")
+    # The transactions are only part of the serialized bytes through the merkle root
+    SERIALIZED_FIELDS = frozenset(("id", "coinbase", "prevH", "merkle_root"))
+    HASH_FIELDS = frozenset(("prevH", "merkle_root", "hash"))
+
+    def __init__(self, id = 0, ts = time.time(), coinbase:Transaction=Transaction(),transactions=[], prevH=None):
         """Every block has an ID, a timestamp, a coinbase transaction( that pays the miner), a list of regular transactions, a hash of the block
         and a validation by the signature of the miner
 
@@ -25,21 +36,55 @@ class Block():
         self.timestamp = ts
         self.coinbase = coinbase # This is a special transaction
         self.transactions = transactions
-        self.prevH = prevH
+        # The first block follows the hash of nothing
+        self.prevH = text2Hash(prevH) if prevH is not None else hash(b"")
+        # The header only holds the root of the transactions tree
+        self.merkle_root = self.compute_merkle_root()
 
         data = self.serialize()
         self.hash = hash(data)
-        self.signature = hash(b"")
+        self.signature = b""
 
     def serialize_transactions(self):
         return bytes("\n".join([str(t.serialize()) for t in self.transactions]),"utf8")
 
-    def serialize(self):
+    def compute_merkle_root(self):
+        """Computes the merkle root of the block transactions
+        """
+        return merkle_root([t.serialize() for t in self.transactions])
+
+    def build_proof(self, index):
+        """Builds the proof that the transaction at some index is in this block (see verify_proof)
+        """
+        return merkle_proof([t.serialize() for t in self.transactions], index)
+
+    def verify_proof(self, transaction, proof):
+        """Checks that a transaction is in this block using its proof, without needing the other transactions
+        """
+        return verify_merkle_proof(transaction.serialize(), proof, self.merkle_root)
+
+    def verify_merkle_root(self):
+        """Checks that the merkle root of the header matches the transactions
+        """
+        return self.compute_merkle_root() == self.merkle_root
+
+    def _parts(self):
+        return (self.coinbase,)
+
+    def seal(self):
+        """Caches the bytes of the block and of all its transactions. Returns the block
+        """
+        for transaction in self.transactions:
+            transaction.seal()
+        return super().seal()
+
+    def _serialize(self):
         id_     = bytes(str(self.id),"utf8")
         coinb_  = self.coinbase.serialize()
-        trans_  = self.serialize_transactions()
-        prevH_  = bytes(self.prevH,"utf8")
-        return id_+coinb_+trans_+prevH_
+        # Hashes are signed as hex texts, like when they were kept as texts, so old blocks keep their hash and signature
+        root_   = bytes(self.merkle_root.hex(),"utf8")
+        prevH_  = bytes(self.prevH.hex(),"utf8")
+        return id_+coinb_+root_+prevH_
 
 
     def sign(self, miner_private_key):
@@ -50,36 +95,79 @@ class Block():
         data = self.serialize()
         self.signature = sign(miner_private_key, data)
 
-    def verify(self):
+    def verify(self, use_signature_cache=True):
         """Verify the block signature
+        Parameters
+        ----------
+        use_signature_cache (bool)  : don't verify again the input signatures of the transactions already verified when they were admitted (see SignatureCache)
+        """
+        with VERIFY_TIME.time():
+            # First verify that the header matches the transactions and that they are balanced, then check all signatures in one batch
+            valid = self.verify_merkle_root() and self.verify_amounts() and self.verify_commitments() and verify_batch(self.signature_checks(use_signature_cache))
+        VERIFY_RESULTS.inc(result="valid" if valid else "invalid")
+        return valid
+
+    def verify_amounts(self):
+        """Verifies that every transaction of the block is balanced (no signature check)
         """
-        # First verify that all transactions are correct
+        return all(transaction.verify_amounts() for transaction in self.transactions)
+
+    def verify_coinbase(self, retribution):
+        """Verifies that the coinbase pays the miner no more than the retribution plus the fees of the transactions (no signature check)
+        Parameters
+        ----------
+        retribution (float) : number of coins given to the miner for validating a block
+        """
+        if len(self.coinbase.inputs)>0 or any(output.amount<0 for output in self.coinbase.outputs):
+            return False
+        return sum(output.amount for output in self.coinbase.outputs) <= retribution + sum(transaction.fee for transaction in self.transactions)
+
+    def verify_commitments(self):
+        """Verifies that the inputs of every transaction of the block were signed for its outputs and fee (no signature check)
+        """
+        return all(transaction.verify_commitments() for transaction in self.transactions)
+
+    def signature_checks(self, use_signature_cache=False):
+        """Returns the (public key, message, signature) triples to verify for this block and its transactions (see verify_batch)
+        Parameters
+        ----------
+        use_signature_cache (bool)  : leave out the input signatures of the transactions found in the verified signatures cache
+        """
+        # Transactions are signed by the miner of the block
+        miner_public_key = self.coinbase.outputs[0].public_key
+        checks = []
         for transaction in self.transactions:
-            if not transaction.verify():
-                return False
-        
-        miner_public_key = text2PublicKey(self.coinbase.outputs[0].public_key)
-        data = self.serialize()
-        return verify(miner_public_key, data, self.signature)
+            if use_signature_cache and transaction in verified_signatures:
+                checks.append(transaction.miner_signature_check(miner_public_key))
+            else:
+                checks += transaction.signature_checks(miner_public_key)
+        checks.append((miner_public_key, self.serialize(), self.signature))
+        return checks
 
-    def save(self, block_chain_path):
+    def save(self, block_chain):
         """Save the block
+        Parameters
+        ----------
+        block_chain (BlockChain or Path or str) : the ledger to which the block is appended (or the folder of the ledger)
         """
-        block_chain_path = Path(block_chain_path)
-        with open(str(block_chain_path/f"{self.id}.pkl"),"wb") as f:
-            pickle.dump(self,f)
+        if isinstance(block_chain, BlockChain):
+            block_chain.append(self)
+        else:
+            with BlockChain(block_chain) as block_chain:
+                block_chain.append(self)
 
 
-    def load(self, block_chain_path, block_id):
-        """Save the block
+    def load(self, block_chain, block_id):
+        """Load the block
+        Parameters
+        ----------
+        block_chain (BlockChain or Path or str) : the ledger from which the block is read (or the folder of the ledger)
+        block_id    (int)                       : the id of the block to load
         """
-        block_chain_path = Path(block_chain_path)
-        with open(str(block_chain_path/f"{block_id}.pkl"),"rb") as f:
-            v = pickle.load(f)
-            self.id = v.id
-            self.timestamp = v.timestamp
-            self.coinbase = v.coinbase # This is a special transaction
-            self.transactions = v.transactions
-            self.prevH = v.prevH
-            self.hash = v.hash
-            self.signature = v.signature
+        if isinstance(block_chain, BlockChain):
+            v = block_chain.get_block(block_id)
+        else:
+            with BlockChain(block_chain) as block_chain:
+                v = block_chain.get_block(block_id)
+        for name in Block.__slots__:
+            setattr(self, name, getattr(v, name))
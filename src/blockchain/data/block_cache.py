@@ -0,0 +1,133 @@
+"""
+File   : block_cache.py
+Author : ParisNeo
+Description :
+    Access to the blocks of a ledger by id, as if it was a list, without holding the whole chain in memory.
+    Decoded blocks are kept in a least recently used cache bounded by the size of their encoded data,
+    and the most recent blocks (the ones the node uses the most) are pinned in memory.
+    Cached blocks are shared by all the readers, they must not be changed.
+"""
+from collections import OrderedDict
+from threading import RLock
+
+from blockchain.metrics import counter
+
+CACHE_ACCESSES = counter("block_cache_accesses_total", "Blocks read through the block cache, by result (hit or miss)")
+
+
+class BlockCache():
+    def __init__(self, block_chain, max_size=64*1024*1024, pinned=16):
+        """Builds a cache over the blocks of a ledger
+
+        Parameters
+        ----------
+        block_chain (BlockChain)    : the ledger
+        max_size    (int)           : maximum total size in bytes (encoded) of the cached blocks that are not pinned
+        pinned      (int)           : number of most recent blocks always kept in memory once loaded
+        """
+        self.block_chain = block_chain
+        self.max_size = max_size
+        self.pinned = pinned
+        self.lock = RLock()
+        # id -> (block, encoded size), least recently used first
+        self.entries = OrderedDict()
+        # id -> (block, encoded size) of the most recent blocks
+        self.pinned_entries = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.block_chain)
+
+    def _is_pinned(self, block_id):
+        return block_id >= len(self.block_chain) - self.pinned
+
+    def __getitem__(self, block_id):
+        """Returns a block from its id (negative ids count from the tip, slices return lists)
+        """
+        if isinstance(block_id, slice):
+            return [self[i] for i in range(*block_id.indices(len(self)))]
+        if block_id < 0:
+            block_id += len(self)
+        if block_id < 0 or block_id >= len(self):
+            raise IndexError(f"Block {block_id} is not in the ledger")
+        with self.lock:
+            entry = self.pinned_entries.get(block_id)
+            if entry is None:
+                entry = self.entries.get(block_id)
+                if entry is not None:
+                    self.entries.move_to_end(block_id)
+            if entry is not None:
+                self.hits += 1
+                CACHE_ACCESSES.inc(result="hit")
+                return entry[0]
+            self.misses += 1
+        CACHE_ACCESSES.inc(result="miss")
+        # Read outside of the cache lock (the ledger reads its files under its own lock), other threads can use the cache meanwhile
+        block, size = self.block_chain.read_block(block_id)
+        self._put(block_id, block, size)
+        return block
+
+    def __iter__(self):
+        """Iterates over all the blocks, from the first one. Blocks that are not cached are read in sequence and not cached
+        """
+        block_id = 0
+        for block in self.block_chain.iter_blocks():
+            with self.lock:
+                entry = self.pinned_entries.get(block_id) or self.entries.get(block_id)
+            yield block if entry is None else entry[0]
+            block_id += 1
+
+    def added(self, block, size):
+        """Called by the ledger when a block is appended, the new block is pinned right away
+        """
+        self._put(block.id, block, size)
+
+    def _put(self, block_id, block, size):
+        with self.lock:
+            if block_id in self.pinned_entries or block_id in self.entries:
+                return
+            if self._is_pinned(block_id):
+                self.pinned_entries[block_id] = (block, size)
+                # Blocks that are not among the most recent ones anymore become regular cached blocks
+                for old_id in [i for i in self.pinned_entries if not self._is_pinned(i)]:
+                    self._insert(old_id, *self.pinned_entries.pop(old_id))
+            else:
+                self._insert(block_id, block, size)
+            self._evict()
+
+    def _insert(self, block_id, block, size):
+        self.entries[block_id] = (block, size)
+        self.size += size
+
+    def _evict(self):
+        while self.size > self.max_size and len(self.entries) > 0:
+            _, (_, size) = self.entries.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        """Empties the cache (the counters are kept)
+        """
+        with self.lock:
+            self.entries.clear()
+            self.pinned_entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Returns the cache counters
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "hit_rate":self.hits/total if total>0 else 0,
+                "evictions":self.evictions,
+                "cached_blocks":len(self.entries),
+                "pinned_blocks":len(self.pinned_entries),
+                "size":self.size,
+                "max_size":self.max_size,
+            }
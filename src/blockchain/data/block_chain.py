@@ -2,16 +2,525 @@
 File   : block_chain.py
 Author : ParisNeo
 Description :
-    A chain of blocks stored on disk as pkl files
+    A chain of blocks stored on disk as an append only segmented ledger.
+    Blocks are appended one after the other to big segment files and an offset index
+    gives the position of every block so that reading a block is a single seek and read.
+
+    Layout of the ledger folder :
+        index.dat           : one fixed size entry (segment, offset, length, hash) per block. The entry position is the block id
+        segment_XXXXXX.dat  : the blocks, each one stored as a record header (length, crc32) followed by the block data
+        tip.dat             : the height and hash of the last block that was synced to disk
+        verified.dat        : the height and hash of the last block checked by check_integrity
 """
-import pickle
-import time
-from .block import Block
+import os
+import struct
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from threading import RLock
+
+from blockchain.crypto_tools import hash, verify_batch
+from blockchain.metrics import counter, histogram
+from .block_cache import BlockCache
+
+
+# Record header stored before each block in a segment : data length, crc32 of the data
+RECORD_HEADER = struct.Struct("<II")
+# Index entry : segment number, offset of the record in the segment, data length, block hash
+INDEX_ENTRY = struct.Struct("<IQI32s")
+# Tip pointer : height of the last block, hash of the last block
+TIP = struct.Struct("<q32s")
 
+APPEND_TIME = histogram("ledger_append_seconds", "Time spent encoding and writing a block to the ledger")
+READ_TIME = histogram("ledger_read_seconds", "Time spent reading and decoding a block from the ledger")
+BYTES_WRITTEN = counter("ledger_bytes_written_total", "Bytes of encoded blocks written to the ledger")
 
-from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify
-import pickle
 
 class BlockChain():
-    def __init__(self, path="./ledgers/ledger"):
-        self.curr_block = Block()
\ No newline at end of file
+    def __init__(self, path="./ledgers/ledger", segment_size=64*1024*1024, sync_every=64, max_open_segments=16, cache_size=64*1024*1024, pinned_blocks=16):
+        """Opens (or creates) a segmented ledger
+
+        Parameters
+        ----------
+        path                (str or Path)   : the folder in which the ledger segments and the index are stored
+        segment_size        (int)           : the size in bytes after which a new segment file is started
+        sync_every          (int)           : number of appended blocks between two fsync (0 to only sync on sync()/close())
+        max_open_segments   (int)           : maximum number of segment files kept open for reading
+        cache_size          (int)           : maximum size in bytes (encoded) of the decoded blocks cached by blocks
+        pinned_blocks       (int)           : number of most recent blocks kept in memory by blocks
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.sync_every = sync_every
+        self.max_open_segments = max_open_segments
+
+        self.index_file_name = self.path/"index.dat"
+        self.tip_file_name = self.path/"tip.dat"
+        self.checkpoint_file_name = self.path/"verified.dat"
+        # height -> hash and hash -> height, only loaded the first time a hash lookup is needed
+        self._hashes = None
+        self._heights = None
+        self._readers = OrderedDict()
+        self._unsynced = 0
+        # The ledger is shared between the peers threads
+        self.lock = RLock()
+
+        self._index = open(str(self.index_file_name), "ab")
+        self._index_reader = open(str(self.index_file_name), "rb")
+        self._recover()
+        # Blocks by id (ledger[id]), decoded on demand with a bounded cache
+        self.blocks = BlockCache(self, cache_size, pinned_blocks)
+
+    # ================= Files management ======================================
+    def segment_file_name(self, segment):
+        """Returns the path of a segment file
+        """
+        return self.path/f"segment_{segment:06d}.dat"
+
+    def _recover(self):
+        """Puts the ledger back in a coherent state after a crash.
+        The tip pointer tells how many blocks were synced to disk. The blocks indexed after it are kept as long as their
+        record is whole and holds the indexed block following the previous one, the index entries and segment data
+        beyond the last kept block are dropped (segments after its segment are deleted)
+        """
+        index_size = os.fstat(self._index.fileno()).st_size
+        indexed = index_size // INDEX_ENTRY.size
+        tip = self._read_tip()
+        self._count = indexed if tip is None else min(indexed, tip[0] + 1)
+        synced_count = self._count
+        self._flushed_count = indexed
+        if self._count < indexed:
+            prev_hash = self._read_index_entry(self._count - 1)[3] if self._count > 0 else None
+            while self._count < indexed:
+                segment, offset, length, block_hash = self._read_index_entry(self._count)
+                try:
+                    block = self.decode(self._read_record(self._reader(segment), offset, length))
+                    valid = block.id == self._count and block.hash == block_hash and (prev_hash is None or block.prevH == prev_hash)
+                except Exception:
+                    valid = False
+                if not valid:
+                    break
+                prev_hash = block_hash
+                self._count += 1
+        for f in self._readers.values():
+            f.close()
+        self._readers.clear()
+        self._flushed_count = self._count
+        if index_size != self._count * INDEX_ENTRY.size:
+            self._index.truncate(self._count * INDEX_ENTRY.size)
+
+        if self._count == 0:
+            self._segment = 0
+            self._segment_end = 0
+            self._tip_hash = None
+        else:
+            segment, offset, length, block_hash = self._read_index_entry(self._count - 1)
+            self._segment = segment
+            self._segment_end = offset + RECORD_HEADER.size + length
+            self._tip_hash = block_hash
+
+        # Segments after the one of the tip only hold dropped blocks, new records would be appended after them
+        for segment_file_name in self.path.glob("segment_*.dat"):
+            if int(segment_file_name.stem.split("_")[1]) > self._segment:
+                os.remove(str(segment_file_name))
+        segment_file_name = self.segment_file_name(self._segment)
+        self._writer = open(str(segment_file_name), "ab")
+        if os.fstat(self._writer.fileno()).st_size > self._segment_end:
+            self._writer.truncate(self._segment_end)
+        self._flushed_end = self._segment_end
+        self._synced_count = synced_count
+        if self._synced_count != self._count:
+            # The kept blocks become durable now
+            self.sync()
+
+    def _read_tip(self):
+        """Reads the tip pointer file, returns (height, hash) or None if there is no tip file
+        """
+        if not self.tip_file_name.exists():
+            return None
+        with open(str(self.tip_file_name), "rb") as f:
+            data = f.read()
+        if len(data) != TIP.size:
+            return None
+        return TIP.unpack(data)
+
+    def _write_tip(self):
+        """Atomically replaces the tip pointer file
+        """
+        tmp_file_name = self.tip_file_name.with_suffix(".tmp")
+        with open(str(tmp_file_name), "wb") as f:
+            f.write(TIP.pack(self._count - 1, self._tip_hash or b""))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(str(tmp_file_name), str(self.tip_file_name))
+
+    def _reader(self, segment):
+        """Returns a file to read a segment, keeping only the most recently used ones open
+        """
+        f = self._readers.get(segment)
+        if f is not None:
+            self._readers.move_to_end(segment)
+            return f
+        f = open(str(self.segment_file_name(segment)), "rb")
+        self._readers[segment] = f
+        if len(self._readers) > self.max_open_segments:
+            _, old_f = self._readers.popitem(last=False)
+            old_f.close()
+        return f
+
+    def _read_at(self, f, size, offset):
+        f.seek(offset)
+        return f.read(size)
+
+    def _read_index_entry(self, block_id):
+        return self._read_index_entries(block_id, block_id + 1)[0]
+
+    def _read_index_entries(self, start, stop):
+        if stop > self._flushed_count:
+            self.flush()
+        data = self._read_at(self._index_reader, (stop - start) * INDEX_ENTRY.size, start * INDEX_ENTRY.size)
+        return list(INDEX_ENTRY.iter_unpack(data))
+
+    def _ensure_readable(self, segment, end):
+        """Makes sure data written to the current segment is visible to readers
+        """
+        if segment == self._segment and end > self._flushed_end:
+            self.flush()
+
+    # ================= Chain tip ======================================
+    def __len__(self):
+        return self._count
+
+    @property
+    def height(self):
+        """The id of the last block of the ledger (-1 if the ledger is empty)
+        """
+        return self._count - 1
+
+    @property
+    def tip_hash(self):
+        """The hash of the last block of the ledger (None if the ledger is empty)
+        """
+        return self._tip_hash
+
+    def _load_hashes(self):
+        """Builds the in memory height/hash index from the ledger index
+        """
+        with self.lock:
+            if self._hashes is None:
+                hashes = [entry[3] for entry in self._read_index_entries(0, self._count)] if self._count > 0 else []
+                self._heights = {h:i for i,h in enumerate(hashes)}
+                self._hashes = hashes
+
+    def block_hash(self, block_id):
+        """Returns the hash of a block
+        """
+        if block_id < 0 or block_id >= self._count:
+            raise IndexError(f"Block {block_id} is not in the ledger")
+        if self._hashes is None:
+            self._load_hashes()
+        return self._hashes[block_id]
+
+    def height_of(self, block_hash):
+        """Returns the id of the block having this hash (None if the block is not in the ledger)
+        """
+        if self._heights is None:
+            self._load_hashes()
+        return self._heights.get(block_hash)
+
+    # ================= Writing ======================================
+    def append(self, block):
+        """Appends a block to the ledger and returns its id.
+        The block id must be the next one in the chain
+        """
+        if block.id != self._count:
+            raise ValueError(f"Can't append block {block.id}, the next block in the ledger is {self._count}")
+        with APPEND_TIME.time():
+            data = self.encode(block)
+            block_id = self.append_raw(data, block.hash)
+        self.blocks.added(block, len(data))
+        return block_id
+
+    def append_raw(self, data, block_hash):
+        """Appends an already encoded block to the ledger and returns its id
+        Parameters
+        ----------
+        data        (bytes) : the encoded block
+        block_hash  (bytes) : the hash of the block
+        """
+        with self.lock:
+            if self._segment_end > 0 and self._segment_end + RECORD_HEADER.size + len(data) > self.segment_size:
+                self._new_segment()
+
+            offset = self._segment_end
+            self._writer.write(RECORD_HEADER.pack(len(data), zlib.crc32(data)))
+            self._writer.write(data)
+            # The index is written after the data so that an indexed block is always complete
+            self._index.write(INDEX_ENTRY.pack(self._segment, offset, len(data), block_hash))
+            self._segment_end += RECORD_HEADER.size + len(data)
+            BYTES_WRITTEN.inc(RECORD_HEADER.size + len(data))
+
+            block_id = self._count
+            self._count += 1
+            self._tip_hash = block_hash
+            if self._hashes is not None:
+                self._hashes.append(block_hash)
+                self._heights[block_hash] = block_id
+            self._unsynced += 1
+            if self.sync_every and self._unsynced >= self.sync_every:
+                self.sync()
+            return block_id
+
+    def _new_segment(self):
+        """Closes the current segment and starts a new one
+        """
+        self.sync()
+        self._writer.close()
+        self._segment += 1
+        self._segment_end = 0
+        self._flushed_end = 0
+        # Offsets in the index count from the start of the segment, a new segment always starts empty
+        self._writer = open(str(self.segment_file_name(self._segment)), "wb")
+
+    def flush(self):
+        """Pushes buffered writes to the operating system
+        """
+        with self.lock:
+            self._writer.flush()
+            self._index.flush()
+            self._flushed_end = self._segment_end
+            self._flushed_count = self._count
+
+    def sync(self):
+        """Flushes and fsyncs the ledger so that every appended block survives a crash
+        """
+        with self.lock:
+            self.flush()
+            os.fsync(self._writer.fileno())
+            os.fsync(self._index.fileno())
+            # Only move the tip once the blocks are on disk
+            if self._synced_count != self._count:
+                self._write_tip()
+                self._synced_count = self._count
+            self._unsynced = 0
+
+    def close(self):
+        """Syncs and closes all ledger files
+        """
+        with self.lock:
+            if self._writer.closed:
+                return
+            self.sync()
+            self._writer.close()
+            self._index.close()
+            self._index_reader.close()
+            for f in self._readers.values():
+                f.close()
+            self._readers.clear()
+            self.blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ================= Reading ======================================
+    def read_raw(self, block_id):
+        """Reads the encoded data of a block
+        """
+        if block_id < 0 or block_id >= self._count:
+            raise IndexError(f"Block {block_id} is not in the ledger")
+        with self.lock:
+            segment, offset, length, _ = self._read_index_entry(block_id)
+            self._ensure_readable(segment, offset + RECORD_HEADER.size + length)
+            return self._read_record(self._reader(segment), offset, length)
+
+    def _read_record(self, f, offset, length):
+        record = self._read_at(f, RECORD_HEADER.size + length, offset)
+        size, crc = RECORD_HEADER.unpack_from(record)
+        data = record[RECORD_HEADER.size:]
+        if size != length or zlib.crc32(data) != crc:
+            raise IOError(f"Corrupted ledger record at offset {offset} of {self.path}")
+        return data
+
+    def get_block(self, block_id):
+        """Loads a block from the ledger
+        """
+        return self.read_block(block_id)[0]
+
+    def read_block(self, block_id):
+        """Loads a block from the ledger, returns the block and the size of its encoded data
+        """
+        with READ_TIME.time():
+            data = self.read_raw(block_id)
+            return self.decode(data), len(data)
+
+    def iter_raw(self, start=0, stop=None, chunk_size=4*1024*1024):
+        """Sequentially reads the encoded blocks from start to stop (excluded).
+        Consecutive blocks are read from their segment in big chunks instead of one read per block
+        """
+        stop = self._count if stop is None else min(stop, self._count)
+        # Read the index by batches too
+        batch = max(1, chunk_size // 1024)
+        for batch_start in range(start, stop, batch):
+            with self.lock:
+                entries = self._read_index_entries(batch_start, min(batch_start + batch, stop))
+            i = 0
+            while i < len(entries):
+                # Group the entries that are stored in the same segment and fit in one chunk
+                segment, first_offset, length, _ = entries[i]
+                end = first_offset + RECORD_HEADER.size + length
+                j = i + 1
+                while j < len(entries) and entries[j][0] == segment:
+                    record_end = entries[j][1] + RECORD_HEADER.size + entries[j][2]
+                    if record_end - first_offset > chunk_size:
+                        break
+                    end = record_end
+                    j += 1
+                with self.lock:
+                    self._ensure_readable(segment, end)
+                    chunk = memoryview(self._read_at(self._reader(segment), end - first_offset, first_offset))
+                for _, offset, length, _ in entries[i:j]:
+                    position = offset - first_offset
+                    size, crc = RECORD_HEADER.unpack_from(chunk, position)
+                    data = bytes(chunk[position + RECORD_HEADER.size:position + RECORD_HEADER.size + length])
+                    if size != length or zlib.crc32(data) != crc:
+                        raise IOError(f"Corrupted ledger record at offset {offset} of {self.path}")
+                    yield data
+                i = j
+
+    def iter_blocks(self, start=0, stop=None):
+        """Sequentially loads the blocks from start to stop (excluded)
+        """
+        for data in self.iter_raw(start, stop):
+            yield self.decode(data)
+
+    # ================= Integrity ======================================
+    def verified_height(self):
+        """The id of the last block checked by check_integrity (-1 if nothing was checked yet).
+        The checkpoint is ignored if the ledger doesn't hold the checked block anymore
+        """
+        if not self.checkpoint_file_name.exists():
+            return -1
+        with open(str(self.checkpoint_file_name), "rb") as f:
+            data = f.read()
+        if len(data) != TIP.size:
+            return -1
+        height, block_hash = TIP.unpack(data)
+        with self.lock:
+            if height < 0 or height >= self._count or self._read_index_entry(height)[3] != block_hash:
+                return -1
+        return height
+
+    def _write_checkpoint(self, height, block_hash):
+        """Atomically replaces the verified checkpoint file
+        """
+        tmp_file_name = self.checkpoint_file_name.with_suffix(".tmp")
+        with open(str(tmp_file_name), "wb") as f:
+            f.write(TIP.pack(height, block_hash))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(str(tmp_file_name), str(self.checkpoint_file_name))
+
+    def check_integrity(self, window=256, workers=None, full=False):
+        """Verifies the ledger block by block : every block must link to the previous one, have the hash of its content
+        and of its index entry, the merkle root of its transactions, balanced transactions and valid signatures.
+        Blocks are streamed by windows, the signatures of a window are verified in one batch by a pool of worker processes,
+        and the height of the last verified window is saved so that the next check starts after it.
+
+        Parameters
+        ----------
+        window      (int)   : number of blocks held in memory and verified together
+        workers     (int)   : number of signature verification processes (None for one per cpu)
+        full        (bool)  : if True, ignore the checkpoint and check the whole ledger
+
+        Returns the id of the first bad block, or None if all blocks are valid
+        """
+        start = 0 if full else self.verified_height() + 1
+        with self.lock:
+            stop = self._count
+            prev_hash = hash(b"") if start == 0 else self._read_index_entry(start - 1)[3]
+        records = self.iter_raw(start, stop)
+        blocks = []
+        entries = []
+        for block_id in range(start, stop):
+            if len(entries) == 0:
+                with self.lock:
+                    entries = self._read_index_entries(block_id, min(block_id + window, stop))
+                entries.reverse()
+            index_hash = entries.pop()[3]
+            try:
+                block = self.decode(next(records))
+            except Exception:
+                block = None
+            if block is None or not self._is_consistent(block, block_id, prev_hash, index_hash):
+                # The blocks before it may have bad signatures too
+                bad_block = self._check_signatures(blocks, workers)
+                return block_id if bad_block is None else bad_block
+            prev_hash = block.hash
+            blocks.append(block)
+            if len(blocks) >= window:
+                bad_block = self._check_signatures(blocks, workers)
+                if bad_block is not None:
+                    return bad_block
+                self._write_checkpoint(block_id, block.hash)
+                blocks = []
+        bad_block = self._check_signatures(blocks, workers)
+        if bad_block is not None:
+            return bad_block
+        if len(blocks) > 0:
+            self._write_checkpoint(blocks[-1].id, blocks[-1].hash)
+        return None
+
+    def _is_consistent(self, block, block_id, prev_hash, index_hash):
+        """Checks everything about a block except its signatures
+        """
+        try:
+            return (
+                block.id == block_id and
+                block.prevH == prev_hash and
+                block.hash == index_hash and
+                hash(block.serialize()) == block.hash and
+                block.verify_merkle_root() and
+                block.verify_amounts()
+            )
+        except Exception:
+            return False
+
+    def _check_signatures(self, blocks, workers):
+        """Verifies the signatures of some blocks in one batch, returns the id of the first bad block or None
+        """
+        if len(blocks) == 0:
+            return None
+        try:
+            checks = []
+            for block in blocks:
+                checks += block.signature_checks()
+            if verify_batch(checks, workers):
+                return None
+        except Exception:
+            pass
+        # Something is wrong, find which block it is
+        for block in blocks:
+            try:
+                if not verify_batch(block.signature_checks(), workers):
+                    return block.id
+            except Exception:
+                return block.id
+        return None
+
+    # ================= Encoding ======================================
+    def encode(self, block):
+        """Converts a block to bytes
+        """
+        # Imported here as the codec needs the Block class which needs this module
+        from .codec import encode
+        return encode(block)
+
+    def decode(self, data):
+        """Converts bytes back to a block
+        """
+        from .codec import decode
+        return decode(data)
@@ -0,0 +1,141 @@
+"""
+File   : block_reader.py
+Author : ParisNeo
+Description :
+    A read only access to the blocks of a ledger through memory mapped segment files.
+    The encoded data of a block is returned as a view over the mapped file (no copy), so it can be sent to a peer as is.
+    Blocks can also be returned as lazy blocks : the header is only decoded when one of its fields is read,
+    and the transactions only when they are used.
+"""
+import mmap
+import zlib
+
+from .block_chain import RECORD_HEADER
+from .codec import Decoder, CodecError, TAG_BLOCK, decode
+from blockchain.metrics import histogram
+
+# The header fields are at the beginning of an encoded block, this is more than enough to hold them
+HEADER_READ_SIZE = 1024
+HEADER_FIELDS = ("id", "timestamp", "prevH", "merkle_root", "hash", "signature")
+
+READ_TIME = histogram("block_reader_read_seconds", "Time spent reading and fully decoding a block from the mapped ledger")
+
+
+class BlockReader():
+    def __init__(self, block_chain, check_crc=True):
+        """Builds a reader over the segments of a ledger
+
+        Parameters
+        ----------
+        block_chain (BlockChain)    : the ledger to read
+        check_crc   (bool)          : check the crc of every record read (reads the whole record once)
+        """
+        self.block_chain = block_chain
+        self.check_crc = check_crc
+        # segment -> mmap of the segment file
+        self.maps = {}
+
+    def __len__(self):
+        return len(self.block_chain)
+
+    def _map(self, segment, end):
+        """Returns a map of a segment covering at least end bytes (the segment is mapped again when it grew)
+        """
+        segment_map = self.maps.get(segment)
+        if segment_map is None or len(segment_map) < end:
+            with open(str(self.block_chain.segment_file_name(segment)), "rb") as f:
+                new_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if segment_map is not None:
+                try:
+                    segment_map.close()
+                except BufferError:
+                    pass # Views over it are still used, it is closed once they are released
+            self.maps[segment] = segment_map = new_map
+        return segment_map
+
+    def raw(self, block_id):
+        """Returns the encoded data of a block as a memoryview over the mapped segment (no copy)
+        """
+        block_chain = self.block_chain
+        if block_id < 0 or block_id >= len(block_chain):
+            raise IndexError(f"Block {block_id} is not in the ledger")
+        with block_chain.lock:
+            segment, offset, length, _ = block_chain._read_index_entry(block_id)
+            end = offset + RECORD_HEADER.size + length
+            block_chain._ensure_readable(segment, end)
+            view = memoryview(self._map(segment, end))[offset:end]
+        size, crc = RECORD_HEADER.unpack_from(view)
+        data = view[RECORD_HEADER.size:]
+        if size != length or (self.check_crc and zlib.crc32(data) != crc):
+            raise IOError(f"Corrupted ledger record at offset {offset} of {block_chain.path}")
+        return data
+
+    def get(self, block_id):
+        """Returns a lazy block, decoded only as much as it is used
+        """
+        return LazyBlock(self.raw(block_id))
+
+    def get_block(self, block_id):
+        """Returns a fully decoded block
+        """
+        with READ_TIME.time():
+            return decode(self.raw(block_id))
+
+    def close(self):
+        for segment_map in self.maps.values():
+            try:
+                segment_map.close()
+            except BufferError:
+                pass
+        self.maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LazyBlock():
+    def __init__(self, raw):
+        """Wraps the encoded data of a block. Header fields are decoded the first time one of them is read,
+        anything else (transactions, methods) decodes the whole block
+
+        Parameters
+        ----------
+        raw (bytes or memoryview) : the encoded block
+        """
+        self.raw = raw
+        self._header = None
+        self._block = None
+
+    def _decode_header(self):
+        decoder = Decoder(self.raw[:HEADER_READ_SIZE])
+        try:
+            if decoder.read_tag() != TAG_BLOCK:
+                raise CodecError("Not a block")
+            self._header = {name: decoder.read_value() for name in HEADER_FIELDS}
+        except CodecError:
+            # Unusually big header, decode everything
+            block = self.block
+            self._header = {name: getattr(block, name) for name in HEADER_FIELDS}
+
+    @property
+    def block(self):
+        """The fully decoded block
+        """
+        if self._block is None:
+            self._block = decode(self.raw)
+        return self._block
+
+    def __getattr__(self, name):
+        # Only called for the attributes that are not set in __init__
+        if name in HEADER_FIELDS:
+            if self._block is not None:
+                return getattr(self._block, name)
+            if self._header is None:
+                self._decode_header()
+            return self._header[name]
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.block, name)
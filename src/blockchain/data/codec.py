@@ -0,0 +1,495 @@
+"""
+File   : codec.py
+Author : ParisNeo
+Description :
+    A compact and safe binary encoding for the blockchain data.
+    Every value is written as a one byte tag followed by its content. Integers and lengths use varints,
+    hashes are stored as raw 32 bytes (hex texts written by older versions are still accepted when encoding).
+    Decoding only ever builds the known types listed here (or registered with register_type), it never runs code from the data
+    like unpickling does, so it is safe to use on data received from peers.
+    The hashes of the decoded transactions and blocks are computed again from their content : data whose hash field
+    doesn't match its content is refused.
+    The fields of the decoded objects must have the expected types and values can only be nested MAX_DEPTH levels deep,
+    malformed data always raises CodecError.
+"""
+import struct
+
+from blockchain.crypto_tools import intern_key, hash
+
+from .input import Input
+from .output import Output
+from .transaction import Transaction
+from .block import Block
+
+# Version of the encoding, bump it when the layout of a type changes
+CODEC_VERSION = 5
+
+TAG_NONE        = 0
+TAG_TRUE        = 1
+TAG_FALSE       = 2
+TAG_INT         = 3
+TAG_FLOAT       = 4
+TAG_STR         = 5
+TAG_BYTES       = 6
+TAG_LIST        = 7
+TAG_DICT        = 8
+TAG_HASH        = 9
+TAG_INPUT       = 16
+TAG_OUTPUT      = 17
+TAG_TRANSACTION = 18
+TAG_BLOCK       = 19
+# Transactions paying a fee (the ones without fee keep the encoding they had before the fee existed)
+TAG_FEE_TRANSACTION = 21
+# Inputs signed for the outputs and fee of their transaction (the ones signed before keep their encoding)
+TAG_COMMITTED_INPUT = 22
+
+FLOAT = struct.Struct("<d")
+HEX_DIGITS = set("0123456789abcdef")
+# Maximum number of lists, dictionaries and objects nested in each other
+MAX_DEPTH = 32
+# Types accepted for the fields of the decoded objects (True and False are not numbers here)
+NUMBER = (int, float)
+KEY_TEXT = (bytes, str)
+
+
+class CodecError(ValueError):
+    """Raised when some data can't be encoded or decoded
+    """
+    pass
+
+
+class Encoded():
+    """A value that is already encoded (with its tag), written as is.
+    Used to send blocks read from the ledger without decoding and encoding them again
+    """
+    __slots__ = ["data"]
+
+    def __init__(self, data):
+        self.data = data
+
+
+# ================= Writer ======================================
+class Encoder():
+    def __init__(self):
+        """Builds a buffer to encode values into
+        """
+        self.buffer = bytearray()
+
+    def write_varint(self, value):
+        buffer = self.buffer
+        if value < 0x80:
+            buffer.append(value)
+            return
+        while value > 0x7F:
+            buffer.append((value & 0x7F) | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    def write_int(self, value):
+        # Zigzag so that small negative numbers stay small
+        self.write_varint(value << 1 if value >= 0 else ((-value) << 1) - 1)
+
+    def write_float(self, value):
+        self.buffer += FLOAT.pack(value)
+
+    def write_bytes(self, value):
+        self.write_varint(len(value))
+        self.buffer += value
+
+    def write_str(self, value):
+        self.write_bytes(value.encode("utf8"))
+
+    def write_hash(self, value):
+        """Writes a hash as 32 raw bytes when possible
+        """
+        if type(value) is bytes and len(value) == 32:
+            self.buffer.append(TAG_HASH)
+            self.buffer += value
+        elif type(value) is str and len(value) == 64 and HEX_DIGITS.issuperset(value):
+            self.buffer.append(TAG_HASH)
+            self.buffer += bytes.fromhex(value)
+        else:
+            self.write_value(value)
+
+    def _write_none(self, value):
+        self.buffer.append(TAG_NONE)
+
+    def _write_bool(self, value):
+        self.buffer.append(TAG_TRUE if value else TAG_FALSE)
+
+    def _write_int(self, value):
+        self.buffer.append(TAG_INT)
+        self.write_int(value)
+
+    def _write_float(self, value):
+        self.buffer.append(TAG_FLOAT)
+        self.buffer += FLOAT.pack(value)
+
+    def _write_str(self, value):
+        self.buffer.append(TAG_STR)
+        self.write_bytes(value.encode("utf8"))
+
+    def _write_bytes(self, value):
+        self.buffer.append(TAG_BYTES)
+        self.write_varint(len(value))
+        self.buffer += value
+
+    def _write_encoded(self, value):
+        self.buffer += value.data
+
+    def _write_list(self, value):
+        self.buffer.append(TAG_LIST)
+        self.write_varint(len(value))
+        write_value = self.write_value
+        for v in value:
+            write_value(v)
+
+    def _write_dict(self, value):
+        self.buffer.append(TAG_DICT)
+        self.write_varint(len(value))
+        for k, v in value.items():
+            self.write_value(k)
+            self.write_value(v)
+
+    def write_value(self, value):
+        """Writes any supported value with its tag
+        """
+        writer = _WRITERS.get(type(value))
+        if writer is not None:
+            writer(self, value)
+            return
+        entry = _encoders.get(type(value))
+        if entry is None:
+            raise CodecError(f"Can't encode values of type {type(value).__name__}")
+        tag, encoder = entry
+        if type(tag) is not int:
+            tag = tag(value)
+        self.buffer.append(tag)
+        encoder(self, value)
+
+_WRITERS = {
+    type(None)  : Encoder._write_none,
+    bool        : Encoder._write_bool,
+    int         : Encoder._write_int,
+    float       : Encoder._write_float,
+    str         : Encoder._write_str,
+    bytes       : Encoder._write_bytes,
+    bytearray   : Encoder._write_bytes,
+    list        : Encoder._write_list,
+    tuple       : Encoder._write_list,
+    dict        : Encoder._write_dict,
+    Encoded     : Encoder._write_encoded,
+}
+
+
+# ================= Reader ======================================
+class Decoder():
+    def __init__(self, data, offset=0):
+        """Builds a decoder over some bytes
+        """
+        self.data = bytes(data)
+        self.offset = offset
+        self.depth = 0
+
+    def _take(self, size):
+        start = self.offset
+        end = start + size
+        if end > len(self.data):
+            raise CodecError("Truncated data")
+        self.offset = end
+        return self.data[start:end]
+
+    def read_varint(self):
+        data = self.data
+        offset = self.offset
+        try:
+            b = data[offset]
+        except IndexError:
+            raise CodecError("Truncated data")
+        offset += 1
+        if b < 0x80:
+            self.offset = offset
+            return b
+        result = b & 0x7F
+        shift = 7
+        while True:
+            try:
+                b = data[offset]
+            except IndexError:
+                raise CodecError("Truncated data")
+            offset += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                self.offset = offset
+                return result
+            shift += 7
+            if shift > 70:
+                raise CodecError("Varint too long")
+
+    def read_int(self):
+        value = self.read_varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def read_float(self):
+        return FLOAT.unpack(self._take(FLOAT.size))[0]
+
+    def read_bytes(self):
+        return self._take(self.read_varint())
+
+    def read_str(self):
+        try:
+            return str(self._take(self.read_varint()), "utf8")
+        except UnicodeDecodeError as ex:
+            raise CodecError(f"Bad string : {ex}")
+
+    def read_tag(self):
+        try:
+            tag = self.data[self.offset]
+        except IndexError:
+            raise CodecError("Truncated data")
+        self.offset += 1
+        return tag
+
+    def _read_none(self):
+        return None
+
+    def _read_true(self):
+        return True
+
+    def _read_false(self):
+        return False
+
+    def _read_hash(self):
+        return bytes(self._take(32))
+
+    def _read_list(self):
+        count = self.read_varint()
+        if count > len(self.data) - self.offset:
+            raise CodecError("Truncated data")
+        read_value = self.read_value
+        return [read_value() for _ in range(count)]
+
+    def _read_dict(self):
+        count = self.read_varint()
+        if count > len(self.data) - self.offset:
+            raise CodecError("Truncated data")
+        result = {}
+        for _ in range(count):
+            k = self.read_value()
+            try:
+                result[k] = self.read_value()
+            except TypeError:
+                raise CodecError("Unhashable dictionary key")
+        return result
+
+    def read_value(self):
+        """Reads any supported value
+        """
+        try:
+            tag = self.data[self.offset]
+        except IndexError:
+            raise CodecError("Truncated data")
+        self.offset += 1
+        reader = _READERS.get(tag)
+        if reader is not None and tag not in _NESTING_TAGS:
+            return reader(self)
+        if reader is None:
+            reader = _decoders.get(tag)
+            if reader is None:
+                raise CodecError(f"Unknown tag {tag}")
+        # Values holding other values : a deep nesting would exhaust the stack
+        if self.depth >= MAX_DEPTH:
+            raise CodecError("Data nested too deeply")
+        self.depth += 1
+        try:
+            return reader(self)
+        finally:
+            self.depth -= 1
+
+    def read_list(self, cls):
+        """Reads a list of which all elements must be of the same class
+        """
+        values = self.read_value()
+        if type(values) is not list or not all(isinstance(v, cls) for v in values):
+            raise CodecError(f"Expected a list of {cls.__name__}")
+        return values
+
+    def read_field(self, types, name):
+        """Reads the field of an object, its value must be of one of the given types
+        """
+        value = self.read_value()
+        if type(value) not in types:
+            raise CodecError(f"Bad {name} : {type(value).__name__}")
+        return value
+
+    def read_hash_field(self, name, optional=False):
+        """Reads a hash field written with write_hash (None is accepted if it is optional)
+        """
+        value = self.read_value()
+        if type(value) is bytes and len(value) == 32 or (optional and value is None):
+            return value
+        raise CodecError(f"Bad {name}")
+
+_READERS = {
+    TAG_NONE    : Decoder._read_none,
+    TAG_TRUE    : Decoder._read_true,
+    TAG_FALSE   : Decoder._read_false,
+    TAG_INT     : Decoder.read_int,
+    TAG_FLOAT   : Decoder.read_float,
+    TAG_STR     : Decoder.read_str,
+    TAG_BYTES   : Decoder.read_bytes,
+    TAG_HASH    : Decoder._read_hash,
+    TAG_LIST    : Decoder._read_list,
+    TAG_DICT    : Decoder._read_dict,
+}
+# Tags of the values holding other values
+_NESTING_TAGS = frozenset((TAG_LIST, TAG_DICT))
+
+
+# ================= Types registration ======================================
+_encoders = {}
+_decoders = {}
+# tag -> class it belongs to
+_tag_classes = {}
+
+def register_type(cls, tag, encoder, decoder, variants=None):
+    """Registers a class to the codec
+
+    Parameters
+    ----------
+    cls         (type)      : the class to encode
+    tag         (int)       : the tag that identifies the class in the encoded data (must be unique)
+    encoder     (function)  : encoder(Encoder, obj) writes the object content
+    decoder     (function)  : decoder(Decoder) reads the object content and returns the object
+    variants    (dict)      : other tags of the class : tag -> (test, decoder). Objects for which test(obj) is True are written
+                              with that tag, so a class can get new fields without changing the encoding of the objects that don't use them
+    """
+    variants = variants or {}
+    for used_tag in [tag] + list(variants):
+        if _tag_classes.get(used_tag, cls) is not cls:
+            raise CodecError(f"Tag {used_tag} is already used")
+    for used_tag in [tag] + list(variants):
+        _tag_classes[used_tag] = cls
+    if len(variants) == 0:
+        _encoders[cls] = (tag, encoder)
+    else:
+        tests = [(test, variant_tag) for variant_tag, (test, _) in variants.items()]
+        def select(obj):
+            for test, variant_tag in tests:
+                if test(obj):
+                    return variant_tag
+            return tag
+        _encoders[cls] = (select, encoder)
+    _decoders[tag] = decoder
+    for variant_tag, (_, variant_decoder) in variants.items():
+        _decoders[variant_tag] = variant_decoder
+
+
+def _encode_input(encoder, inp):
+    encoder.write_value(inp.public_key)
+    encoder.write_value(inp.amount)
+    encoder.write_hash(inp.prev_tx_hash)
+    encoder.write_value(inp.prev_index)
+    encoder.write_value(inp.signature)
+    if inp.commitment is not None:
+        encoder.write_hash(inp.commitment)
+
+def _decode_input(decoder, committed=False):
+    inp = Input.__new__(Input)
+    inp.public_key = intern_key(decoder.read_field(KEY_TEXT, "input public key"))
+    inp.amount = decoder.read_field(NUMBER, "input amount")
+    # Inputs saved before they referenced the spent output have no reference
+    inp.prev_tx_hash = decoder.read_hash_field("input previous transaction hash", optional=True)
+    inp.prev_index = decoder.read_field((int, type(None)), "input previous index")
+    inp.signature = decoder.read_field((bytes,), "input signature")
+    inp.commitment = decoder.read_hash_field("input commitment") if committed else None
+    return inp
+
+def _encode_output(encoder, outp):
+    encoder.write_value(outp.public_key)
+    encoder.write_value(outp.amount)
+
+def _decode_output(decoder):
+    outp = Output.__new__(Output)
+    outp.public_key = intern_key(decoder.read_field(KEY_TEXT, "output public key"))
+    outp.amount = decoder.read_field(NUMBER, "output amount")
+    return outp
+
+def _encode_transaction(encoder, transaction):
+    encoder.write_value(transaction.id)
+    encoder.write_value(transaction.timestamp)
+    encoder.write_hash(transaction.hash)
+    encoder.write_value(transaction.signature)
+    encoder.write_value(transaction.inputs)
+    encoder.write_value(transaction.outputs)
+    if transaction.fee:
+        encoder.write_value(transaction.fee)
+
+def _decode_transaction(decoder, with_fee=False):
+    transaction = Transaction.__new__(Transaction)
+    transaction.id = decoder.read_field((int,), "transaction id")
+    transaction.timestamp = decoder.read_field(NUMBER, "transaction timestamp")
+    transaction.hash = decoder.read_hash_field("transaction hash")
+    transaction.signature = decoder.read_field((bytes,), "transaction signature")
+    transaction.inputs = decoder.read_list(Input)
+    transaction.outputs = decoder.read_list(Output)
+    transaction.fee = decoder.read_field(NUMBER, "transaction fee") if with_fee else 0
+    # The hash identifies the transaction everywhere (pending pool, spent outputs), it is never taken from the data
+    if hash(transaction.serialize()) != transaction.hash:
+        raise CodecError("Transaction hash doesn't match its content")
+    return transaction
+
+def _encode_block(encoder, block):
+    # Header fields first so that they can be read without decoding the transactions
+    encoder.write_value(block.id)
+    encoder.write_value(block.timestamp)
+    encoder.write_hash(block.prevH)
+    encoder.write_hash(block.merkle_root)
+    encoder.write_hash(block.hash)
+    encoder.write_value(block.signature)
+    encoder.write_value(block.coinbase)
+    encoder.write_value(block.transactions)
+
+def _decode_block(decoder):
+    block = Block.__new__(Block)
+    block.id = decoder.read_field((int,), "block id")
+    block.timestamp = decoder.read_field(NUMBER, "block timestamp")
+    block.prevH = decoder.read_hash_field("block previous hash")
+    block.merkle_root = decoder.read_hash_field("block merkle root")
+    block.hash = decoder.read_hash_field("block hash")
+    block.signature = decoder.read_field((bytes,), "block signature")
+    block.coinbase = decoder.read_value()
+    if not isinstance(block.coinbase, Transaction):
+        raise CodecError("Expected a coinbase transaction")
+    block.transactions = decoder.read_list(Transaction)
+    # The header hash covers the previous block hash and the merkle root (checked against the transactions by Block.verify)
+    if hash(block.serialize()) != block.hash:
+        raise CodecError("Block hash doesn't match its header")
+    return block
+
+register_type(Input, TAG_INPUT, _encode_input, _decode_input, variants={
+    TAG_COMMITTED_INPUT: (lambda inp: inp.commitment is not None, lambda decoder: _decode_input(decoder, committed=True)),
+})
+register_type(Output, TAG_OUTPUT, _encode_output, _decode_output)
+register_type(Transaction, TAG_TRANSACTION, _encode_transaction, _decode_transaction, variants={
+    TAG_FEE_TRANSACTION: (lambda transaction: transaction.fee, lambda decoder: _decode_transaction(decoder, with_fee=True)),
+})
+register_type(Block, TAG_BLOCK, _encode_block, _decode_block)
+
+
+# ================= Helpers ======================================
+def encode(value):
+    """Encodes a value to bytes
+    """
+    encoder = Encoder()
+    encoder.write_value(value)
+    return bytes(encoder.buffer)
+
+def decode(data):
+    """Decodes a value from bytes (the whole data must be used by the value)
+    """
+    decoder = Decoder(data)
+    value = decoder.read_value()
+    if decoder.offset != len(decoder.data):
+        raise CodecError("Trailing data after value")
+    return value
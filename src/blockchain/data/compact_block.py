@@ -0,0 +1,150 @@
+"""
+File   : compact_block.py
+Author : ParisNeo
+Description :
+    A compact version of a block to relay it to peers that already hold most of its transactions in their pending pool.
+    It holds the block header and coinbase, and a 6 bytes short id per transaction instead of the transaction itself.
+    Short ids are salted with a random value chosen for each compact block, so nobody can build transactions
+    that collide on purpose with the short ids of other transactions.
+    The miner signs every transaction it puts in a block, so the miner signature of each transaction is sent too.
+"""
+import copy
+import os
+from hashlib import sha256
+
+from blockchain.crypto_tools import hash
+
+from .block import Block
+from .codec import register_type, CodecError, NUMBER
+from .transaction import Transaction
+
+SHORT_ID_SIZE = 6
+SALT_SIZE = 8
+TAG_COMPACT_BLOCK = 20
+
+
+def short_id(transaction_hash, salt):
+    """Returns the short id of a transaction hash (bytes)
+    """
+    return sha256(salt + transaction_hash).digest()[:SHORT_ID_SIZE]
+
+
+class CompactBlock():
+    def __init__(self, block=None, salt=None):
+        """Builds the compact version of a block
+
+        Parameters
+        ----------
+        block   (Block) : the block to compact
+        salt    (bytes) : the salt of the short ids (random by default)
+        """
+        if block is None:
+            return
+        self.id = block.id
+        self.timestamp = block.timestamp
+        self.prevH = block.prevH
+        self.merkle_root = block.merkle_root
+        self.hash = block.hash
+        self.signature = block.signature
+        self.coinbase = block.coinbase
+        self.salt = salt if salt is not None else os.urandom(SALT_SIZE)
+        self.short_ids = b"".join(short_id(t.hash, self.salt) for t in block.transactions)
+        self.signatures = [t.signature for t in block.transactions]
+
+    def __len__(self):
+        return len(self.short_ids) // SHORT_ID_SIZE
+
+    def get_short_id(self, index):
+        return self.short_ids[index * SHORT_ID_SIZE:(index + 1) * SHORT_ID_SIZE]
+
+    def reconstruct(self, mempool):
+        """Finds the transactions of the block in a pending pool
+
+        Parameters
+        ----------
+        mempool (MemPool) : the pool of pending transactions
+
+        Returns the list of transactions (None where the transaction is missing) and the list of missing indexes
+        """
+        with mempool.lock:
+            pending = list(mempool.transactions.items())
+        candidates = {}
+        for transaction_hash, transaction in pending:
+            sid = short_id(transaction_hash, self.salt)
+            # Two pending transactions with the same short id can't be told apart, ask for the right one
+            candidates[sid] = transaction if sid not in candidates else None
+        transactions = []
+        missing = []
+        for index in range(len(self)):
+            transaction = candidates.get(self.get_short_id(index))
+            if transaction is None:
+                missing.append(index)
+            else:
+                transaction = copy.copy(transaction)
+                transaction.signature = self.signatures[index]
+            transactions.append(transaction)
+        return transactions, missing
+
+    def fill(self, transactions, missing, received):
+        """Puts the missing transactions received from a peer in the list returned by reconstruct
+        Returns False if they don't match the short ids
+        """
+        if len(received) != len(missing):
+            return False
+        for index, transaction in zip(missing, received):
+            if not isinstance(transaction, Transaction) or short_id(transaction.hash, self.salt) != self.get_short_id(index):
+                return False
+            transaction.signature = self.signatures[index]
+            transactions[index] = transaction
+        return True
+
+    def to_block(self, transactions):
+        """Builds the full block from its transactions (see reconstruct and fill)
+        """
+        block = Block.__new__(Block)
+        block.id = self.id
+        block.timestamp = self.timestamp
+        block.prevH = self.prevH
+        block.merkle_root = self.merkle_root
+        block.hash = self.hash
+        block.signature = self.signature
+        block.coinbase = self.coinbase
+        block.transactions = transactions
+        return block
+
+
+# ================= Types registration ======================================
+def _encode_compact_block(encoder, compact_block):
+    encoder.write_value(compact_block.id)
+    encoder.write_value(compact_block.timestamp)
+    encoder.write_hash(compact_block.prevH)
+    encoder.write_hash(compact_block.merkle_root)
+    encoder.write_hash(compact_block.hash)
+    encoder.write_value(compact_block.signature)
+    encoder.write_value(compact_block.coinbase)
+    encoder.write_bytes(compact_block.salt)
+    encoder.write_bytes(compact_block.short_ids)
+    encoder.write_value(compact_block.signatures)
+
+def _decode_compact_block(decoder):
+    compact_block = CompactBlock()
+    compact_block.id = decoder.read_field((int,), "block id")
+    compact_block.timestamp = decoder.read_field(NUMBER, "block timestamp")
+    compact_block.prevH = decoder.read_hash_field("block previous hash")
+    compact_block.merkle_root = decoder.read_hash_field("block merkle root")
+    compact_block.hash = decoder.read_hash_field("block hash")
+    compact_block.signature = decoder.read_field((bytes,), "block signature")
+    compact_block.coinbase = decoder.read_value()
+    if not isinstance(compact_block.coinbase, Transaction):
+        raise CodecError("Expected a coinbase transaction")
+    compact_block.salt = decoder.read_bytes()
+    compact_block.short_ids = decoder.read_bytes()
+    compact_block.signatures = decoder.read_list(bytes)
+    if len(compact_block.short_ids) % SHORT_ID_SIZE != 0 or len(compact_block.signatures) != len(compact_block):
+        raise CodecError("Bad compact block")
+    # The header bytes don't depend on the transactions
+    if hash(compact_block.to_block([]).serialize()) != compact_block.hash:
+        raise CodecError("Compact block hash doesn't match its header")
+    return compact_block
+
+register_type(CompactBlock, TAG_COMPACT_BLOCK, _encode_compact_block, _decode_compact_block)
@@ -3,29 +3,95 @@ File   : input.py
 Author : ParisNeo
 Description :
     Each transaction has multiple inputs and multiple outputs
-    Inputs must be unspent money 
+    Inputs must be unspent money
+    An input references the output it spends by the hash of its transaction and its index in the transaction outputs
+    The owner signs the input for the outputs and the fee of the transaction spending it (a digest of them is part of the
+    signed bytes), so nobody else can move the input to another transaction
 """
-from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, text2PublicKey, verify, privateKey2Text, publicKey2Text
+from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, text2PublicKey, verify, privateKey2Text, publicKey2Text, intern_key, hash2Text, text2Hash
+from .sealed import Sealable
 
-class Input():
-    def __init__(self, private_key, public_key, amount):
+class Input(Sealable):
+    # No __dict__ per input, there may be millions of them in the pending pool
+    __slots__ = ("public_key", "amount", "prev_tx_hash", "prev_index", "signature", "commitment")
+    # The signature is not part of the signed bytes
+    SERIALIZED_FIELDS = frozenset(("public_key", "amount", "prev_tx_hash", "prev_index", "commitment"))
+
+    def __init__(self, private_key, public_key, amount, prev_tx_hash, prev_index, outputs, fee=0):
         """ Build a signed input
+        Parameters
+        ----------
+        private_key     (RSAPrivateKey) : the private key of the owner of the spent output
+        public_key      (RSAPublicKey)  : the public key of the owner of the spent output
+        amount          (float)         : the amount of the spent output
+        prev_tx_hash    (bytes)         : the hash of the transaction containing the spent output
+        prev_index      (int)           : the index of the spent output in that transaction
+        outputs         (list)          : the outputs of the transaction spending the input
+        fee             (int)           : the fee of the transaction spending the input
         """
         self.public_key = publicKey2Text(public_key)
         self.amount = amount
-        data = bytes(str(self.public_key)+str(amount),"utf8")
+        self.prev_tx_hash = text2Hash(prev_tx_hash)
+        self.prev_index = prev_index
+        self.commitment = spending_digest(outputs, fee)
+        data = self.serialize()
         self.signature = sign(private_key, data)
-    
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in Input.__slots__)
+
+    def __setstate__(self, state):
+        # Inputs saved before the commitment existed have none
+        self.commitment = None
+        for name, value in zip(Input.__slots__, state):
+            setattr(self, name, value)
+        self.public_key = intern_key(self.public_key)
+        # Saved when hashes were hex texts
+        self.prev_tx_hash = text2Hash(self.prev_tx_hash)
+
+    @property
+    def outpoint(self):
+        """The (transaction hash, output index) of the spent output (None for inputs without reference)
+        """
+        if self.prev_tx_hash is None:
+            return None
+        return (self.prev_tx_hash, self.prev_index)
+
     def verify(self):
-        data = bytes(str(self.public_key)+str(self.amount),"utf8")
-        return verify(text2PublicKey(self.public_key), data, self.signature)        
+        data = self.serialize()
+        return verify(self.public_key, data, self.signature)
+
+    def signature_check(self):
+        """Returns the (public key, message, signature) triple to verify this input (see verify_batch)
+        """
+        data = self.serialize()
+        return (self.public_key, data, self.signature)
 
     def __str__(self) -> str:
         return "\n".join([
             f"public key => {self.public_key}",
             f"amount => {self.amount}",
+            f"spends => {hash2Text(self.prev_tx_hash)}:{self.prev_index}",
+            f"signed for => {hash2Text(self.commitment)}",
             f"signature => {b58encode(self.signature)}"
         ])
 
-    def serialize(self):
-        return bytes(str(self.public_key)+str(self.amount),"utf8")
\ No newline at end of file
+    def _serialize(self):
+        if self.prev_tx_hash is None:
+            return bytes(str(self.public_key)+str(self.amount),"utf8")
+        # Hex text in the signed bytes : the layout existing signatures were made with
+        data = bytes(str(self.public_key)+str(self.amount)+self.prev_tx_hash.hex()+":"+str(self.prev_index),"utf8")
+        # Inputs signed before the commitment existed keep their bytes
+        if self.commitment is not None:
+            data += bytes("\nfor:"+self.commitment.hex(),"utf8")
+        return data
+
+
+def spending_digest(outputs, fee=0):
+    """Returns the digest of the outputs and the fee of a transaction, signed by each of its inputs
+    Parameters
+    ----------
+    outputs (list)  : the outputs of the transaction
+    fee     (int)   : the fee of the transaction
+    """
+    return hash(b"\n".join(output.serialize() for output in outputs) + bytes(f"\nfee:{fee}","utf8"))
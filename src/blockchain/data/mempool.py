@@ -3,11 +3,291 @@ File   : mempool.py
 Author : ParisNeo
 Description :
     Here are stored the pending transactions
+    Transactions are indexed by hash (to refuse duplicates) and by the outputs they spend (to refuse conflicting spends).
+    A heap ordered by fee rate (the fee stated by the transaction per byte, then arrival order) gives the transactions
+    to put in the next block, and the pool is bounded in size : when it is full the transactions with the lowest fee rate are evicted.
+    Every change is appended to a journal file so that a crash never loses the pool and a change never rewrites it whole.
+    Journal entries are encoded with the codec, each one after a record header (length, crc32), like the ledger records.
 """
-import pickle
-import time
-from blockchain.data import transaction
+import heapq
+import os
+import struct
+import zlib
+from pathlib import Path
+from threading import RLock
+
+from .codec import Encoded, encode, decode, CodecError
+from blockchain.metrics import counter, histogram
+
+# First bytes of a journal file, older journals (pickled entries) don't start with it
+JOURNAL_MAGIC = b"BCMP\x01"
+# Record header stored before each journal entry : data length, crc32 of the data
+RECORD_HEADER = struct.Struct("<II")
+
+OPERATIONS = counter("mempool_operations_total", "Pending pool operations : added, refused (already pending, conflict or fee too low), removed, evicted")
+ADD_TIME = histogram("mempool_add_seconds", "Time spent adding a transaction to the pending pool")
+
 
 class MemPool():
-    def __init__(self):
-        self.transactions=[]
+    def __init__(self, path=None, max_size=32*1024*1024, compact_every=10000):
+        """Loads (or creates) a pool of pending transactions
+
+        Parameters
+        ----------
+        path            (str or Path)   : the journal file of the pool (None to keep it in memory only)
+        max_size        (int)           : maximum total size in bytes of the pending transactions
+        compact_every   (int)           : number of journal entries after which the journal is rewritten with only the pending transactions
+        """
+        # hash -> transaction
+        self.transactions = {}
+        # hash -> (fee, size, sequence)
+        self.entries = {}
+        # (transaction hash, output index) spent by a pending transaction -> hash of that transaction
+        self.spent = {}
+        # Best transactions first : (-fee rate, sequence, hash). Removed transactions are only skipped when popped
+        self.heap = []
+        # Worst transactions first : (fee rate, -sequence, hash)
+        self.eviction_heap = []
+        self.max_size = max_size
+        self.total_size = 0
+        self.sequence = 0
+        self.lock = RLock()
+
+        self.path = Path(path) if path is not None else None
+        self.compact_every = compact_every
+        self._journal = None
+        self._journal_entries = 0
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    # ================= Queries ======================================
+    def __len__(self):
+        return len(self.transactions)
+
+    def __contains__(self, transaction_hash):
+        return transaction_hash in self.transactions
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.transactions.values()))
+
+    def get(self, transaction_hash):
+        """Returns a pending transaction from its hash (None if it is not in the pool)
+        """
+        return self.transactions.get(transaction_hash)
+
+    def conflicts(self, transaction):
+        """Returns the hashes of the pending transactions spending an output that this transaction spends too
+        """
+        with self.lock:
+            return set(self.spent[input.outpoint] for input in transaction.inputs if input.outpoint is not None and input.outpoint in self.spent)
+
+    def select(self, max_count=None, max_size=None):
+        """Returns the pending transactions to put in a block, highest fee rate first
+
+        Parameters
+        ----------
+        max_count   (int)   : maximum number of transactions (None for no limit)
+        max_size    (int)   : maximum total size in bytes of the transactions (None for no limit)
+        """
+        with self.lock:
+            selected = []
+            taken = []
+            size = 0
+            while len(self.heap) > 0 and (max_count is None or len(selected) < max_count):
+                item = heapq.heappop(self.heap)
+                transaction_hash = item[2]
+                if transaction_hash not in self.entries or self.entries[transaction_hash][2] != item[1]:
+                    continue # Removed, forget it
+                taken.append(item)
+                transaction_size = self.entries[transaction_hash][1]
+                if max_size is not None and size + transaction_size > max_size:
+                    continue # Too big, maybe a smaller one fits
+                size += transaction_size
+                selected.append(self.transactions[transaction_hash])
+            # The selected transactions stay pending until their block is accepted
+            for item in taken:
+                heapq.heappush(self.heap, item)
+            return selected
+
+    # ================= Updates ======================================
+    def add(self, transaction):
+        """Adds a transaction to the pool
+        Returns False if the transaction is already pending, spends an output already spent by a pending transaction,
+        or has a fee rate too low to stay in a full pool
+
+        Parameters
+        ----------
+        transaction (Transaction)   : the transaction to add (its fee field gives the fee paid to the miner)
+        """
+        with ADD_TIME.time():
+            data = encode(transaction)
+            with self.lock:
+                if transaction.hash in self.transactions or len(self.conflicts(transaction)) > 0:
+                    OPERATIONS.inc(operation="refused")
+                    return False
+                self._add(transaction, transaction.fee, len(data))
+                self._write_journal(["add", Encoded(data)])
+                self._evict()
+                added = transaction.hash in self.transactions
+        OPERATIONS.inc(operation="added" if added else "refused")
+        return added
+
+    def remove(self, transaction_hash):
+        """Removes a transaction from the pool (returns the transaction or None if it was not pending)
+        """
+        with self.lock:
+            transaction = self._remove(transaction_hash)
+            if transaction is not None:
+                self._write_journal(["remove", transaction_hash])
+                OPERATIONS.inc(operation="removed")
+            return transaction
+
+    def remove_block(self, block):
+        """Removes the transactions of a new block from the pool, as well as the pending transactions that
+        spend the same outputs (they can never be valid now)
+        """
+        with self.lock:
+            for transaction in block.transactions:
+                self.remove(transaction.hash)
+                for transaction_hash in self.conflicts(transaction):
+                    self.remove(transaction_hash)
+
+    def clear(self):
+        """Removes all the pending transactions
+        """
+        with self.lock:
+            self._reset()
+            if self._journal is not None:
+                self.compact()
+
+    def _reset(self):
+        self.transactions = {}
+        self.entries = {}
+        self.spent = {}
+        self.heap = []
+        self.eviction_heap = []
+        self.total_size = 0
+
+    def _add(self, transaction, fee, size):
+        self.sequence += 1
+        fee_rate = fee / size
+        self.transactions[transaction.hash] = transaction
+        self.entries[transaction.hash] = (fee, size, self.sequence)
+        for input in transaction.inputs:
+            if input.outpoint is not None:
+                self.spent[input.outpoint] = transaction.hash
+        heapq.heappush(self.heap, (-fee_rate, self.sequence, transaction.hash))
+        heapq.heappush(self.eviction_heap, (fee_rate, -self.sequence, transaction.hash))
+        self.total_size += size
+
+    def _remove(self, transaction_hash):
+        transaction = self.transactions.pop(transaction_hash, None)
+        if transaction is None:
+            return None
+        _, size, _ = self.entries.pop(transaction_hash)
+        for input in transaction.inputs:
+            if input.outpoint is not None and self.spent.get(input.outpoint) == transaction_hash:
+                del self.spent[input.outpoint]
+        self.total_size -= size
+        # Rebuild the heaps once they are mostly made of removed transactions
+        if len(self.heap) > 2 * len(self.transactions) + 64:
+            self.heap = [item for item in self.heap if self._is_live(item[2], item[1])]
+            heapq.heapify(self.heap)
+            self.eviction_heap = [item for item in self.eviction_heap if self._is_live(item[2], -item[1])]
+            heapq.heapify(self.eviction_heap)
+        return transaction
+
+    def _is_live(self, transaction_hash, sequence):
+        entry = self.entries.get(transaction_hash)
+        return entry is not None and entry[2] == sequence
+
+    def _evict(self):
+        while self.total_size > self.max_size and len(self.eviction_heap) > 0:
+            _, sequence, transaction_hash = heapq.heappop(self.eviction_heap)
+            if self._is_live(transaction_hash, -sequence):
+                self.remove(transaction_hash)
+                OPERATIONS.inc(operation="evicted")
+
+    # ================= Persistence ======================================
+    def _load(self):
+        if self.path.exists():
+            with open(str(self.path), "rb") as f:
+                data = f.read()
+            if len(data) > 0 and not data.startswith(JOURNAL_MAGIC):
+                # Pickled entries can run code when loaded, older journals are set aside instead
+                legacy_file_name = self.path.with_name(self.path.name + ".legacy")
+                print(f"[Pending pool] {self.path} is an older journal, moved to {legacy_file_name}")
+                os.replace(str(self.path), str(legacy_file_name))
+                data = b""
+            valid_size = len(JOURNAL_MAGIC) if len(data) > 0 else 0
+            while valid_size + RECORD_HEADER.size <= len(data):
+                length, crc = RECORD_HEADER.unpack_from(data, valid_size)
+                record = data[valid_size + RECORD_HEADER.size:valid_size + RECORD_HEADER.size + length]
+                if len(record) != length or zlib.crc32(record) != crc:
+                    break
+                try:
+                    self._replay(decode(record))
+                except (CodecError, KeyError, IndexError, TypeError, AttributeError):
+                    break
+                self._journal_entries += 1
+                valid_size += RECORD_HEADER.size + length
+            # A crash may leave a half written entry at the end
+            if len(data) != valid_size:
+                os.truncate(str(self.path), valid_size)
+        self._journal = open(str(self.path), "ab")
+        if self._journal.tell() == 0:
+            self._journal.write(JOURNAL_MAGIC)
+            self._journal.flush()
+        self._evict()
+
+    def _replay(self, entry):
+        operation, value = entry
+        if operation == "add":
+            if value.hash not in self.transactions:
+                self._add(value, value.fee, len(encode(value)))
+        else:
+            self._remove(value)
+
+    def _write_journal(self, entry):
+        if self._journal is None:
+            return
+        self._journal.write(_record(entry))
+        self._journal.flush()
+        self._journal_entries += 1
+        if self._journal_entries >= self.compact_every and self._journal_entries > 2 * len(self.transactions):
+            self.compact()
+
+    def compact(self):
+        """Rewrites the journal with only the pending transactions
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            tmp_file_name = self.path.with_name(self.path.name + ".tmp")
+            with open(str(tmp_file_name), "wb") as f:
+                f.write(JOURNAL_MAGIC)
+                for transaction in self.transactions.values():
+                    f.write(_record(["add", transaction]))
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal.close()
+            os.replace(str(tmp_file_name), str(self.path))
+            self._journal = open(str(self.path), "ab")
+            self._journal_entries = len(self.transactions)
+
+    def close(self):
+        """Compacts and closes the journal
+        """
+        if self._journal is not None:
+            self.compact()
+            self._journal.close()
+            self._journal = None
+
+
+def _record(entry):
+    """Encodes a journal entry with its record header
+    """
+    data = encode(entry)
+    return RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data
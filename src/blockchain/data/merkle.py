@@ -0,0 +1,98 @@
+"""
+File   : merkle.py
+Author : ParisNeo
+Description :
+    Merkle tree of the transactions of a block.
+    Leaves and inner nodes are hashed with a different prefix so that a leaf can never be taken for a node.
+    When a level has an odd number of nodes, the last one is promoted to the next level as is.
+    An inclusion proof is the list of the sibling hashes from the leaf to the root, it has O(log n) hashes.
+    Roots and proofs are raw 32 bytes digests.
+"""
+from hashlib import sha256
+
+from blockchain.crypto_tools import hash_many
+
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def leaf_hash(data):
+    """Hashes the data of a leaf (raw 32 bytes digest)
+    """
+    return sha256(LEAF_PREFIX + data).digest()
+
+def node_hash(left, right):
+    """Hashes two children nodes (raw 32 bytes digests)
+    """
+    return sha256(NODE_PREFIX + left + right).digest()
+
+
+def leaf_hashes(leaves):
+    """Hashes all the leaves in one call
+    """
+    return hash_many(LEAF_PREFIX + leaf for leaf in leaves)
+
+
+def merkle_root(leaves):
+    """Computes the root of a list of leaves
+
+    Parameters
+    ----------
+    leaves  (list)  : the data of each leaf (bytes)
+
+    Returns the root (the hash of an empty string prefixed as a leaf if there are no leaves)
+    """
+    level = leaf_hashes(leaves)
+    if len(level) == 0:
+        return leaf_hash(b"")
+    while len(level) > 1:
+        next_level = [node_hash(level[i], level[i+1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def merkle_proof(leaves, index):
+    """Builds the inclusion proof of a leaf
+
+    Parameters
+    ----------
+    leaves  (list)  : the data of each leaf (bytes)
+    index   (int)   : the index of the leaf to prove
+
+    Returns a list of (sibling hash, sibling is on the left) pairs from the leaf to the root
+    """
+    if index < 0 or index >= len(leaves):
+        raise IndexError(f"No leaf {index} in a tree of {len(leaves)} leaves")
+    level = leaf_hashes(leaves)
+    proof = []
+    while len(level) > 1:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling], sibling < index))
+        # else the node is promoted, there is no sibling at this level
+        next_level = [node_hash(level[i], level[i+1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2 == 1:
+            next_level.append(level[-1])
+        level = next_level
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """Checks that a leaf is in the tree of a root
+
+    Parameters
+    ----------
+    leaf    (bytes) : the data of the leaf
+    proof   (list)  : the proof built by merkle_proof
+    root    (bytes) : the root of the tree
+    """
+    node = leaf_hash(leaf)
+    try:
+        for sibling, sibling_is_left in proof:
+            node = node_hash(sibling, node) if sibling_is_left else node_hash(node, sibling)
+    except (TypeError, ValueError):
+        return False
+    return node == root
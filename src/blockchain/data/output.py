@@ -6,12 +6,24 @@ Description :
     Inputs must be unspent money 
 """
 
-from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify, privateKey2Text, publicKey2Text
+from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify, privateKey2Text, publicKey2Text, intern_key
+from .sealed import Sealable
+
+class Output(Sealable):
+    # No __dict__ per output, there may be millions of them in the pending pool
+    __slots__ = ("public_key", "amount")
+    SERIALIZED_FIELDS = frozenset(__slots__)
 
-class Output():
     def __init__(self, public_key, amount):
         self.public_key = publicKey2Text(public_key)
         self.amount = amount
+
+    def __getstate__(self):
+        return (self.public_key, self.amount)
+
+    def __setstate__(self, state):
+        self.public_key = intern_key(state[0])
+        self.amount = state[1]
     
     def __str__(self) -> str:
         return "\n".join([
@@ -20,5 +32,5 @@ class Output():
         ])
 
 
-    def serialize(self):
+    def _serialize(self):
         return bytes(str(self.public_key)+str(self.amount),"utf8")
\ No newline at end of file
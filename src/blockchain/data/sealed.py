@@ -0,0 +1,77 @@
+"""
+File   : sealed.py
+Author : ParisNeo
+Description :
+    Caching of the canonical bytes of the data objects (inputs, outputs, transactions and blocks).
+    The bytes of an object are built the first time serialize is called, then reused by hashing, signing,
+    signature checks and merkle trees until the object changes.
+    Setting one of the fields that are serialized drops the cache of the object, and an object whose parts
+    (inputs and outputs of a transaction, coinbase of a block) lost their cache builds its bytes again.
+    Lists are not watched : after changing the content of a list in place, call invalidate on its owner.
+"""
+
+
+class Sealable():
+    # The cache slot is left unset when the object has no valid cache
+    __slots__ = ("_serialized",)
+    # Names of the fields that are part of the serialized bytes (a change drops the cache)
+    SERIALIZED_FIELDS = frozenset()
+    # Names of the fields holding hashes, saved as hex texts by older versions
+    HASH_FIELDS = frozenset()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self.SERIALIZED_FIELDS:
+            self.invalidate()
+
+    def __getstate__(self):
+        # The caches are not saved with the object
+        return {name: getattr(self, name) for name in self.__slots__ if hasattr(self, name) and not name.startswith("_")}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # Saved before the cache existed : (no __dict__, slots)
+            state = state[1]
+        for name, value in state.items():
+            if name in self.HASH_FIELDS and isinstance(value, str):
+                value = bytes.fromhex(value)
+            setattr(self, name, value)
+
+    def _serialize(self):
+        """Builds the canonical bytes of the object (implemented by each class)
+        """
+        raise NotImplementedError()
+
+    def _parts(self):
+        """Returns the sealable objects whose bytes are part of the bytes of this object
+        """
+        return ()
+
+    @property
+    def sealed(self):
+        """True if the canonical bytes of the object are cached and still valid
+        """
+        return hasattr(self, "_serialized") and all(part.sealed for part in self._parts())
+
+    def serialize(self):
+        """Returns the canonical bytes of the object, built only when the cache is missing or outdated
+        """
+        if self.sealed:
+            return self._serialized
+        data = self._serialize()
+        object.__setattr__(self, "_serialized", data)
+        return data
+
+    def seal(self):
+        """Builds and caches the canonical bytes of the object now (and of its parts). Returns the object
+        """
+        self.serialize()
+        return self
+
+    def invalidate(self):
+        """Drops the cached bytes of the object
+        """
+        try:
+            object.__delattr__(self, "_serialized")
+        except AttributeError:
+            pass
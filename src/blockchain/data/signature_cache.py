@@ -0,0 +1,101 @@
+"""
+File   : signature_cache.py
+Author : ParisNeo
+Description :
+    Remembers the transactions whose input signatures were verified (when they were admitted to the pending pool),
+    so that they are not verified again when they come back in a block.
+    Entries are keyed by the hash of the signed bytes of the transaction and a digest of its input signatures :
+    the hash field of a transaction received from a peer is not trusted, and a transaction with the same content but other
+    signatures is verified again. Signatures are normalized first, so an old untagged RSA signature and its tagged form
+    are the same entry. Only the input signatures are remembered, the miner signature of a transaction
+    changes with the block it is put in.
+    The key of a transaction is kept on it, it is only built again when the bytes of the transaction or its input signatures change.
+    The cache is bounded, the least recently used entries are forgotten.
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from blockchain.crypto_tools import hash, normalize_signature
+from blockchain.metrics import counter
+
+CACHE_ACCESSES = counter("signature_cache_accesses_total", "Transactions looked up in the verified signatures cache, by result (hit or miss)")
+
+
+class SignatureCache():
+    def __init__(self, max_size=65536):
+        """Builds an empty cache
+
+        Parameters
+        ----------
+        max_size    (int)   : maximum number of transactions remembered
+        """
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    @staticmethod
+    def key(transaction):
+        """Returns the (hash of the signed bytes, digest of the input signatures) of a transaction
+        """
+        data = transaction.serialize()
+        signatures = [input.signature for input in transaction.inputs]
+        # Still valid while the transaction keeps the same cached bytes and the same signature objects
+        cached = getattr(transaction, "_signature_key", None)
+        if cached is not None and cached[0] is data and len(cached[1]) == len(signatures) and all(a is b for a, b in zip(cached[1], signatures)):
+            return cached[2]
+        key = (hash(data), hash(b"".join(normalize_signature(input.public_key, input.signature) for input in transaction.inputs)))
+        object.__setattr__(transaction, "_signature_key", (data, signatures, key))
+        return key
+
+    def add(self, transaction):
+        """Remembers that the input signatures of a transaction are valid
+        """
+        key = self.key(transaction)
+        with self.lock:
+            self.entries[key] = True
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __contains__(self, transaction):
+        """Tells if the input signatures of a transaction were already verified
+        """
+        key = self.key(transaction)
+        with self.lock:
+            found = key in self.entries
+            if found:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        CACHE_ACCESSES.inc(result="hit" if found else "miss")
+        return found
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Returns the cache counters
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits":self.hits,
+                "misses":self.misses,
+                "hit_rate":self.hits/total if total>0 else 0,
+                "size":len(self.entries),
+                "max_size":self.max_size
+            }
+
+    def clear(self):
+        """Empties the cache and resets the counters
+        """
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+# The cache of the process, filled by the admission of the transactions and used by Block.verify
+verified_signatures = SignatureCache()
@@ -10,7 +10,6 @@ import time
 from base58 import scrub_input
 
 from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify, privateKey2Text, publicKey2Text
-from blockchain.data.smart_contract import SmartContract
 class SmartContract():
     def __init__(self, id = 0, timestamp = time.time()):
         self.id = id
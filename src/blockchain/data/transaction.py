@@ -3,56 +3,99 @@ File   : transaction.py
 Author : ParisNeo
 Description :
     Main class for a many to many coin transfert transaction
+    What the inputs give that the outputs don't is the fee paid to the miner, it is stated in the transaction and signed with it.
     Smart contracts are codes that inherit from this class and should implement the sign and verify 
 """
 import pickle
 import time
 
-from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify, privateKey2Text, publicKey2Text
+from blockchain.crypto_tools import hash, sign, generateKeys, b58encode, b58decode, verify, verify_batch, privateKey2Text, publicKey2Text
+from .sealed import Sealable
+from .input import spending_digest
 
-class Transaction():
-    def __init__(self, id = 0, timestamp = time.time(), inputs=[], outputs=[], signature=bytes([1] * 256)):
+class Transaction(Sealable):
+    # _signature_key : the key of the transaction in the verified signatures cache (see SignatureCache.key), not saved
+    __slots__ = ("id", "timestamp", "inputs", "outputs", "fee", "hash", "signature", "_signature_key")
+    # The hash and the miner signature are computed from the serialized bytes, they are not part of them
+    SERIALIZED_FIELDS = frozenset(("id", "timestamp", "inputs", "outputs", "fee"))
+    HASH_FIELDS = frozenset(("hash",))
+
+    def __init__(self, id = 0, timestamp = time.time(), inputs=[], outputs=[], signature=bytes([1] * 256), fee=0):
         self.id = id
         self.timestamp = timestamp
         self.inputs = inputs
         self.outputs = outputs
+        self.fee = fee
         data = self.serialize()
         self.hash = hash(data)
         self.signature = signature
 
+    def __setstate__(self, state):
+        # Transactions saved before the fee existed pay no fee
+        object.__setattr__(self, "fee", 0)
+        super().__setstate__(state)
+
     def sign(self, private_key):
         data = self.serialize()
         self.signature = sign(private_key, data)
 
     def verify(self, miner_public_key):
-        # First verify that every input in this transaction is valid
+        # First verify that what we have in input and output is the same, and that the inputs were signed for these outputs
+        if not self.verify_amounts() or not self.verify_commitments():
+            return False
+        # Then verify the signatures of every input and the miner signature all at once
+        return verify_batch(self.signature_checks(miner_public_key))
+
+    def verify_amounts(self):
+        """Verifies that the inputs of the transaction give the amount of its outputs plus its fee (no signature check)
+        """
         input_size = 0
         for input in self.inputs:
-            if not input.verify():
-                return False
             input_size += input.amount
-        # Then verify that what we have in input and output is the same
         output_size = 0
         for output in self.outputs:
             output_size += output.amount
-        if input_size!=output_size:
-            return False
-        # Here the transaction is valid, but we need to verify the miner signature        
-        data = bytes(str(self.id) + str(self.timestamp)+ "\n".join([str(i.serialize()) for i in self.inputs])+ "\n".join([str(o.serialize()) for o in self.outputs]), "utf8")
-        return verify(miner_public_key, data, self.signature)
+        return self.fee>=0 and input_size==output_size+self.fee
+
+    def verify_commitments(self, allow_unbound=True):
+        """Verifies that every input was signed for the outputs and the fee of this transaction (no signature check)
+        Parameters
+        ----------
+        allow_unbound   (bool)  : accept the inputs signed before the commitment existed (only found in the ledger)
+        """
+        digest = spending_digest(self.outputs, self.fee)
+        return all(input.commitment == digest or (allow_unbound and input.commitment is None) for input in self.inputs)
+
+    def signature_checks(self, miner_public_key):
+        """Returns the (public key, message, signature) triples to verify for this transaction (see verify_batch)
+        """
+        checks = [input.signature_check() for input in self.inputs]
+        # Here the transaction is valid, but we need to verify the miner signature (of the same bytes as sign)
+        checks.append(self.miner_signature_check(miner_public_key))
+        return checks
+
+    def miner_signature_check(self, miner_public_key):
+        """Returns the (public key, message, signature) triple to verify the miner signature only
+        """
+        return (miner_public_key, self.serialize(), self.signature)
 
     def serialize_inputs(self):
         return bytes("\n".join([str(i.serialize()) for i in self.inputs]),"utf8")
     def serialize_outputs(self):
         return bytes("\n".join([str(o.serialize()) for o in self.outputs]),"utf8")
 
-    def serialize(self):
+    def _parts(self):
+        return self.inputs + self.outputs
+
+    def _serialize(self):
         id_= bytes(str(self.id), "utf8")
         timestamp_  = bytes(str(self.timestamp),"utf8")
         inputs_     = self.serialize_inputs()
         outputs_     = self.serialize_outputs()
+        # Transactions without fee keep the bytes (so the hash and signatures) they had before the fee existed
+        fee_        = bytes(f"\nfee:{self.fee}","utf8") if self.fee else b""
 
-        return id_ + timestamp_ + inputs_ + outputs_
+        return id_ + timestamp_ + inputs_ + outputs_ + fee_
 
     def __str__(self) -> str:
-        return str(self.id)+str(self.timestamp)+str(self.inputs)+str(self.outputs)+str(self.signature)
+        return str(self.id)+str(self.timestamp)+str(self.inputs)+str(self.outputs)+str(self.fee)+str(self.signature)
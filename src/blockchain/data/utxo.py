@@ -0,0 +1,273 @@
+"""
+File   : utxo.py
+Author : ParisNeo
+Description :
+    The set of unspent transaction outputs (UTXO).
+    Every output of every transaction of the ledger is added to the set, and removed once an input spends it.
+    Outputs are indexed by (transaction hash, output index) and by public key, so checking a transaction inputs
+    or the balance of a wallet never needs to go through the ledger.
+
+    The set is updated block by block and keeps the information needed to undo the last blocks (in case of a fork).
+    On disk it is a snapshot file and a journal of the blocks applied/undone since the snapshot.
+    The journal is written at each block while the ledger is only durable up to its last sync : after a crash the set
+    may be ahead of the ledger, and is rolled back to the ledger height (rollback_to) or rebuilt (clear) by its owner.
+"""
+import os
+import pickle
+from collections import deque
+from pathlib import Path
+from threading import RLock
+
+from blockchain.crypto_tools import text2Hash
+
+
+class UTXOSet():
+    def __init__(self, path=None, undo_depth=1000, snapshot_every=1000):
+        """Loads (or creates) an unspent outputs set
+
+        Parameters
+        ----------
+        path            (str or Path)   : the folder where the set is saved (None to keep it in memory only)
+        undo_depth      (int)           : the number of last blocks that can be rolled back
+        snapshot_every  (int)           : number of journal entries after which a new snapshot is written
+        """
+        # (transaction hash, output index) -> (public key, amount)
+        self.outputs = {}
+        # public key -> set of (transaction hash, output index)
+        self.by_key = {}
+        # Undo information of the last blocks : (height, added outpoints, spent (outpoint, output) pairs)
+        self.undo = deque()
+        self.undo_depth = undo_depth
+        # Id of the last applied block
+        self.height = -1
+        self.lock = RLock()
+
+        self.path = Path(path) if path is not None else None
+        self.snapshot_every = snapshot_every
+        self._journal = None
+        self._journal_entries = 0
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    # ================= Queries ======================================
+    def __len__(self):
+        return len(self.outputs)
+
+    def __contains__(self, outpoint):
+        return outpoint in self.outputs
+
+    def get(self, outpoint):
+        """Returns the (public key, amount) of an unspent output (None if it doesn't exist or is spent)
+        """
+        return self.outputs.get(outpoint)
+
+    def unspent(self, public_key):
+        """Returns the list of (outpoint, amount) unspent by a public key
+        """
+        public_key = _key(public_key)
+        with self.lock:
+            return [(outpoint, self.outputs[outpoint][1]) for outpoint in self.by_key.get(public_key, ())]
+
+    def balance(self, public_key):
+        """Returns the amount a public key can spend
+        """
+        return sum(amount for _, amount in self.unspent(public_key))
+
+    def check_inputs(self, inputs, spent=None):
+        """Checks that every input spends an existing unspent output of the same owner and amount,
+        and that no output is spent twice
+
+        Parameters
+        ----------
+        inputs  (list)  : the inputs to check
+        spent   (set)   : outpoints already spent elsewhere (pending transactions for example)
+        """
+        seen = set()
+        with self.lock:
+            for input in inputs:
+                outpoint = input.outpoint
+                if outpoint is None or outpoint in seen or (spent is not None and outpoint in spent):
+                    return False
+                output = self.outputs.get(outpoint)
+                if output is None or output[0] != _key(input.public_key) or output[1] != input.amount:
+                    return False
+                seen.add(outpoint)
+        return True
+
+    # ================= Updates ======================================
+    def apply_block(self, block):
+        """Spends the outputs used by the inputs of the block transactions and adds their outputs
+        Raises a ValueError (and leaves the set unchanged) if the block spends something it can't
+        """
+        with self.lock:
+            if block.id != self.height + 1:
+                raise ValueError(f"Can't apply block {block.id}, the next block is {self.height + 1}")
+            added = []
+            spent = []
+            try:
+                for transaction in [block.coinbase] + list(block.transactions):
+                    for input in transaction.inputs:
+                        if not self.check_inputs([input]):
+                            raise ValueError(f"Transaction {transaction.hash.hex()} spends an unknown or already spent output")
+                        outpoint = input.outpoint
+                        spent.append((outpoint, self._remove(outpoint)))
+                    for index, output in enumerate(transaction.outputs):
+                        # The hash of a decoded transaction was computed from its content by the codec (never taken
+                        # from the data), and the node refuses blocks whose hash doesn't match their header
+                        outpoint = (transaction.hash, index)
+                        if outpoint in self.outputs:
+                            raise ValueError(f"Transaction {transaction.hash.hex()} is already in the set")
+                        self._add(outpoint, (_key(output.public_key), output.amount))
+                        added.append(outpoint)
+            except ValueError:
+                self._revert(added, spent)
+                raise
+            self.height = block.id
+            self._push_undo((block.id, added, spent))
+            self._write_journal(("apply", block.id, [(outpoint, self.outputs[outpoint]) for outpoint in added], [outpoint for outpoint, _ in spent]))
+
+    def rollback_block(self):
+        """Undoes the last applied block
+        """
+        with self.lock:
+            if len(self.undo) == 0:
+                raise ValueError("No block to roll back")
+            height, added, spent = self.undo.pop()
+            self._revert(added, spent)
+            self.height = height - 1
+            self._write_journal(("rollback", height, added, spent))
+
+    def rollback_to(self, height):
+        """Undoes the blocks applied after a height.
+        Returns False and leaves the set unchanged if the undo information doesn't go back that far
+        """
+        with self.lock:
+            if self.height - height > len(self.undo):
+                return False
+            while self.height > height:
+                self.rollback_block()
+            return True
+
+    def clear(self):
+        """Empties the set (to apply the ledger again from its first block)
+        """
+        with self.lock:
+            self.outputs = {}
+            self.by_key = {}
+            self.undo = deque()
+            self.height = -1
+            self.save()
+
+    def _add(self, outpoint, output):
+        self.outputs[outpoint] = output
+        self.by_key.setdefault(output[0], set()).add(outpoint)
+
+    def _remove(self, outpoint):
+        output = self.outputs.pop(outpoint)
+        outpoints = self.by_key[output[0]]
+        outpoints.discard(outpoint)
+        if len(outpoints) == 0:
+            del self.by_key[output[0]]
+        return output
+
+    def _revert(self, added, spent):
+        for outpoint in reversed(added):
+            self._remove(outpoint)
+        for outpoint, output in reversed(spent):
+            self._add(outpoint, output)
+
+    def _push_undo(self, entry):
+        self.undo.append(entry)
+        while len(self.undo) > self.undo_depth:
+            self.undo.popleft()
+
+    # ================= Persistence ======================================
+    def _load(self):
+        snapshot_file_name = self.path/"utxo.pkl"
+        if snapshot_file_name.exists():
+            with open(str(snapshot_file_name), "rb") as f:
+                self.height, outputs, undo = pickle.load(f)
+            for outpoint, output in outputs.items():
+                self._add(_outpoint(outpoint), output)
+            self.undo = deque((height, [_outpoint(o) for o in added], [(_outpoint(o), output) for o, output in spent]) for height, added, spent in undo)
+        # Replay what happened since the snapshot
+        journal_file_name = self.path/"utxo.journal"
+        if journal_file_name.exists():
+            valid_size = 0
+            with open(str(journal_file_name), "rb") as f:
+                while True:
+                    try:
+                        entry = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        break
+                    self._replay(entry)
+                    self._journal_entries += 1
+                    valid_size = f.tell()
+            # A crash may leave a half written entry at the end
+            if journal_file_name.stat().st_size != valid_size:
+                os.truncate(str(journal_file_name), valid_size)
+        self._journal = open(str(journal_file_name), "ab")
+
+    def _replay(self, entry):
+        operation, height, added, spent = entry
+        if operation == "apply":
+            added = [(_outpoint(outpoint), output) for outpoint, output in added]
+            spent = [_outpoint(outpoint) for outpoint in spent]
+            spent_outputs = [(outpoint, self._remove(outpoint)) for outpoint in spent]
+            for outpoint, output in added:
+                self._add(outpoint, output)
+            self.height = height
+            self._push_undo((height, [outpoint for outpoint, _ in added], spent_outputs))
+        else:
+            added = [_outpoint(outpoint) for outpoint in added]
+            spent = [(_outpoint(outpoint), output) for outpoint, output in spent]
+            self._revert(added, spent)
+            self.undo.pop()
+            self.height = height - 1
+
+    def _write_journal(self, entry):
+        if self._journal is None:
+            return
+        pickle.dump(entry, self._journal)
+        self._journal.flush()
+        self._journal_entries += 1
+        if self._journal_entries >= self.snapshot_every:
+            self.save()
+
+    def save(self):
+        """Writes a snapshot of the set and empties the journal
+        """
+        if self.path is None:
+            return
+        with self.lock:
+            snapshot_file_name = self.path/"utxo.pkl"
+            tmp_file_name = self.path/"utxo.tmp"
+            with open(str(tmp_file_name), "wb") as f:
+                pickle.dump((self.height, self.outputs, list(self.undo)), f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(str(tmp_file_name), str(snapshot_file_name))
+            self._journal.close()
+            self._journal = open(str(self.path/"utxo.journal"), "wb")
+            self._journal_entries = 0
+
+    def close(self):
+        """Saves and closes the set
+        """
+        if self._journal is not None:
+            self.save()
+            self._journal.close()
+            self._journal = None
+
+
+def _outpoint(outpoint):
+    """Outpoints saved when hashes were hex texts are read with raw hashes
+    """
+    transaction_hash, index = outpoint
+    return (text2Hash(transaction_hash), index) if isinstance(transaction_hash, str) else outpoint
+
+def _key(public_key):
+    """Public keys texts are indexed as bytes
+    """
+    return public_key.encode("utf8") if isinstance(public_key, str) else public_key
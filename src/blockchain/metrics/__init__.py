@@ -0,0 +1,286 @@
+"""
+File   : __init__.py
+Author : ParisNeo
+Description :
+    Metrics of the node : counters, gauges and histograms kept in a registry and exported in the Prometheus text format
+    (see MetricsServer to serve them over http).
+    Metrics can have labels, given as keyword arguments when they are updated.
+    Spans time a block of code into the span histogram, they are only recorded when spans are enabled
+    (they are meant to profile the handling of each gossip event type).
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+# Latencies in seconds, from 100us to 10s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if len(items) == 0:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric():
+    type = None
+
+    def __init__(self, name, help=""):
+        self.name = name
+        self.help = help
+        self.lock = Lock()
+        # label key -> value
+        self.values = {}
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+    def export(self):
+        """Returns the lines of the metric in the Prometheus text format
+        """
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            values = list(self.values.items())
+        for key, value in sorted(values):
+            lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """A value that only goes up (number of frames received, bytes sent...)
+    """
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(labels), 0)
+
+
+class Gauge(Metric):
+    """A value that goes up and down (peers count, pending transactions...).
+    A gauge can be given a function, called when the metrics are exported
+    """
+    type = "gauge"
+
+    def __init__(self, name, help=""):
+        super().__init__(name, help)
+        # label key -> function returning the value
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function, **labels):
+        """Reads the value from a function when the metrics are exported (None to remove it)
+        """
+        with self.lock:
+            if function is None:
+                self.functions.pop(_label_key(labels), None)
+            else:
+                self.functions[_label_key(labels)] = function
+
+    def get(self, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            function = self.functions.get(key)
+            if function is None:
+                return self.values.get(key, 0)
+        return function()
+
+    def export(self):
+        with self.lock:
+            functions = list(self.functions.items())
+        for key, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue # The object measured is gone or broken, keep the last value
+            with self.lock:
+                self.values[key] = value
+        return super().export()
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.functions.clear()
+
+
+class Histogram(Metric):
+    """Distribution of observed values (latencies, sizes) in cumulative buckets
+    """
+    type = "histogram"
+
+    def __init__(self, name, help="", buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # counts per bucket (the last one is +Inf), sum, count
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the time spent in a with block
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        """Returns the (count, sum) of the observed values
+        """
+        with self.lock:
+            entry = self.values.get(_label_key(labels))
+            return (0, 0.0) if entry is None else (entry[2], entry[1])
+
+    def export(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            values = [(key, (list(entry[0]), entry[1], entry[2])) for key, entry in self.values.items()]
+        for key, (counts, total, count) in sorted(values):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Registry():
+    def __init__(self, prefix="blockchain_"):
+        """Holds the metrics of the process
+
+        Parameters
+        ----------
+        prefix  (str)   : prefix added to the names of the metrics
+        """
+        self.prefix = prefix
+        self.metrics = {}
+        self.lock = Lock()
+        self.spans_enabled = False
+        self.span_histogram = None
+
+    def _get(self, cls, name, help, **kwargs):
+        name = self.prefix + name
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already a {metric.type}")
+            return metric
+
+    def counter(self, name, help=""):
+        """Returns the counter of that name (created on first use)
+        """
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def enable_spans(self, enabled=True):
+        """Starts (or stops) recording the spans
+        """
+        self.span_histogram = self.histogram("span_seconds", "Time spent in the traced operations")
+        self.spans_enabled = enabled
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Times a block of code into the span histogram (does nothing when spans are disabled)
+        """
+        if not self.spans_enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.span_histogram.observe(time.perf_counter() - start, span=name, **labels)
+
+    def export(self):
+        """Returns all the metrics in the Prometheus text format
+        """
+        with self.lock:
+            metrics = sorted(self.metrics.items())
+        lines = []
+        for _, metric in metrics:
+            lines += metric.export()
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Resets the values of all the metrics
+        """
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            metric.clear()
+
+
+# The registry of the process, used by all the modules
+registry = Registry()
+
+def counter(name, help=""):
+    return registry.counter(name, help)
+
+def gauge(name, help=""):
+    return registry.gauge(name, help)
+
+def histogram(name, help="", buckets=DEFAULT_BUCKETS):
+    return registry.histogram(name, help, buckets)
+
+def span(name, **labels):
+    return registry.span(name, **labels)
+
+def enable_spans(enabled=True):
+    registry.enable_spans(enabled)
+
+def export():
+    return registry.export()
+
+
+def __getattr__(name):
+    # The http server is only imported by the nodes that serve their metrics
+    if name == "MetricsServer":
+        from .exporter import MetricsServer
+        return MetricsServer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,59 @@
+"""
+File   : exporter.py
+Author : ParisNeo
+Description :
+    A small http server that serves the metrics in the Prometheus text format on /metrics.
+    It runs in a daemon thread and should only listen on a local address.
+"""
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer():
+    def __init__(self, registry=None, address="127.0.0.1", port=9464):
+        """Builds the server (call start to serve)
+
+        Parameters
+        ----------
+        registry    (Registry)  : the metrics to serve (the registry of the process by default)
+        address     (str)       : the address to listen on
+        port        (int)       : the port to listen on (0 for any free port)
+        """
+        if registry is None:
+            from blockchain.metrics import registry
+        self.registry = registry
+        exported = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exported.export().encode("utf8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # Scraped every few seconds, don't fill the console
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,644 @@
+# Project       : BlockChain
+# Script        : node.py
+# Author        : ParisNeo
+# Description   : The blockchain node : ledger, pending transactions, mining and sync with the gossip network
+
+from pathlib import Path
+from blockchain.crypto_tools import sign, verify, publicKey2Text, hash, get_scheme, scheme_of_text, shutdown_verification_pool
+from blockchain.data.block_chain import BlockChain
+from blockchain.p2p.gossip_net import GossipNode, GossipFrame
+from blockchain.p2p.wire_format import send_frame
+from blockchain.p2p.sync_engine import SyncEngine
+from blockchain.p2p.admission import AdmissionPipeline
+from blockchain.p2p.seen_cache import SeenCache
+from blockchain.metrics import counter, gauge, histogram, span, enable_spans
+from threading import RLock
+from blockchain.data import Block, BlockChain, BlockReader, Transaction, UTXOSet, MemPool, CompactBlock
+from blockchain.data.codec import Encoded
+from blockchain.data.output import Output
+import random
+import pickle
+from datetime import datetime
+import sys, traceback
+
+
+class BCN_GossipEvents_():
+    """List of acceptable events for gossip network
+    """
+    def __init__(self):
+        """List of acceptable events for gossip network
+        """
+        self._GossipEvents={
+            "HELLO":0,
+            "GET_LEDGER_INFOS":1,
+            "LEDGER_INFOS":2,
+            "GET_LEDGER_BLOCK":3,
+            "LEDGER_BLOCK":4,
+            "GET_LEDGER_HEADERS":5,
+            "LEDGER_HEADERS":6,
+            "INV":7,
+            "GET_DATA":8,
+            "TRANSACTION":9,
+            "BLOCK":10,
+            "COMPACT_BLOCK":11,
+            "GET_BLOCK_TXNS":12,
+            "BLOCK_TXNS":13,
+        }
+
+    def __getitem__(self, key):
+        """A function to access the configuration using obj["key"]
+        """
+        return self._GossipEvents[key]
+
+    def __getattr__(self, key):
+        """A function to access the settings directly using obj.key
+        """
+        return self._GossipEvents[key]
+
+    def name_of(self, event_type):
+        """Returns the name of an event type (its number if it is unknown)
+        """
+        for name, value in self._GossipEvents.items():
+            if value==event_type:
+                return name
+        return str(event_type)
+
+BCN_GossipEvents = BCN_GossipEvents_()
+
+# ================= Metrics ======================================
+PROCESS_TIME = histogram("node_process_seconds", "Time spent handling a gossip frame, by event type")
+TRANSACTIONS = counter("node_transactions_total", "Transactions pushed to the node, by result")
+BLOCKS = counter("node_blocks_total", "Blocks received from the network, by result")
+LEDGER_HEIGHT = gauge("node_ledger_height", "Id of the last block of the ledger")
+MEMPOOL_TRANSACTIONS = gauge("node_mempool_transactions", "Number of pending transactions")
+MEMPOOL_BYTES = gauge("node_mempool_bytes", "Size of the pending transactions")
+SYNC_HEIGHT = gauge("node_sync_height", "Last block written by the running sync")
+SYNC_TARGET = gauge("node_sync_target", "Height the running sync goes to")
+SYNC_IN_FLIGHT = gauge("node_sync_in_flight", "Blocks requested to peers and not received yet")
+
+
+class BlockChainNode(GossipNode):
+    """ Main class
+    Manages the local ledger, synchronizes it with the rest of the network, decides who can mine, receives transactions requests 
+    """
+    events = BCN_GossipEvents
+    # Received transactions are decoded by the admission pipeline
+    encoded_frame_types = frozenset((BCN_GossipEvents.TRANSACTION,))
+    
+    def __init__(
+                    self, 
+
+                    miner_private_key,
+                    miner_public_key,
+
+                    server_nick_name="Miner",
+                    server_address="127.0.0.1",
+                    server_port=44444,
+
+                    ntp_server_address = 'europe.pool.ntp.org',
+                    ntp_offset_file_name = None,
+
+                    known_nodes_file_name="nodes.txt",
+                    ledger_dir="./ledgers/ledger", 
+                    pending_transactions_file_name="./pending.journal", 
+                    root_key_store_file="./root_key.rsa",
+                    root_key_pass_phrase="password",
+                    signature_scheme="rsa",
+
+
+                    mining_coinbase_retribution=60,
+                    mining_transaction_fee=0,
+                    mining_cap=-1,
+                    mempool_max_size=32*1024*1024,
+                    block_cache_size=64*1024*1024,
+                    pinned_blocks=16,
+
+                    transport="threads",
+                    send_queue_size=256,
+
+                    sync_window=128,
+                    sync_timeout=10,
+                    broadcast_fanout=8,
+                    connect_timeout=5,
+                    inventory_timeout=30,
+                    admission_queue_size=1024,
+                    admission_batch_size=64,
+
+                    metrics_address="127.0.0.1",
+                    metrics_port=None,
+                    trace_events=False,
+                ):
+
+        """Initialises the blockchain object
+
+        Parameters
+        ----------
+        miner_private_key       (RSAPrivateKey)     : the miner private key object to sign stuff
+        miner_public_key        (RSAPublicKey)      : the miner public key object to validate stuff
+
+        server_nick_name        (str)               : Local server name
+        server_address          (str)               : Local server address of the node
+        server_port             (int)               : Local server port
+
+        ntp_server_address      (str)               : Address of the NTP server to eep time synced over the network
+        ntp_offset_file_name    (str or Path)       : File where the last clock offset is saved, used until the NTP server answers (by default in the ledger folder)
+
+
+        known_nodes_file_name   (str or Path)       : a file containing nodes of the network to which we try to connect for the federated decentralyzed network
+        ledger_dir              (Path or str)       : the path to the ledger folder in which the ledger blocks are stored
+
+        pending_transactions_file_name(Path or str) : A journal file to store the pending transactions in case of loss 
+        root_key_store_file     (Path or str)       : A file to store the root key if this is the first of the first node (when you want to build a new network)
+        root_key_pass_phrase    (Path or str)       : A passphrase to secure the file containing the root key pairs
+        signature_scheme        (str)               : The signature scheme of the network ("rsa" or "ed25519"), the miner keys must use it. Transactions and blocks with keys of another scheme are refused
+        mining_coinbase_retribution      (float)    : Number of coins to give the validator for validating a block
+        mining_transaction_fee  (float)             : Transaction fee to give the validator from the transactions to be validated (in factions, like 0.001 for example) put 0 for no fee transactions
+        mining_cap              (float)             : The maximum amount of coins that could be mined (-1 for unlimited coin generation)
+        mempool_max_size        (int)               : Maximum size in bytes of the pending transactions, the ones with the lowest fees are evicted beyond it
+        block_cache_size        (int)               : Maximum size in bytes (encoded) of the decoded blocks kept in memory, the least recently used ones are dropped beyond it
+        pinned_blocks           (int)               : Number of most recent blocks always kept in memory
+
+        transport               (str)               : "threads" for one thread per peer, "asyncio" for a single event loop handling all the peers
+        send_queue_size         (int)               : (asyncio only) maximum number of frames waiting to be sent to a peer before senders are blocked
+
+        sync_window             (int)               : maximum number of blocks requested ahead while syncing the ledger with the network
+        sync_timeout            (float)             : time in seconds after which a block request is sent to another peer
+        broadcast_fanout        (int)               : number of random peers new transactions and blocks are announced to
+        connect_timeout         (float)             : time in seconds to wait for a known node to accept the connection (all known nodes are connected at the same time)
+        inventory_timeout       (float)             : time in seconds before an announced item that was requested but not received can be requested again
+        admission_queue_size    (int)               : maximum number of received transactions waiting in each stage of the admission pipeline, beyond it new ones are dropped
+        admission_batch_size    (int)               : maximum number of received transactions whose signatures are verified at once
+
+        metrics_address         (str)               : address of the http server exporting the metrics (keep it local)
+        metrics_port            (int)               : port of the http server exporting the metrics in the Prometheus format on /metrics (None for no server)
+        trace_events            (bool)              : record the time spent handling each gossip event type (span metrics)
+        """
+        # Not ready yet to interact with the system until I am synced
+        self.ready = False
+
+        # All keys of the network belong to the same signature scheme
+        self.signature_scheme = get_scheme(signature_scheme)
+        if not self.signature_scheme.owns_key(miner_public_key):
+            raise ValueError(f"The miner keys don't belong to the {signature_scheme} signature scheme of the network")
+
+        # Downloads the blocks we miss from the connected peers
+        self.sync_engine = SyncEngine(self, window=sync_window, timeout=sync_timeout)
+        self.max_headers_per_frame = 2000
+        # Announced items we asked for, not to ask them again to every peer announcing them
+        self.requested_inventory = SeenCache(100000, inventory_timeout)
+        # Blocks are appended by the sync engine, the announces and the local miner
+        self.ledger_lock = RLock()
+        # Compact blocks waiting for the transactions we don't have (block hash -> compact block, transactions, missing indexes)
+        self.pending_compact_blocks = {}
+        
+        self.mining_coinbase_retribution = mining_coinbase_retribution
+        self.mining_transaction_fee = mining_transaction_fee
+        self.mining_cap = mining_cap
+
+        # Save ledger and pending transaction files
+        self.ledger_dir = Path(ledger_dir)
+        self.block_chain = BlockChain(self.ledger_dir, cache_size=block_cache_size, pinned_blocks=pinned_blocks)
+        # The blocks by id, read from the disk when they are not cached (the chain doesn't need to fit in memory)
+        self.ledger = self.block_chain.blocks
+        # Memory mapped read access to the blocks to serve peers and queries
+        self.block_reader = BlockReader(self.block_chain)
+        self.pending_transactions_file_name = Path(pending_transactions_file_name)
+
+        # Unspent outputs, catch up with the blocks added to the ledger since it was last saved
+        self.utxo = UTXOSet(self.ledger_dir/"utxo")
+        # After a crash the ledger is back to its last sync, while the set may hold the blocks written after it
+        if self.utxo.height > self.block_chain.height:
+            print(f"[Ledger] Unspent outputs at block {self.utxo.height} but ledger at block {self.block_chain.height}, rolling them back")
+            if not self.utxo.rollback_to(self.block_chain.height):
+                print(f"[Ledger] Not enough undo information, rebuilding the unspent outputs")
+                self.utxo.clear()
+        for block in self.block_chain.iter_blocks(self.utxo.height+1):
+            self.utxo.apply_block(block)
+
+        # Pending transactions, reloaded from their journal file if it exists
+        self.mempool = MemPool(self.pending_transactions_file_name, mempool_max_size)
+
+        # Transactions received from the network are checked by stages, away from the connections they came from
+        self.admission = AdmissionPipeline(self, queue_size=admission_queue_size, batch_size=admission_batch_size).start()
+
+        # Metrics read when they are exported
+        LEDGER_HEIGHT.set_function(lambda: self.block_chain.height, node=server_nick_name)
+        MEMPOOL_TRANSACTIONS.set_function(lambda: len(self.mempool), node=server_nick_name)
+        MEMPOOL_BYTES.set_function(lambda: self.mempool.total_size, node=server_nick_name)
+        SYNC_HEIGHT.set_function(lambda: self.sync_engine.stats()["height"], node=server_nick_name)
+        SYNC_TARGET.set_function(lambda: self.sync_engine.target, node=server_nick_name)
+        SYNC_IN_FLIGHT.set_function(lambda: len(self.sync_engine.in_flight), node=server_nick_name)
+        if trace_events:
+            enable_spans()
+        self.metrics_server = None
+        if metrics_port is not None:
+            from blockchain.metrics.exporter import MetricsServer
+            self.metrics_server = MetricsServer(address=metrics_address, port=metrics_port).start()
+            print(f"[Metrics] Serving metrics on http://{metrics_address}:{self.metrics_server.address[1]}/metrics")
+
+        # Build connection to p2p gossip network
+        GossipNode.__init__(
+                    self, 
+
+                    miner_private_key,
+                    miner_public_key,
+
+                    server_nick_name=server_nick_name,
+                    server_address=server_address,
+                    server_port=server_port,
+
+                    ntp_server_address = ntp_server_address,
+                    ntp_offset_file_name = ntp_offset_file_name if ntp_offset_file_name is not None else self.ledger_dir/"ntp_offset.json",
+
+                    known_nodes_file_name=known_nodes_file_name,
+
+                    transport=transport,
+                    send_queue_size=send_queue_size,
+                    broadcast_fanout=broadcast_fanout,
+                    connect_timeout=connect_timeout,
+        )
+
+
+        # ==============================================
+        # Data loading either from a backup file, if the network is completely off or from a peer who is alife
+        # ==============================================
+
+        # If the ledger file exists, load it and carry on
+        if len(self.connected_peers)==0: # I am the only one !!
+            bad_block = self.check_ledger_integrity()
+            # if we managed to connect to some nodes, we can ask about the current status of the blockchain
+            if bad_block==0:
+                self.build_new_legder()
+        # If not, the ledger is synced from the peers once they sent their ledger infos
+
+    def process(self, node, data):
+        """Handles a gossip frame received from a peer. Frames are never relayed as they are :
+        blocks and transactions are announced to the peers once they are accepted (see announce)
+        """
+        with PROCESS_TIME.time(event=self.events.name_of(data.type)):
+            self.process_event(node, data)
+        return False
+
+    def process_event(self, node, data):
+        """Handles a gossip frame depending on its event type
+        """
+        if data.type==BCN_GossipEvents.GET_LEDGER_INFOS:
+            print(f"[Gossip packet] Received legder infos request from {node}")
+            send_frame(
+                    node.socket,
+                    GossipFrame(
+                        BCN_GossipEvents.LEDGER_INFOS,
+                        self.block_chain.height
+                    )
+                )
+                
+            print(f"[Gossip packet] Sent ledger ingfos to {node}")
+        elif data.type==BCN_GossipEvents.LEDGER_INFOS:
+            print(f"Ledger infos {data.metadata}")
+            local_ledger_last_block = self.block_chain.height
+            remote_ledger_last_block = data.metadata
+            if remote_ledger_last_block>local_ledger_last_block:
+                # Fetch all the blocks we don't have
+                self.sync_engine.start(node, local_ledger_last_block, remote_ledger_last_block)
+            elif not self.sync_engine.running:
+                #TODO :notify that we have a longer chain
+                print(f"[Notification] Ready to process")
+                self.ready=True
+        elif data.type==BCN_GossipEvents.GET_LEDGER_HEADERS:
+            start, count = data.metadata
+            stop = min(start+min(count, self.max_headers_per_frame), len(self.block_chain))
+            send_frame(
+                    node.socket,
+                    GossipFrame(
+                        BCN_GossipEvents.LEDGER_HEADERS,
+                        [start, [self.block_chain.block_hash(i) for i in range(start, stop)]]
+                    )
+                )
+        elif data.type==BCN_GossipEvents.LEDGER_HEADERS:
+            start, hashes = data.metadata
+            self.sync_engine.on_headers(node, start, hashes)
+        elif data.type==BCN_GossipEvents.GET_LEDGER_BLOCK:
+            if 0<=data.metadata<len(self.block_chain):
+                # The block is sent as it is stored, without decoding it
+                send_frame(
+                        node.socket,
+                        GossipFrame(
+                            BCN_GossipEvents.LEDGER_BLOCK,
+                            Encoded(self.block_reader.raw(data.metadata))
+                        )
+                    )
+        elif data.type==BCN_GossipEvents.LEDGER_BLOCK:
+            self.sync_engine.on_block(node, data.metadata)
+        elif data.type==BCN_GossipEvents.INV:
+            # Ask for the announced transactions and blocks we don't know yet
+            wanted = [[kind, item_hash] for kind, item_hash in data.metadata if not self.knows(kind, item_hash)]
+            if len(wanted)>0:
+                for _, item_hash in wanted:
+                    self.requested_inventory.remember(item_hash)
+                send_frame(node.socket, GossipFrame(BCN_GossipEvents.GET_DATA, wanted))
+        elif data.type==BCN_GossipEvents.GET_DATA:
+            for kind, item_hash in data.metadata:
+                if kind=="tx":
+                    transaction = self.mempool.get(item_hash)
+                    if transaction is not None:
+                        send_frame(node.socket, GossipFrame(BCN_GossipEvents.TRANSACTION, transaction))
+                elif kind=="block":
+                    block_id = self.block_chain.height_of(item_hash)
+                    if block_id is not None:
+                        send_frame(node.socket, GossipFrame(BCN_GossipEvents.BLOCK, Encoded(self.block_reader.raw(block_id))))
+        elif data.type==BCN_GossipEvents.TRANSACTION:
+            self.submit_transaction(data.metadata, source=node.socket)
+        elif data.type==BCN_GossipEvents.BLOCK:
+            self.receive_block(node, data.metadata)
+        elif data.type==BCN_GossipEvents.COMPACT_BLOCK:
+            self.receive_compact_block(node, data.metadata)
+        elif data.type==BCN_GossipEvents.GET_BLOCK_TXNS:
+            block_hash, indexes = data.metadata
+            block_id = self.block_chain.height_of(block_hash)
+            if block_id is not None:
+                transactions = self.ledger[block_id].transactions
+                send_frame(
+                        node.socket,
+                        GossipFrame(
+                            BCN_GossipEvents.BLOCK_TXNS,
+                            [block_hash, [transactions[i] for i in indexes if 0<=i<len(transactions)]]
+                        )
+                    )
+        elif data.type==BCN_GossipEvents.BLOCK_TXNS:
+            block_hash, received = data.metadata
+            with self.ledger_lock:
+                pending = self.pending_compact_blocks.pop(block_hash, None)
+            if pending is not None:
+                compact_block, transactions, missing = pending
+                if compact_block.fill(transactions, missing, received):
+                    self.complete_compact_block(node, compact_block, transactions)
+                else:
+                    self.request_full_block(node, block_hash)
+
+    # =================== Announces ==============
+    def knows(self, kind, item_hash):
+        """Tells if we already have (or already requested) an announced transaction or block
+        """
+        if item_hash in self.requested_inventory:
+            return True
+        if kind=="tx":
+            return item_hash in self.mempool or item_hash in self.admission
+        return self.block_chain.height_of(item_hash) is not None
+
+    def announce(self, kind, item_hash, exclude=None):
+        """Announces a new transaction ("tx") or block ("block") to random peers, they fetch it if they don't have it
+        """
+        self.broadcast(GossipFrame(BCN_GossipEvents.INV, [[kind, item_hash]]), exclude=exclude)
+
+    def announce_block(self, block, exclude=None):
+        """Sends a new block to random peers as a compact block : its header and the short ids of its transactions,
+        peers rebuild it from their pending transactions
+        """
+        self.broadcast(GossipFrame(BCN_GossipEvents.COMPACT_BLOCK, CompactBlock(block)), exclude=exclude)
+
+    def receive_block(self, node, block):
+        """Handles a new block sent by a peer
+        """
+        if block.id>self.block_chain.height+1:
+            # We missed some blocks, fetch them all
+            self.sync_engine.start(node, self.block_chain.height, block.id)
+        elif block.id==self.block_chain.height+1 and not self.sync_engine.running:
+            if self.accept_block(block):
+                self.announce_block(block, exclude=node.socket)
+
+    def receive_compact_block(self, node, compact_block):
+        """Handles a compact block sent by a peer : rebuilds it from the pending transactions and asks for the missing ones
+        """
+        if compact_block.id>self.block_chain.height+1:
+            self.sync_engine.start(node, self.block_chain.height, compact_block.id)
+            return
+        if compact_block.id!=self.block_chain.height+1 or self.sync_engine.running:
+            return
+        transactions, missing = compact_block.reconstruct(self.mempool)
+        if len(missing)==0:
+            self.complete_compact_block(node, compact_block, transactions)
+            return
+        with self.ledger_lock:
+            # Only keep the last few blocks waiting for transactions
+            if len(self.pending_compact_blocks)>=16:
+                self.pending_compact_blocks.clear()
+            self.pending_compact_blocks[compact_block.hash] = (compact_block, transactions, missing)
+        send_frame(node.socket, GossipFrame(BCN_GossipEvents.GET_BLOCK_TXNS, [compact_block.hash, missing]))
+
+    def complete_compact_block(self, node, compact_block, transactions):
+        """Validates a block rebuilt from a compact block, asks for the full block if it doesn't match
+        """
+        block = compact_block.to_block(transactions)
+        if self.accept_block(block):
+            self.announce_block(block, exclude=node.socket)
+        elif block.id==self.block_chain.height+1:
+            # Two transactions may share a short id, the whole block tells
+            self.request_full_block(node, compact_block.hash)
+
+    def request_full_block(self, node, block_hash):
+        if block_hash not in self.requested_inventory:
+            self.requested_inventory.remember(block_hash)
+            send_frame(node.socket, GossipFrame(BCN_GossipEvents.GET_DATA, [["block", block_hash]]))
+
+    # =================== Sync ==============
+    def request_headers(self, peer, start, count):
+        """Asks a peer for the hashes of count blocks starting at start (used by the sync engine)
+        """
+        send_frame(peer.socket, GossipFrame(BCN_GossipEvents.GET_LEDGER_HEADERS, [start, count]))
+
+    def request_block(self, peer, block_id):
+        """Asks a peer for a block (used by the sync engine)
+        """
+        send_frame(peer.socket, GossipFrame(BCN_GossipEvents.GET_LEDGER_BLOCK, block_id))
+
+    def accept_block(self, block):
+        """Validates a block received from the network and appends it to the ledger
+        Returns False if the block doesn't follow the ledger or is invalid
+        """
+        with span("accept_block"):
+            accepted = self._accept_block(block)
+        BLOCKS.inc(result="accepted" if accepted else "refused")
+        return accepted
+
+    def _accept_block(self, block):
+        # The hash becomes the tip of the ledger, it must be the hash of the header whatever path the block came from
+        if hash(block.serialize())!=block.hash:
+            return False
+        with self.ledger_lock:
+            prev = self.block_chain.tip_hash if self.block_chain.height>=0 else hash(b"")
+            if block.id!=self.block_chain.height+1 or block.prevH!=prev:
+                return False
+            if not all(self.uses_network_scheme(t) for t in [block.coinbase] + block.transactions) or not block.verify():
+                return False
+            # The miner can't mint more than the retribution and the fees of the transactions it validated
+            if not block.verify_coinbase(self.mining_coinbase_retribution):
+                return False
+            try:
+                self.utxo.apply_block(block)
+            except ValueError as ex:
+                print(f"[Ledger error] {ex}")
+                return False
+            try:
+                self.block_chain.append(block)
+            except Exception:
+                self.utxo.rollback_block()
+                raise
+            self.mempool.remove_block(block)
+            return True
+
+    def sync_done(self, success):
+        """Called by the sync engine once the ledger is synced
+        """
+        if success:
+            print(f"[Notification] Ready to process")
+            self.ready=True
+
+    def build_new_legder(self):
+            # Consider this miner as the root of the ledger. Build the new network
+            net_id = random.randint(0,2000000000)
+            txt_sender_key = publicKey2Text(self.miner_public_key)
+            txt_receiver_key = publicKey2Text(self.miner_public_key)
+            self.mempool.clear()
+            
+            self.validateBlock(0,hash(b""))
+
+    def validateBlock(self, id, prev, transactions=[]):
+            #Build a ledger with a first virtual transaction to the root id
+            ts = datetime.now().timestamp()
+            # Coinbase pays the miners, and the fees of the transactions go to them too
+            coinbase = Transaction(0, ts, [], [Output(self.miner_public_key, self.mining_coinbase_retribution + sum(t.fee for t in transactions))])
+            # Build ledger entry
+            block = Block(id, ts, coinbase, list(transactions), prev)
+            block.sign(self.miner_private_key)
+            # Update the unspent outputs (this refuses blocks spending outputs that can't be spent)
+            self.utxo.apply_block(block)
+            # Save the block
+            try:
+                self.block_chain.append(block)
+            except Exception:
+                self.utxo.rollback_block()
+                raise
+            
+            return block
+    # =================== Ledger oprations ==============
+    def check_ledger_integrity(self, full=False):
+        """Checks the blocks added to the ledger since the last check (all of them if full is True)
+        Returns the id of the first bad block or None if no blocks have problems
+        """
+        if self.block_chain.height<0:
+            return 0 # block 0 has an issue
+        else:
+            bad_block = self.block_chain.check_integrity(full=full)
+            if bad_block is not None:
+                print(f"[Ledger error] Block {bad_block} is corrupted")
+            return bad_block
+
+    def loadBlock(self, block_id):
+        return self.ledger[block_id]
+
+    def gossip_getCurrentLedger_infos(self, connection):
+        """Request current ledger informations (last bloc id)
+        """
+        try:
+            send_frame(
+                    connection,
+                    GossipFrame(
+                        BCN_GossipEvents.GET_LEDGER_INFOS,
+                        ""
+                    )
+                )        
+            return True
+        except Exception as ex:
+            self.log_exception(ex)
+            return False
+    # ================= Ledger queries ======================================
+    def show_ledger(self, last=None):
+        """Show the ledger content, block by block (may be too mush if used on very big networks with millions of transactions)
+        Parameters
+        ----------
+        last    (int)   : only show this number of blocks at the end of the ledger (None for all of them)
+        """
+        start = 0 if last is None else max(0, len(self.ledger)-last)
+        for block_id in range(start, len(self.ledger)):
+            block = self.ledger[block_id]
+            print(f"Block {block.id} : {block.hash.hex()} ({len(block.transactions)} transactions)")
+
+    # ================= Block chain transactions management ====================    
+    def push_transaction(self, transaction, source=None):
+        """A transaction received from some node
+        process it and return a validation or not. Accepted transactions are announced to the peers
+        The transaction goes through all the admission stages in the calling thread (see submit_transaction for transactions received from the network)
+        Parameters
+        ----------
+        transaction (Transaction) : A transaction whose inputs spend unspent outputs and whose outputs give the coins to the receivers
+        source      (socket)      : the connection of the peer that sent the transaction (None for local transactions)
+        """
+        return self.admission.admit(transaction, source)
+
+    def submit_transaction(self, transaction, source=None):
+        """Queues a transaction received from a peer in the admission pipeline, never blocks the connection it came from
+        Returns False if the pipeline is full and the transaction was dropped
+        """
+        return self.admission.submit(transaction, source)
+
+    def transaction_admitted(self, transaction, accepted, source):
+        """Called by the admission pipeline once a transaction is added to the pending pool or refused
+        """
+        TRANSACTIONS.inc(result="accepted" if accepted else "refused")
+        if accepted:
+            self.announce("tx", transaction.hash, exclude=source)
+
+    def uses_network_scheme(self, transaction):
+        """Returns True if all the keys of a transaction belong to the signature scheme of the network
+        """
+        try:
+            return all(scheme_of_text(part.public_key) is self.signature_scheme for part in transaction.inputs + transaction.outputs)
+        except ValueError:
+            return False
+ 
+
+
+        
+    def validate_transactions(self, max_count=None, max_size=None):
+        """Validates the pending transactions with the highest fees in a new block
+        Parameters
+        ----------
+        max_count   (int)   : maximum number of transactions in the block (None for no limit)
+        max_size    (int)   : maximum size in bytes of the transactions of the block (None for no limit)
+        """
+        with self.ledger_lock:
+            transactions = self.mempool.select(max_count, max_size)
+            # The miner signs every transaction it validates
+            for pending_transaction in transactions:
+                pending_transaction.sign(self.miner_private_key)
+            # Added to the ledger (and pinned in its cache)
+            block = self.validateBlock(self.block_chain.height+1, self.block_chain.tip_hash, transactions)
+            self.mempool.remove_block(block)
+        self.announce_block(block)
+        return block
+
+    def close(self):
+        """Disconnects from the network, then syncs and closes the ledger, the unspent outputs and the pending transactions
+        (blocks accepted since the last sync of the ledger would be lost otherwise), and stops the signature verification workers
+        """
+        GossipNode.close(self)
+        self.admission.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        with self.ledger_lock:
+            self.block_reader.close()
+            self.block_chain.close()
+            self.utxo.close()
+            self.mempool.close()
+        # Started again on first use if another node of the process needs it
+        shutdown_verification_pool()
+
+    # ========================================================        
+    # Logging
+    # ========================================================        
+    def log_exception(self, ex):
+        """Logs an exception
+        """
+        type_, value_, traceback_ = sys.exc_info()
+        print("[Exception]  {}\n{}\n{}\n{}\n".format(ex,type_,value_,'\n'.join(traceback.format_tb(traceback_))))
@@ -0,0 +1,301 @@
+# Project       : BlockChain
+# Script        : admission.py
+# Author        : ParisNeo
+# Description   : Admission of the transactions received from the network into the pending pool.
+#                 Transactions go through stages, each one with its own thread and a bounded queue :
+#                   decode  : builds the transaction from the bytes received (the codec computes its hash from its content),
+#                             the hash of a transaction object is computed again
+#                   check   : stateless checks (signature scheme, signatures in their tagged form, size, amounts, inputs signed for the outputs)
+#                   verify  : signatures of the inputs, verified by batches (on the verification worker pool for big batches).
+#                             Verified transactions are remembered so that their signatures are not verified again in a block
+#                   spend   : the inputs spend unspent outputs that no pending transaction spends
+#                   insert  : added to the pending pool then announced to the peers
+#                 Submitting never blocks : when the first queue is full the transaction is dropped, so a burst of
+#                 transactions never stalls the connection it came from (blocks keep being relayed).
+#                 The stages after the first one block when the next queue is full (backpressure up to the first queue).
+
+import time
+from queue import Queue, Empty, Full
+from threading import Thread, Lock
+
+from blockchain.crypto_tools import verify_batch, hash, normalize_signature
+from blockchain.data.codec import Encoded, decode, encode
+from blockchain.data.transaction import Transaction
+from blockchain.data.signature_cache import verified_signatures
+from blockchain.metrics import counter, histogram
+
+STAGES = ("decode", "check", "verify", "spend", "insert")
+
+STAGE_TIME = histogram("admission_stage_seconds", "Time spent by a transaction in an admission stage (waiting in its queue included), by stage")
+STAGE_RESULTS = counter("admission_stage_total", "Transactions leaving an admission stage, by stage and result (passed, refused or dropped)")
+
+
+class Stage():
+    def __init__(self, name, queue_size):
+        """A stage of the pipeline : its queue and its counters
+        """
+        self.name = name
+        self.queue = Queue(queue_size)
+        self.lock = Lock()
+        self.passed = 0
+        self.refused = 0
+        self.dropped = 0
+        self.total_time = 0.0
+
+    def count(self, result, started):
+        """Counts a transaction leaving the stage (passed, refused or dropped). started is the time it entered the stage queue
+        """
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            setattr(self, result, getattr(self, result) + 1)
+            if result != "dropped":
+                self.total_time += elapsed
+        STAGE_RESULTS.inc(stage=self.name, result=result)
+        if result != "dropped":
+            STAGE_TIME.observe(elapsed, stage=self.name)
+
+    def stats(self):
+        queued = self.queue.qsize()
+        with self.lock:
+            done = self.passed + self.refused
+            received = done + self.dropped + queued
+            return {
+                "queued":queued,
+                "passed":self.passed,
+                "refused":self.refused,
+                "dropped":self.dropped,
+                "drop_rate":self.dropped/received if received>0 else 0,
+                "mean_latency":self.total_time/done if done>0 else 0,
+            }
+
+
+class AdmissionPipeline():
+    def __init__(self, node, queue_size=1024, batch_size=64, batch_wait=0.005, max_transaction_size=100*1024):
+        """Builds the admission pipeline of a node (call start to run it).
+        The node checks and stores the transactions, it must provide :
+            uses_network_scheme(transaction)                : True if the keys of the transaction belong to the network scheme
+            utxo, mempool, ledger_lock                      : the unspent outputs, the pending pool and the lock of the ledger
+            transaction_admitted(transaction, accepted, source) : called once a transaction is accepted or refused
+
+        Parameters
+        ----------
+        node                    (BlockChainNode): the node receiving the transactions
+        queue_size              (int)           : maximum number of transactions waiting in each stage
+        batch_size              (int)           : maximum number of transactions whose signatures are verified at once
+        batch_wait              (float)         : time in seconds the verify stage waits to fill a batch
+        max_transaction_size    (int)           : maximum size in bytes of an encoded transaction
+        """
+        self.node = node
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_transaction_size = max_transaction_size
+        self.stages = {name:Stage(name, queue_size) for name in STAGES}
+        # Hashes of the transactions in the pipeline, not to fetch them again while they are checked
+        self.in_flight = set()
+        self.lock = Lock()
+        self.threads = []
+        self.running = False
+
+    def __contains__(self, transaction_hash):
+        with self.lock:
+            return transaction_hash in self.in_flight
+
+    def start(self):
+        """Starts a thread per stage. Returns the pipeline
+        """
+        self.running = True
+        self.threads = [
+            Thread(target=self._run, args=(name, handler), daemon=True)
+            for name, handler in [("decode", self._decode), ("check", self._check), ("spend", self._spend), ("insert", self._insert)]
+        ]
+        self.threads.append(Thread(target=self._run_verify, daemon=True))
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Stops the stage threads (transactions still queued are forgotten)
+        """
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    # ================= Entry points ======================================
+    def submit(self, transaction, source=None):
+        """Queues a transaction received from a peer, never blocks.
+        Returns False if the pipeline is full and the transaction was dropped
+
+        Parameters
+        ----------
+        transaction (Transaction or Encoded or bytes)   : the transaction, decoded or not
+        source      (socket)                            : the connection of the peer that sent it
+        """
+        stage = self.stages["decode"]
+        try:
+            stage.queue.put_nowait((transaction, source, time.perf_counter()))
+            return True
+        except Full:
+            stage.count("dropped", time.perf_counter())
+            self.node.transaction_admitted(transaction, False, source)
+            return False
+
+    def admit(self, transaction, source=None):
+        """Runs all the stages on a transaction in the calling thread (for local transactions).
+        Returns True if the transaction was added to the pending pool
+        """
+        item = transaction
+        for name, handler in [("decode", self._decode), ("check", self._check), ("verify", self._verify_one), ("spend", self._spend), ("insert", self._insert)]:
+            started = time.perf_counter()
+            item = handler(item)
+            if item is None:
+                self.stages[name].count("refused", started)
+                self.node.transaction_admitted(transaction, False, source)
+                return False
+            self.stages[name].count("passed", started)
+        self.node.transaction_admitted(item, True, source)
+        return True
+
+    # ================= Stages ======================================
+    def _decode(self, transaction):
+        if isinstance(transaction, Encoded):
+            transaction = transaction.data
+        if isinstance(transaction, (bytes, bytearray, memoryview)):
+            try:
+                transaction = decode(bytes(transaction))
+            except ValueError:
+                return None
+        if not isinstance(transaction, Transaction):
+            return None
+        # The pending pool and the verified signatures are keyed by this hash
+        if hash(transaction.serialize()) != transaction.hash:
+            return None
+        return transaction
+
+    def _check(self, transaction):
+        # Keys of other signature schemes can't be used on this network
+        if len(transaction.inputs)==0 or not self.node.uses_network_scheme(transaction):
+            return None
+        # Old RSA signatures without tag are only accepted in the ledger, a new signature has a single valid encoding
+        if any(normalize_signature(input.public_key, input.signature) != input.signature for input in transaction.inputs):
+            return None
+        if len(encode(transaction)) > self.max_transaction_size:
+            return None
+        # Inputs and outputs amounts must match, and every input must be signed for these outputs and this fee
+        if not transaction.verify_amounts() or not transaction.verify_commitments(allow_unbound=False):
+            return None
+        return transaction
+
+    def _verify_one(self, transaction):
+        # Verify that the owners of the spent outputs signed the inputs
+        if not verify_batch([input.signature_check() for input in transaction.inputs]):
+            return None
+        verified_signatures.add(transaction)
+        return transaction
+
+    def _spend(self, transaction):
+        # Every input must spend an unspent output of its owner, not spent by a pending transaction
+        if not self.node.utxo.check_inputs(transaction.inputs) or len(self.node.mempool.conflicts(transaction))>0:
+            return None
+        return transaction
+
+    def _insert(self, transaction):
+        # The ledger may have changed since the spend stage, the inputs are checked again with the ledger locked
+        with self.node.ledger_lock:
+            if not self.node.utxo.check_inputs(transaction.inputs):
+                return None
+            # Refused if already pending or if another pending transaction spends the same outputs
+            if not self.node.mempool.add(transaction):
+                return None
+        return transaction
+
+    # ================= Threads ======================================
+    def _next(self, name):
+        index = STAGES.index(name) + 1
+        return self.stages[STAGES[index]] if index < len(STAGES) else None
+
+    def _forward(self, name, transaction, source):
+        """Hands a transaction to the next stage (blocks while its queue is full), or ends it after the last stage
+        """
+        next_stage = self._next(name)
+        if next_stage is None:
+            self._done(transaction, True, source)
+            return
+        while self.running:
+            try:
+                next_stage.queue.put((transaction, source, time.perf_counter()), timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def _done(self, transaction, accepted, source):
+        with self.lock:
+            self.in_flight.discard(getattr(transaction, "hash", None))
+        self.node.transaction_admitted(transaction, accepted, source)
+
+    def _get(self, stage, timeout=0.1):
+        try:
+            return stage.queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    def _run(self, name, handler):
+        stage = self.stages[name]
+        while self.running:
+            item = self._get(stage)
+            if item is None:
+                continue
+            transaction, source, started = item
+            try:
+                result = handler(transaction)
+            except Exception as ex:
+                self.node.log_exception(ex)
+                result = None
+            if result is None:
+                stage.count("refused", started)
+                self._done(transaction, False, source)
+                continue
+            if name=="decode":
+                with self.lock:
+                    self.in_flight.add(result.hash)
+            stage.count("passed", started)
+            self._forward(name, result, source)
+
+    def _run_verify(self):
+        """Verifies the signatures of batches of transactions. When a batch has a bad signature,
+        its transactions are verified one by one to find the bad ones
+        """
+        stage = self.stages["verify"]
+        while self.running:
+            item = self._get(stage)
+            if item is None:
+                continue
+            batch = [item]
+            deadline = time.perf_counter() + self.batch_wait
+            while len(batch) < self.batch_size:
+                item = self._get(stage, max(0, deadline - time.perf_counter()))
+                if item is None:
+                    break
+                batch.append(item)
+            try:
+                if verify_batch([input.signature_check() for transaction, _, _ in batch for input in transaction.inputs]):
+                    results = [True] * len(batch)
+                else:
+                    results = [self._verify_one(transaction) is not None for transaction, _, _ in batch]
+            except Exception as ex:
+                self.node.log_exception(ex)
+                results = [False] * len(batch)
+            for (transaction, source, started), valid in zip(batch, results):
+                if valid:
+                    verified_signatures.add(transaction)
+                    stage.count("passed", started)
+                    self._forward("verify", transaction, source)
+                else:
+                    stage.count("refused", started)
+                    self._done(transaction, False, source)
+
+    # ================= Stats ======================================
+    def stats(self):
+        """Returns the counters of every stage (queued, passed, refused, dropped, drop rate and mean latency in seconds)
+        """
+        return {name:stage.stats() for name, stage in self.stages.items()}
@@ -0,0 +1,190 @@
+# Project       : BlockChain
+# Script        : async_transport.py
+# Author        : ParisNeo
+# Description   : An asyncio transport for the gossip network.
+#                 A single event loop thread accepts the connections and runs a reader and a writer task per peer.
+#                 Frames to send are queued in a bounded queue per peer, senders are blocked when the queue is full (backpressure).
+#                 Received frames are handed to the node (handle_frame / process) on a small pool of worker threads so that
+#                 slow processing (signature verification, disk access) never blocks the event loop.
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from blockchain.p2p.gossip_frame import PeerIdentity
+from blockchain.p2p.gossip_net import ConnectionRole
+from blockchain.p2p.wire_format import FRAME_HEADER, parse_frame_header, decode_frame_payload
+
+
+class PeerChannel():
+    def __init__(self, transport, writer, send_queue_size):
+        """Takes the place of the socket of a peer handled by the asyncio transport.
+        Frames sent through it are queued then written by the peer writer task
+
+        Parameters
+        ----------
+        transport       (AsyncTransport)        : the transport handling this peer
+        writer          (asyncio.StreamWriter)  : the stream to write to the peer
+        send_queue_size (int)                   : maximum number of frames waiting to be written
+        """
+        self.transport = transport
+        self.loop = transport.loop
+        self.writer = writer
+        self.queue = asyncio.Queue(send_queue_size)
+        self.closed = False
+        self.tasks = []
+
+    def sendall(self, data):
+        """Queues data to be sent to the peer.
+        From a worker thread, this blocks while the peer send queue is full
+        """
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        if threading.get_ident() == self.transport.loop_thread_id:
+            # Never block the event loop
+            try:
+                self.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                raise ConnectionError("Peer send queue is full")
+        else:
+            future = asyncio.run_coroutine_threadsafe(self.queue.put(data), self.loop)
+            try:
+                future.result(self.transport.send_timeout)
+            except FutureTimeoutError:
+                future.cancel()
+                raise ConnectionError("Peer is too slow to receive data")
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def close(self):
+        """Closes the connection (can be called from any thread)
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if threading.get_ident() == self.transport.loop_thread_id:
+            self._close()
+        else:
+            self.loop.call_soon_threadsafe(self._close)
+
+    def _close(self):
+        for task in self.tasks:
+            if task is not asyncio.current_task():
+                task.cancel()
+        self.writer.close()
+
+
+class AsyncTransport():
+    def __init__(self, node, send_queue_size=256, send_timeout=30, workers=8):
+        """Builds an asyncio transport for a gossip node
+
+        Parameters
+        ----------
+        node            (GossipNode)    : the node using this transport. Its server socket must be bound
+        send_queue_size (int)           : maximum number of frames waiting to be sent to a peer
+        send_timeout    (float)         : time in seconds a sender waits for room in a full send queue before dropping the peer
+        workers         (int)           : number of threads running the node frame handlers
+        """
+        self.node = node
+        self.send_queue_size = send_queue_size
+        self.send_timeout = send_timeout
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gossip_worker")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.loop_thread_id = None
+        self.server = None
+
+    # ================= Event loop ======================================
+    def _run(self):
+        self.loop_thread_id = threading.get_ident()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def start(self):
+        """Starts the event loop thread and listens to peer connections
+        """
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self.loop).result()
+
+    def stop(self):
+        """Closes all connections and stops the event loop
+        """
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.executor.shutdown(wait=False)
+
+    async def _serve(self):
+        print(f"[TH Lestining] Listening on address {self.node.server_address}:{self.node.server_port}")
+        self.node.server.setblocking(False)
+        self.server = await asyncio.start_server(self._on_accept, sock=self.node.server)
+        print("socket is listening")
+
+    async def _shutdown(self):
+        if self.server is not None:
+            self.server.close()
+        with self.node.peers_lock:
+            peers = list(self.node.connected_peers)
+        for peer in peers:
+            peer.socket.close()
+
+    # ================= Peers ======================================
+    async def _on_accept(self, reader, writer):
+        node = PeerIdentity()
+        node.address, node.port = writer.get_extra_info("peername")[:2]
+        print(f'Connected to :{node}')
+        await self._run_peer(node, reader, writer, ConnectionRole.MASTER)
+
+    def connect(self, node, timeout=10):
+        """Connects to a peer (blocks until connected, raises an exception if the peer is unreachable)
+        """
+        asyncio.run_coroutine_threadsafe(self._connect(node, timeout), self.loop).result()
+
+    async def _connect(self, node, timeout):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(node.address, node.port), timeout)
+        self.loop.create_task(self._run_peer(node, reader, writer, ConnectionRole.CLIENT))
+
+    async def _run_peer(self, node, reader, writer, role):
+        """Reader task of a peer, it also owns the peer writer task
+        """
+        channel = PeerChannel(self, writer, self.send_queue_size)
+        channel.tasks.append(asyncio.current_task())
+        channel.tasks.append(self.loop.create_task(self._write_loop(node, channel)))
+        node.socket = channel
+        self.node.add_peer(node)
+        try:
+            await self.loop.run_in_executor(self.executor, self.node.greet, node, role)
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                payload = await reader.readexactly(parse_frame_header(header))
+                data = decode_frame_payload(payload, self.node.encoded_frame_types)
+                # The next frame is only read once this one is handled, so a peer flooding us is slowed down by TCP
+                if not await self.loop.run_in_executor(self.executor, self.node.handle_frame, node, data):
+                    return
+        except asyncio.CancelledError:
+            pass
+        except Exception as ex:
+            print(f"[com {node}] Connection lost")
+            self.node.log_exception(f"{ex}")
+        finally:
+            self.node.close_connection(channel)
+
+    async def _write_loop(self, node, channel):
+        """Writer task of a peer, sends the queued frames
+        """
+        try:
+            while True:
+                data = await channel.queue.get()
+                channel.writer.write(data)
+                # Write everything that is already waiting before waiting for the socket to drain
+                while not channel.queue.empty():
+                    channel.writer.write(channel.queue.get_nowait())
+                await channel.writer.drain()
+        except asyncio.CancelledError:
+            pass
+        except Exception as ex:
+            print(f"[com {node}] Connection lost")
+            self.node.log_exception(f"{ex}")
+            self.node.close_connection(channel)
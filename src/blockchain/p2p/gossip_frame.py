@@ -0,0 +1,39 @@
+# Project       : BlockChain
+# Script        : gossip_frame.py
+# Author        : ParisNeo
+# Description   : The data exchanged between the nodes of the gossip network
+
+import datetime
+import random
+
+
+class PeerIdentity():
+    def __init__(self, nick_name="", address="", port=0, public_key=None, signature=None, socket = None):
+        self.nick_name  = nick_name
+        self.address    = address
+        self.port       = port
+        self.public_key = public_key
+        self.signature  = signature
+
+        self.socket     = socket
+
+    def __str__(self):
+        return f"{self.nick_name} ({self.address}:{self.port})"
+
+
+class GossipFrame():
+    def __init__(self, type, metadata, ttl=0):
+        """Builds a gossip frame to inform other nodes of something
+
+        Parameters
+        ----------
+        type        (int)   : the event type
+        metadata    (any)   : the content of the frame
+        ttl         (int)   : number of times the frame is relayed from node to node (0 for frames sent to a single peer)
+        """
+        # Random 63 bits id so that nodes can recognize a frame they already received
+        self.message_id     = random.getrandbits(63)
+        self.ts             = datetime.datetime.now().timestamp()
+        self.type           = type
+        self.metadata       = metadata
+        self.ttl            = ttl
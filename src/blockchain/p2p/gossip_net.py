@@ -11,14 +11,29 @@ import datetime
 import sys, traceback
 import socket
 import json
-import pickle
-import ntplib 
-from threading import Thread, Lock
+from threading import Thread, Lock, RLock
+from collections import deque
 from _thread import start_new_thread
 import time
 from blockchain.crypto_tools import b58decode, b58encode, sign, verify, publicKey2Text, text2PublicKey
+from blockchain.p2p.gossip_frame import PeerIdentity, GossipFrame
+from blockchain.p2p.wire_format import send_frame, encode_frame, FrameReader
+from blockchain.p2p.queued_connection import QueuedConnection
+from blockchain.p2p.seen_cache import SeenCache
+from blockchain.p2p.time_keeper import TimeKeeper
+from blockchain.metrics import counter, gauge, histogram, span
 
 import random
+
+# ================= Metrics ======================================
+FRAMES_HANDLED = counter("gossip_frames_handled_total", "Frames received from peers and handled, by event type")
+DUPLICATES_DROPPED = counter("gossip_duplicates_dropped_total", "Frames dropped because they were already received")
+CONNECTIONS_LOST = counter("gossip_connections_lost_total", "Connections with peers that were lost")
+BROADCAST_FRAMES = counter("gossip_broadcast_frames_total", "Frames sent to peers by broadcasts")
+BROADCAST_BYTES = counter("gossip_broadcast_bytes_total", "Bytes sent to peers by broadcasts")
+PEERS = gauge("gossip_peers", "Number of connected peers")
+SEEN_CACHE_SIZE = gauge("gossip_seen_cache_size", "Number of message ids remembered to drop duplicates")
+
 # Useful classes ======================================
 class GossipEvents_():
     """List of acceptable events for gossip network
@@ -40,6 +55,14 @@ class GossipEvents_():
         """
         return self._GossipEvents[key]
 
+    def name_of(self, event_type):
+        """Returns the name of an event type (its number if it is unknown)
+        """
+        for name, value in self._GossipEvents.items():
+            if value==event_type:
+                return name
+        return str(event_type)
+
 GossipEvents = GossipEvents_()
 
 class ConnectionRole_():
@@ -66,34 +89,14 @@ class ConnectionRole_():
 ConnectionRole = ConnectionRole_()
 
 
-class PeerIdentity():
-    def __init__(self, nick_name="", address="", port=0, public_key=None, signature=None, socket = None):
-        self.nick_name  = nick_name
-        self.address    = address
-        self.port       = port
-        self.public_key = public_key
-        self.signature  = signature
-
-        self.socket     = socket
-
-    def __str__(self):
-        return f"{self.nick_name} ({self.address}:{self.port})"
-
-
-class GossipFrame():
-    def __init__(self, type, metadata):
-        """Builds a gossip frame to inform other nodes of something
-        """
-        self.message_id     = random.randint(0,2000000000)
-        self.ts             = datetime.datetime.now().timestamp()
-        self.type           = type
-        self.metadata       = metadata
-
-
 class GossipNode(object):
     """ Main class
     Builds a computational node that can nonnect to the p2p network and exchange data
     """
+    # Names of the event types (for logs and metrics)
+    events = GossipEvents
+    # Event types whose metadata is handed to handle_frame still encoded, to be decoded away from the connection
+    encoded_frame_types = frozenset()
     
     def __init__(
                     self, 
@@ -106,9 +109,19 @@ class GossipNode(object):
                     server_port=44444,
 
                     ntp_server_address = 'europe.pool.ntp.org',
+                    ntp_offset_file_name = None,
 
                     known_nodes_file_name="nodes.txt",
 
+                    transport="threads",
+                    send_queue_size=256,
+
+                    seen_cache_size=100000,
+                    seen_cache_ttl=600,
+                    gossip_list_size=1000,
+                    broadcast_fanout=8,
+                    connect_timeout=5,
+                    max_ttl=4,
                 ):
 
         """Initialises the blockchain object
@@ -123,9 +136,21 @@ class GossipNode(object):
         server_port             (int)               : Local server port
 
         ntp_server_address      (str)               : Address of the NTP server to eep time synced over the network
+        ntp_offset_file_name    (str or Path)       : File where the last clock offset is saved, used until the NTP server answers (None not to save it)
 
 
         known_nodes_file_name   (str or Path)       : a file containing nodes of the network to which we try to connect for the federated decentralyzed network
+
+        transport               (str)               : "threads" for one thread per peer, "asyncio" for a single event loop handling all the peers
+        send_queue_size         (int)               : maximum number of frames waiting to be sent to a peer before senders are blocked
+
+        seen_cache_size         (int)               : maximum number of received message ids remembered to drop duplicates
+        seen_cache_ttl          (float)             : time in seconds a received message id is remembered
+        gossip_list_size        (int)               : number of last received frames kept in the gossip list
+        broadcast_fanout        (int)               : number of random peers a broadcast frame is sent to (None for all peers)
+        connect_timeout         (float)             : time in seconds to wait for a known node to accept the connection (all known nodes are connected at the same time)
+        max_ttl                 (int)               : maximum number of times a received frame is relayed further (a larger ttl set by a peer is lowered to it)
+
         ledger_dir              (Path or str)       : the path to the ledger folder in which the ledger blocks are stored
 
         pending_transactions_file_name(Path or str) : A file to store the pending transactions in case of loss 
@@ -135,15 +160,8 @@ class GossipNode(object):
         mining_transaction_fee  (float)             : Transaction fee to give the validator from the transactions to be validated (in factions, like 0.001 for example) put 0 for no fee transactions
         mining_cap              (float)             : The maximum amount of coins that could be mined (-1 for unlimited coin generation)
         """
-        # We first need to be well synced
-        try:
-            self.time_keeper = ntplib.NTPClient()
-            self.time = self.time_keeper.request(ntp_server_address, version=3)
-            if self.time.offset>10:
-                print("[TIME error] : Your PC is not syced enough with ntp servers. Please sync your clock")
-            print(f"Time offset : {self.time.offset}")
-        except Exception as ex:
-            print(f"Couldn't contact time server")
+        # We need to be well synced, the clock offset is measured in the background (the saved one is used meanwhile)
+        self.time_keeper = TimeKeeper(ntp_server_address, ntp_offset_file_name).start()
 
       
         # Save keys in memory
@@ -165,8 +183,9 @@ class GossipNode(object):
         # ===========================
         # Communication
         # ===========================
-        # Let's keep a list of connected peers
+        # Let's keep a list of connected peers (shared between the connection threads)
         self.connected_peers = []
+        self.peers_lock = RLock()
         # Let's read the lost of known nodes in the network (needed bor the backbone of the federated decentralyzed network)
         self.known_nodes_file_name = Path(known_nodes_file_name)
         self.known_nodes = []
@@ -180,97 +199,169 @@ class GossipNode(object):
                         self.known_nodes.append(PeerIdentity("",addr,int(port),None, None, None))                        
                     except:
                         pass
-        # Gossip list a list of information to tell others about 
-        self.gossip_list = []
+        # Gossip list a list of information to tell others about (only the last ones are kept)
+        self.gossip_list = deque(maxlen=gossip_list_size)
+        # Ids of the messages already received, a frame coming back through another path is dropped
+        self.seen_messages = SeenCache(seen_cache_size, seen_cache_ttl)
+        PEERS.set_function(lambda: len(self.connected_peers), node=server_nick_name)
+        SEEN_CACHE_SIZE.set_function(lambda: len(self.seen_messages), node=server_nick_name)
 
         # Build a socket to listen to messages
+        self.closed = False
         self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server.bind((server_address, server_port))        # Bind to the port
-        # Attempt connection to all known nodes
-        for node in self.known_nodes:
-            if not(node.address==self.server_address and node.port==self.server_port):
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                try:
-                    s.connect((node.address, node.port))
-                    node.socket=s
-                    self.connected_peers.append(node)
-                    start_new_thread(self.communication, (node,ConnectionRole.CLIENT))
-                    
 
-                    print(f"[Main thread] Connected to node {(node.address, node.port)}")
-                except Exception as ex:
-                    print(f"[Main thread] Node  {(node.address, node.port)} unreachable")
-                    self.log_exception(f"[Exception] {ex}")
-
-
-        # Start server
-        start_new_thread(self.listen,())
+        self.transport = transport
+        self.send_queue_size = send_queue_size
+        self.broadcast_fanout = broadcast_fanout
+        self.connect_timeout = connect_timeout
+        self.max_ttl = max_ttl
+        if transport=="asyncio":
+            # One event loop thread handles all the peers
+            from blockchain.p2p.async_transport import AsyncTransport
+            self.async_transport = AsyncTransport(self, send_queue_size=send_queue_size)
+            self.async_transport.start()
+            self.connect_known_nodes(lambda node: self.async_transport.connect(node, self.connect_timeout))
+        else:
+            # Attempt connection to all known nodes
+            self.connect_known_nodes(self.connect_node)
+
+            # Start server
+            start_new_thread(self.listen,())
+
+    def connect_known_nodes(self, connect):
+        """Connects to all the known nodes at the same time and returns once every attempt succeeded or failed,
+        so startup takes as long as the slowest node instead of the sum of all of them
+        Parameters
+        ----------
+        connect (callable)  : connects to a node, raises an exception if the node is unreachable
+        """
+        def attempt(node):
+            try:
+                connect(node)
+                print(f"[Main thread] Connected to node {(node.address, node.port)}")
+            except Exception as ex:
+                print(f"[Main thread] Node  {(node.address, node.port)} unreachable")
+                self.log_exception(f"[Exception] {ex}")
+
+        threads = [
+            Thread(target=attempt, args=(node,), daemon=True)
+            for node in self.known_nodes
+            if not(node.address==self.server_address and node.port==self.server_port)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def connect_node(self, node):
+        """Connects to a node and starts talking to it (threads transport)
+        """
+        s = socket.create_connection((node.address, node.port), timeout=self.connect_timeout)
+        s.settimeout(None)
+        node.socket=QueuedConnection(s, self.send_queue_size)
+        self.add_peer(node)
+        start_new_thread(self.communication, (node,ConnectionRole.CLIENT))
 
 
     def communication(self, node, role):
         """TCP connection with the peer to talk to
         """
         try:
-            # Say hello
-            self.gossip_hello(node.socket)
-            #If I am a client, then ask for ledger information
-            if role==ConnectionRole.CLIENT:
-                self.gossip_getCurrentLedger_infos(node.socket)
+            self.greet(node, role)
             # Now get to work
+            reader = FrameReader(node.socket, encoded_types=self.encoded_frame_types)
             while True:
-                data = pickle.loads(node.socket.recv(4096*1000))
-                self.gossip_list.append(data)
-
-                # Parse received data
-                if data.type==GossipEvents.HELLO: # Hello message received
-                    index = self.get_peer_index(node.address, node.port)
-                    infos = self.connected_peers[index]
-                    if infos.public_key is None: # this is a new person we don't know his public key yet, so let's say hello
-                        # Someone said hello, let's start by verifying that he is a legitimate user. Remember, this is a trustless system
-                        if self.verifyPeerInfos(data.metadata):
-                            print(f"[com {node}] Adding peer \n{data.metadata.public_key}")
-                            # Contaminate all nodes in the network
-                            for peer in self.connected_peers:
-                                if peer.socket!=node.socket:
-                                    peer.socket.send(
-                                        pickle.dumps(
-                                        GossipFrame(
-                                            GossipEvents.HELLO,
-                                            data.metadata
-                                        )
-                                        )
-                                    )
-                            data.metadata.socket=node.socket
-                            self.connected_peers[index] = data.metadata
-                        else:# bad peer!!
-                            print(f"[Peer {node} is bad!!] Refusing peer {node}")
-                            self.close_connection(node.socket)
-                            return
-                else:
-                    self.process(node, data)
+                data = reader.read_frame()
+                if not self.handle_frame(node, data):
+                    return
 
         except Exception as ex:
             print(f"[com {node}] Connection lost")
+            CONNECTIONS_LOST.inc()
             self.log_exception(f"{ex}")
             self.close_connection(node.socket)
             time.sleep(1)
 
+    def greet(self, node, role):
+        """Starts the conversation with a newly connected peer
+        """
+        # Say hello
+        self.gossip_hello(node.socket)
+        #If I am a client, then ask for ledger information
+        if role==ConnectionRole.CLIENT:
+            self.gossip_getCurrentLedger_infos(node.socket)
+
+    def handle_frame(self, node, data):
+        """Handles a frame received from a peer (whatever the transport)
+        Returns False if the connection with the peer has been closed
+        """
+        # Drop the frames we already received
+        if not self.seen_messages.add(data.message_id):
+            DUPLICATES_DROPPED.inc()
+            return True
+        event = self.events.name_of(data.type)
+        FRAMES_HANDLED.inc(event=event)
+        self.gossip_list.append(data)
+        # A peer can't make its frames travel further than we allow
+        data.ttl = min(data.ttl, self.max_ttl)
+
+        # Parse received data
+        if data.type==GossipEvents.HELLO: # Hello message received
+            with self.peers_lock:
+                index = self.get_peer_index_by_socket(node.socket)
+                infos = self.connected_peers[index] if index>=0 else None
+            if infos is not None and infos.public_key is None: # this is a new person we don't know his public key yet, so let's say hello
+                # Someone said hello, let's start by verifying that he is a legitimate user. Remember, this is a trustless system
+                if self.verifyPeerInfos(data.metadata):
+                    print(f"[com {node}] Adding peer \n{data.metadata.public_key}")
+                    # Contaminate all nodes in the network
+                    # Forward the original frame so that peers recognize it if it comes back to them
+                    self.broadcast(data, fanout=None, exclude=node.socket)
+                    data.metadata.socket=node.socket
+                    with self.peers_lock:
+                        index = self.get_peer_index_by_socket(node.socket)
+                        if index>=0:
+                            self.connected_peers[index] = data.metadata
+                else:# bad peer!!
+                    print(f"[Peer {node} is bad!!] Refusing peer {node}")
+                    self.close_connection(node.socket)
+                    return False
+        else:
+            with span("gossip_event", event=event):
+                accepted = self.process(node, data)
+            # Frames broadcast with a ttl are relayed to other peers, only once their sender said hello and they were accepted
+            if accepted and data.ttl>0 and self.peer_is_verified(node.socket):
+                data.ttl -= 1
+                self.broadcast(data, exclude=node.socket)
+                data.ttl += 1
+        return True
+
     def process(self, node, data):
         """ Process to be done by the inheriting class
+        Returns True if the frame is accepted and can be relayed to other peers (if it has a ttl)
+        """
+        return False
+
+    def gossip_getCurrentLedger_infos(self, connection):
+        """ Ledger informations request to be done by the inheriting class
         """
-        pass
+        return True
                 
 
+    def add_peer(self, node):
+        """Adds a peer to the connected peers list
+        """
+        with self.peers_lock:
+            self.connected_peers.append(node)
+
     def close_connection(self, socket):
         socket.close()
-        found=None
-        for i,peer in enumerate(self.connected_peers):
-            if peer.socket==socket:
-                found=i
-                break
-        if found is not None:
-            print("Peer removed from list")
-            del self.connected_peers[found]     
+        with self.peers_lock:
+            found = self.get_peer_index_by_socket(socket)
+            if found>=0:
+                print("Peer removed from list")
+                del self.connected_peers[found]     
 
     def listen(self):
         """Listen to peer connections
@@ -284,10 +375,16 @@ class GossipNode(object):
         while True:    
             # establish connection with client
             node = PeerIdentity()
-            node.socket, (node.address, node.port) = self.server.accept()
+            try:
+                s, (node.address, node.port) = self.server.accept()
+            except OSError:
+                if self.closed:
+                    return
+                raise
+            node.socket = QueuedConnection(s, self.send_queue_size)
     
             print(f'Connected to :{node}')
-            self.connected_peers.append(node)
+            self.add_peer(node)
             # Start a new thread and return its identifier
             start_new_thread(self.communication, (node,ConnectionRole.MASTER))
     
@@ -300,22 +397,80 @@ class GossipNode(object):
         while self.started:
             time.sleep(1)
 
+    def close(self):
+        """Stops listening and closes the connections to the peers
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.started = False
+        if self.transport=="asyncio":
+            self.async_transport.stop()
+            return
+        try:
+            self.server.shutdown(socket.SHUT_RDWR) # Wakes up the listening thread
+        except OSError:
+            pass
+        self.server.close()
+        with self.peers_lock:
+            peers = list(self.connected_peers)
+        for peer in peers:
+            if peer.socket is not None:
+                self.close_connection(peer.socket)
+
     def pushGossipFrame(self, frame):
         """Pushes a gossip frame to pending frames list
         """
+        self.seen_messages.remember(frame.message_id)
         self.gossip_list.append(frame)
 
+    def broadcast(self, frame, fanout=-1, exclude=None):
+        """Sends a frame to random connected peers. The frame is encoded once and the same bytes are queued for every peer
+        Parameters
+        ----------
+        frame   (GossipFrame)   : the frame to send (its ttl tells how many times peers relay it)
+        fanout  (int)           : number of peers to send it to (None for all peers, -1 for the node broadcast_fanout)
+        exclude (socket)        : the connection not to send the frame to (usually the peer we received it from)
+
+        Returns the number of peers the frame was sent to
+        """
+        if fanout==-1:
+            fanout = self.broadcast_fanout
+        self.seen_messages.remember(frame.message_id)
+        data = encode_frame(frame)
+        with self.peers_lock:
+            peers = [peer for peer in self.connected_peers if peer.socket is not None and peer.socket!=exclude]
+        if fanout is not None and len(peers)>fanout:
+            peers = random.sample(peers, fanout)
+        sent = 0
+        for peer in peers:
+            try:
+                peer.socket.sendall(data)
+                sent += 1
+            except Exception as ex:
+                print(f"[com {peer}] Connection lost")
+                CONNECTIONS_LOST.inc()
+                self.log_exception(f"{ex}")
+                self.close_connection(peer.socket)
+        BROADCAST_FRAMES.inc(sent)
+        BROADCAST_BYTES.inc(sent*len(data))
+        return sent
+
+    def gossip_stats(self):
+        """Returns the number of received frames and of dropped duplicates
+        """
+        return self.seen_messages.stats()
+
 
         
     def gossip_hello(self, connection):
-        connection.send(
-            pickle.dumps(
-            GossipFrame(
+        frame = GossipFrame(
                 GossipEvents.HELLO,
                 self.identity
             )
-            )
-        )
+        # Our own hello may come back to us through other peers
+        self.seen_messages.remember(frame.message_id)
+        send_frame(connection, frame)
 
     def gossip_peer_is_connected(self, peer_infos):
         GossipFrame(
@@ -331,12 +486,26 @@ class GossipNode(object):
                 return i
         return -1
 
+    def peer_is_verified(self, socket):
+        """Tells if the peer on this connection said hello with a valid identity
+        """
+        with self.peers_lock:
+            index = self.get_peer_index_by_socket(socket)
+            return index>=0 and self.connected_peers[index].public_key is not None
+
+    def get_peer_index_by_socket(self, socket):
+        """Returns the index of the peer using this connection (-1 if not found)
+        """
+        for i,entry in enumerate(self.connected_peers):
+            if entry.socket==socket:
+                return i
+        return -1
+
     def verifyPeerInfos(self, metadata: PeerIdentity):
         """ Ferify that the peer is not a fraudulent one
         """
-        public_key = text2PublicKey(metadata.public_key)
         peer_validation_message = bytes("__BlockChainPeerValidationMessage__"+metadata.nick_name+metadata.address+str(metadata.port),"utf8")
-        return verify(public_key, peer_validation_message, metadata.signature)
+        return verify(metadata.public_key, peer_validation_message, metadata.signature)
 
     # ========================================================        
     # Logging
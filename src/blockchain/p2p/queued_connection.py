@@ -0,0 +1,81 @@
+# Project       : BlockChain
+# Script        : queued_connection.py
+# Author        : ParisNeo
+# Description   : Wraps the socket of a peer handled by the threads transport.
+#                 Frames sent to the peer are put in a bounded queue and written by a writer thread dedicated to the peer,
+#                 so a slow peer never blocks the thread that sends (a broadcast for example), and frames sent by
+#                 different threads are never interleaved on the socket.
+
+import queue
+import threading
+
+
+class QueuedConnection():
+    def __init__(self, sock, send_queue_size=256, send_timeout=30):
+        """Builds a queued connection over a connected socket and starts its writer thread
+
+        Parameters
+        ----------
+        sock            (socket)    : the connected socket
+        send_queue_size (int)       : maximum number of frames waiting to be written
+        send_timeout    (float)     : time in seconds a sender waits for room in a full queue before dropping the peer
+        """
+        self.socket = sock
+        self.send_timeout = send_timeout
+        self.queue = queue.Queue(send_queue_size)
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def sendall(self, data):
+        """Queues data to be sent to the peer (blocks while the queue is full)
+        """
+        if self.closed:
+            raise ConnectionError("Connection closed")
+        try:
+            self.queue.put(data, timeout=self.send_timeout)
+        except queue.Full:
+            self.close()
+            raise ConnectionError("Peer is too slow to receive data")
+
+    def send(self, data):
+        self.sendall(data)
+        return len(data)
+
+    def recv_into(self, buffer, size=0):
+        return self.socket.recv_into(buffer, size)
+
+    def recv(self, size):
+        return self.socket.recv(size)
+
+    def close(self):
+        """Closes the connection (can be called from any thread)
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.queue.put_nowait(None) # Wakes up the writer
+        except queue.Full:
+            pass
+        self.socket.close()
+
+    def _write_loop(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None or self.closed:
+                    return
+                # Write everything that is already waiting in one call
+                chunks = [data]
+                while not self.queue.empty():
+                    data = self.queue.get_nowait()
+                    if data is None:
+                        break
+                    chunks.append(data)
+                self.socket.sendall(b"".join(chunks) if len(chunks) > 1 else chunks[0])
+                if data is None:
+                    return
+        except OSError:
+            # The reader thread sees the connection closed too and removes the peer
+            self.close()
@@ -0,0 +1,71 @@
+# Project       : BlockChain
+# Script        : seen_cache.py
+# Author        : ParisNeo
+# Description   : A cache of the gossip message ids already received.
+#                 Gossip frames are relayed from peer to peer, so the same frame comes back through every cycle of the mesh.
+#                 Ids are kept for a limited time and in a limited number so that memory stays bounded.
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class SeenCache():
+    def __init__(self, max_size=100000, ttl=600):
+        """Builds a cache of seen message ids
+
+        Parameters
+        ----------
+        max_size    (int)   : maximum number of ids kept (the oldest ones are forgotten first)
+        ttl         (float) : time in seconds after which an id is forgotten
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        # message id -> time it was seen, oldest first
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.received = 0
+        self.duplicates = 0
+
+    def add(self, message_id):
+        """Records a received message id, returns False if it was already seen (duplicate)
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.received += 1
+            seen = self.entries.get(message_id)
+            if seen is not None and now - seen < self.ttl:
+                self.duplicates += 1
+                return False
+            self._record(message_id, now)
+            return True
+
+    def remember(self, message_id):
+        """Records the id of a message we send, so that it is dropped if it comes back to us
+        """
+        with self.lock:
+            self._record(message_id, time.monotonic())
+
+    def _record(self, message_id, now):
+        self.entries[message_id] = now
+        self.entries.move_to_end(message_id)
+        # Forget expired ids and the oldest ones when the cache is full
+        while len(self.entries) > 0:
+            oldest_id, oldest = next(iter(self.entries.items()))
+            if now - oldest < self.ttl and len(self.entries) <= self.max_size:
+                break
+            del self.entries[oldest_id]
+
+    def __contains__(self, message_id):
+        with self.lock:
+            seen = self.entries.get(message_id)
+            return seen is not None and time.monotonic() - seen < self.ttl
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self):
+        """Returns the number of received messages, of dropped duplicates and of ids in the cache
+        """
+        with self.lock:
+            return {"received": self.received, "duplicates_dropped": self.duplicates, "size": len(self.entries)}
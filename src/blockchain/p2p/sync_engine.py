@@ -0,0 +1,295 @@
+# Project       : BlockChain
+# Script        : sync_engine.py
+# Author        : ParisNeo
+# Description   : Initial synchronization of the ledger with the network.
+#                 The hashes of the missing blocks (headers) are fetched first from one peer, then the blocks themselves are
+#                 downloaded in parallel from all connected peers, with a sliding window of requests in flight.
+#                 Each block is checked against its header as soon as it arrives, and blocks are handed to the node
+#                 strictly in order, by one thread at a time and without holding the lock of the engine, so that the
+#                 download goes on while blocks are verified and written. Requests that time out are retried on another peer.
+
+import time
+from threading import Thread, RLock
+
+from blockchain.crypto_tools import hash
+
+
+class SyncEngine():
+    def __init__(self, node, window=128, max_per_peer=16, timeout=10, max_retries=5, headers_batch=2000, report_every=5):
+        """Builds a sync engine for a node.
+        The node sends the requests and validates the blocks, it must provide :
+            connected_peers, peers_lock         : the connected peers
+            request_headers(peer, start, count) : asks a peer for the hashes of count blocks starting at start
+            request_block(peer, block_id)       : asks a peer for a block
+            accept_block(block)                 : validates and writes the next block, returns False if it is invalid
+            sync_done(success)                  : called once the sync is over
+
+        Parameters
+        ----------
+        node            (BlockChainNode): the node to sync
+        window          (int)           : maximum number of blocks requested ahead of the next block to write
+        max_per_peer    (int)           : maximum number of blocks requested from a single peer at the same time
+        timeout         (float)         : time in seconds after which a request is sent again to another peer
+        max_retries     (int)           : number of times a block is requested before giving up the sync
+        headers_batch   (int)           : number of headers requested at once
+        report_every    (float)         : time in seconds between two progress reports
+        """
+        self.node = node
+        self.window = window
+        self.max_per_peer = max_per_peer
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.headers_batch = headers_batch
+        self.report_every = report_every
+
+        self.lock = RLock()
+        self.running = False
+        # True while a thread hands the received blocks to the node
+        self.writing = False
+        # Changes at each new sync, so that a block accepted for a sync that was given up is not counted in the next one
+        self.generation = 0
+        self.watchdog = None
+        self._reset(-1, -1)
+
+    def _reset(self, local_height, remote_height):
+        self.generation += 1
+        self.target = remote_height
+        # id -> expected hash of the blocks to download
+        self.headers = {}
+        self.next_header = local_height + 1
+        self.header_peer = None
+        self.header_deadline = None
+        self.header_tries = 0
+        # id -> [peer socket, deadline] of the blocks requested
+        self.in_flight = {}
+        # id -> block received but waiting for the previous blocks to be written
+        self.received = {}
+        # id -> number of failed requests and peers that failed to send it
+        self.tries = {}
+        self.excluded = {}
+        # peer socket -> number of blocks requested / number of failures
+        self.load = {}
+        self.failures = {}
+        self.next_block = local_height + 1
+        self.written = 0
+        self.started = time.time()
+        self.last_report = self.started
+
+    # ================= Events ======================================
+    def start(self, peer, local_height, remote_height):
+        """Starts syncing up to the height announced by a peer (or extends the running sync)
+        """
+        requests = []
+        with self.lock:
+            if self.running:
+                if remote_height > self.target:
+                    if self.header_deadline is None and self.next_header > self.target:
+                        # All headers were received, ask the new ones to this peer
+                        self._request_headers(peer, requests)
+                    self.target = remote_height
+                return
+            if remote_height <= local_height:
+                return
+            self._reset(local_height, remote_height)
+            self.running = True
+            print(f"[Sync] Syncing blocks {local_height + 1} to {remote_height}")
+            self._request_headers(peer, requests)
+            self.watchdog = Thread(target=self._watch, daemon=True)
+            self.watchdog.start()
+        self._send(requests)
+
+    def on_headers(self, peer, start, hashes):
+        """Handles the block hashes sent by a peer
+        """
+        requests = []
+        with self.lock:
+            if not self.running or start != self.next_header or len(hashes) == 0:
+                return
+            for i, block_hash in enumerate(hashes[:self.target - start + 1]):
+                self.headers[start + i] = block_hash
+            self.next_header = start + len(hashes[:self.target - start + 1])
+            self.header_deadline = None
+            self.header_tries = 0
+            if self.next_header <= self.target:
+                self._request_headers(peer, requests)
+            self._schedule(requests)
+        self._send(requests)
+
+    def on_block(self, peer, block):
+        """Handles a block sent by a peer
+        """
+        requests = []
+        with self.lock:
+            if not self.running:
+                return
+            block_id = getattr(block, "id", None)
+            entry = self.in_flight.get(block_id)
+            if entry is None or entry[0] is not peer.socket:
+                return # Not requested, or already given up on this peer
+            del self.in_flight[block_id]
+            self.load[peer.socket] -= 1
+            try:
+                valid = block.hash == self.headers[block_id] and hash(block.serialize()) == block.hash
+            except Exception:
+                valid = False
+            if not valid:
+                print(f"[Sync] Bad block {block_id} received from {peer}")
+                if not self._failed(block_id, peer.socket):
+                    return
+            else:
+                self.received[block_id] = block
+            self._schedule(requests)
+        self._send(requests)
+        self._write()
+
+    def _write(self):
+        """Hands the received blocks to the node in order, until the next block is missing.
+        Only one thread writes at a time, the others just leave their block in received
+        """
+        with self.lock:
+            if self.writing:
+                return
+            self.writing = True
+        try:
+            while True:
+                requests = []
+                with self.lock:
+                    block = self.received.pop(self.next_block, None) if self.running else None
+                    if block is None:
+                        self.writing = False
+                        return
+                    generation = self.generation
+                # Signatures checks and disk writes, the other blocks keep being received meanwhile
+                accepted = self.node.accept_block(block)
+                with self.lock:
+                    if not self.running or generation != self.generation:
+                        continue # Given up meanwhile
+                    if not accepted:
+                        print(f"[Sync] Block {block.id} refused, it doesn't follow the local ledger")
+                        self._finish(False)
+                        continue
+                    self.headers.pop(block.id, None)
+                    self.tries.pop(block.id, None)
+                    self.excluded.pop(block.id, None)
+                    self.next_block += 1
+                    self.written += 1
+                    if self.next_block > self.target:
+                        self._finish(True)
+                        continue
+                    self._schedule(requests)
+                self._send(requests)
+        except:
+            with self.lock:
+                self.writing = False
+            raise
+
+    def tick(self):
+        """Retries the requests that timed out and reports the progress
+        """
+        requests = []
+        with self.lock:
+            if not self.running:
+                return
+            now = time.time()
+            connected = set(peer.socket for peer in self._peers())
+            for block_id, (socket, deadline) in list(self.in_flight.items()):
+                if deadline < now or socket not in connected:
+                    del self.in_flight[block_id]
+                    self.load[socket] -= 1
+                    if not self._failed(block_id, socket):
+                        return
+            if self.header_deadline is not None and (self.header_deadline < now or self.header_peer not in connected):
+                self.failures[self.header_peer] = self.failures.get(self.header_peer, 0) + 1
+                self.header_tries += 1
+                if self.header_tries > self.max_retries:
+                    print("[Sync] No peer sends the headers")
+                    self._finish(False)
+                    return
+                peers = self._peers()
+                if len(peers) > 0:
+                    self._request_headers(min(peers, key=lambda p: self.failures.get(p.socket, 0)), requests)
+            self._schedule(requests)
+            if now - self.last_report >= self.report_every:
+                self.last_report = now
+                stats = self.stats()
+                print(f"[Sync] Block {stats['height']}/{stats['target']} ({stats['blocks_per_second']:.1f} blocks/s, {stats['in_flight']} in flight)")
+        self._send(requests)
+
+    def _watch(self):
+        while self.running:
+            time.sleep(min(1, self.timeout / 2))
+            try:
+                self.tick()
+            except Exception as ex:
+                self.node.log_exception(ex)
+
+    # ================= Internals ======================================
+    def _peers(self):
+        with self.node.peers_lock:
+            return [peer for peer in self.node.connected_peers if peer.socket is not None]
+
+    def _request_headers(self, peer, requests):
+        self.header_peer = peer.socket
+        self.header_deadline = time.time() + self.timeout
+        count = min(self.headers_batch, self.target - self.next_header + 1)
+        requests.append((self.node.request_headers, peer, self.next_header, count))
+
+    def _schedule(self, requests):
+        """Requests the blocks of the window that are neither requested nor received yet, from the least busy peers
+        """
+        peers = self._peers()
+        if len(peers) == 0:
+            return
+        deadline = time.time() + self.timeout
+        for block_id in range(self.next_block, min(self.next_block + self.window, self.next_header)):
+            if block_id in self.in_flight or block_id in self.received:
+                continue
+            excluded = self.excluded.get(block_id, ())
+            peer = min(peers, key=lambda p: (p.socket in excluded, self.load.get(p.socket, 0), self.failures.get(p.socket, 0)))
+            if self.load.get(peer.socket, 0) >= self.max_per_peer:
+                break # Every peer is busy
+            self.in_flight[block_id] = [peer.socket, deadline]
+            self.load[peer.socket] = self.load.get(peer.socket, 0) + 1
+            requests.append((self.node.request_block, peer, block_id))
+
+    def _failed(self, block_id, socket):
+        """Records a failed request, returns False if the sync was given up
+        """
+        self.failures[socket] = self.failures.get(socket, 0) + 1
+        self.excluded.setdefault(block_id, set()).add(socket)
+        self.tries[block_id] = self.tries.get(block_id, 0) + 1
+        if self.tries[block_id] > self.max_retries:
+            print(f"[Sync] Block {block_id} couldn't be downloaded")
+            self._finish(False)
+            return False
+        return True
+
+    def _finish(self, success):
+        self.running = False
+        stats = self.stats()
+        print(f"[Sync] {'Done' if success else 'Failed'} : {stats['written']} blocks in {stats['elapsed']:.1f}s ({stats['blocks_per_second']:.1f} blocks/s)")
+        self.in_flight = {}
+        self.received = {}
+        self.headers = {}
+        self.node.sync_done(success)
+
+    def _send(self, requests):
+        for request, peer, *args in requests:
+            try:
+                request(peer, *args)
+            except Exception as ex:
+                # The request times out and is sent again to another peer
+                self.node.log_exception(ex)
+
+    def stats(self):
+        """Returns the progress of the sync
+        """
+        elapsed = time.time() - self.started
+        return {
+            "height": self.next_block - 1,
+            "target": self.target,
+            "written": self.written,
+            "in_flight": len(self.in_flight),
+            "elapsed": elapsed,
+            "blocks_per_second": self.written / elapsed if elapsed > 0 else 0.0,
+        }
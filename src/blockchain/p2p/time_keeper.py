@@ -0,0 +1,96 @@
+# Project       : BlockChain
+# Script        : time_keeper.py
+# Author        : ParisNeo
+# Description   : Keeps the offset between the local clock and a NTP server.
+#                 The NTP server is asked in a background thread so that a node never waits for it at startup
+#                 (or for its timeout when there is no network). The last offset measured is saved in a small file
+#                 and used until a new one is measured.
+
+import json
+import time
+from pathlib import Path
+from threading import Thread
+
+# Above this offset in seconds, the clock is considered not synced enough
+MAX_OFFSET = 10
+
+
+class TimeKeeper():
+    def __init__(self, ntp_server_address="europe.pool.ntp.org", offset_file_name=None, max_age=24*3600, timeout=5):
+        """Builds a time keeper, using the saved offset if there is one
+
+        Parameters
+        ----------
+        ntp_server_address  (str)           : address of the NTP server
+        offset_file_name    (str or Path)   : file where the last measured offset is saved (None not to save it)
+        max_age             (float)         : time in seconds after which a saved offset is too old to be used
+        timeout             (float)         : time in seconds to wait for the NTP server
+        """
+        self.ntp_server_address = ntp_server_address
+        self.offset_file_name = Path(offset_file_name) if offset_file_name is not None else None
+        self.max_age = max_age
+        self.timeout = timeout
+        # Offset in seconds to add to the local clock (0 until it is known)
+        self.offset = 0.0
+        # "measured", "cached" or None when the offset is unknown
+        self.source = None
+        self.thread = None
+        self._load()
+
+    def _load(self):
+        if self.offset_file_name is None or not self.offset_file_name.exists():
+            return
+        try:
+            with open(str(self.offset_file_name), "r") as f:
+                saved = json.load(f)
+            if saved["server"] == self.ntp_server_address and time.time() - saved["measured_at"] < self.max_age:
+                self.offset = float(saved["offset"])
+                self.source = "cached"
+        except (ValueError, KeyError, TypeError, OSError):
+            pass # Broken file, the offset is measured again
+
+    def _save(self):
+        if self.offset_file_name is None:
+            return
+        try:
+            self.offset_file_name.parent.mkdir(parents=True, exist_ok=True)
+            with open(str(self.offset_file_name), "w") as f:
+                json.dump({"server":self.ntp_server_address, "offset":self.offset, "measured_at":time.time()}, f)
+        except OSError as ex:
+            print(f"[TIME error] : Couldn't save the time offset ({ex})")
+
+    def start(self):
+        """Measures the offset in a background thread. Returns the time keeper
+        """
+        self.thread = Thread(target=self.sync, daemon=True)
+        self.thread.start()
+        return self
+
+    def sync(self):
+        """Asks the NTP server for the offset (blocks up to timeout). Returns True if the offset was measured
+        """
+        try:
+            import ntplib # Only needed here, not imported with the package
+            response = ntplib.NTPClient().request(self.ntp_server_address, version=3, timeout=self.timeout)
+        except Exception:
+            print(f"Couldn't contact time server" + (", using the saved time offset" if self.source=="cached" else ""))
+            return False
+        self.offset = response.offset
+        self.source = "measured"
+        if abs(self.offset)>MAX_OFFSET:
+            print("[TIME error] : Your PC is not syced enough with ntp servers. Please sync your clock")
+        print(f"Time offset : {self.offset}")
+        self._save()
+        return True
+
+    def wait(self, timeout=None):
+        """Waits for the background measure to finish. Returns True if the offset is known (measured or cached)
+        """
+        if self.thread is not None:
+            self.thread.join(timeout)
+        return self.source is not None
+
+    def time(self):
+        """Returns the network time (local time corrected by the offset)
+        """
+        return time.time() + self.offset
@@ -0,0 +1,159 @@
+# Project       : BlockChain
+# Script        : wire_format.py
+# Author        : ParisNeo
+# Description   : Binary wire format of the gossip network.
+#                 Every frame is sent as a fixed size header (magic, version, payload length) followed by the payload
+#                 encoded with the blockchain codec. The receiver reads exactly the header then exactly the payload,
+#                 so frames split over multiple TCP segments (or packed in the same one) are handled correctly.
+
+import struct
+
+from blockchain.data.codec import Encoder, Decoder, Encoded, CodecError, register_type, CODEC_VERSION, KEY_TEXT
+from blockchain.p2p.gossip_frame import GossipFrame, PeerIdentity
+from blockchain.metrics import counter
+
+WIRE_MAGIC = b"BC"
+# Version of the frame layout, bump it when the gossip frame fields change
+FRAME_VERSION = 1
+# Peers must agree on both the frame layout and the codec
+WIRE_VERSION = CODEC_VERSION * 16 + FRAME_VERSION
+# magic, version, reserved flags, payload length
+FRAME_HEADER = struct.Struct("<2sBBI")
+# Refuse frames bigger than this to avoid being forced to allocate huge buffers
+MAX_FRAME_SIZE = 32*1024*1024
+
+TAG_PEER_IDENTITY = 32
+TAG_GOSSIP_FRAME  = 33
+
+FRAMES_RECEIVED = counter("wire_frames_received_total", "Frames received from peers")
+BYTES_RECEIVED = counter("wire_bytes_received_total", "Bytes received from peers (headers included)")
+FRAMES_SENT = counter("wire_frames_sent_total", "Frames sent to a single peer (broadcasts are counted apart)")
+BYTES_SENT = counter("wire_bytes_sent_total", "Bytes sent to a single peer (headers included)")
+
+
+# ================= Types registration ======================================
+def _encode_peer_identity(encoder, peer):
+    # The socket is local to each node, it is never sent
+    encoder.write_value(peer.nick_name)
+    encoder.write_value(peer.address)
+    encoder.write_value(peer.port)
+    encoder.write_value(peer.public_key)
+    encoder.write_value(peer.signature)
+
+def _decode_peer_identity(decoder):
+    return PeerIdentity(
+        decoder.read_field((str,), "peer nick name"),
+        decoder.read_field((str,), "peer address"),
+        decoder.read_field((int,), "peer port"),
+        decoder.read_field(KEY_TEXT, "peer public key"),
+        decoder.read_field((bytes,), "peer signature")
+    )
+
+def _encode_gossip_frame(encoder, frame):
+    encoder.write_varint(frame.message_id)
+    encoder.write_float(frame.ts)
+    encoder.write_varint(frame.type)
+    encoder.write_varint(frame.ttl)
+    encoder.write_value(frame.metadata)
+
+def _decode_gossip_frame(decoder, encoded_types=()):
+    frame = GossipFrame.__new__(GossipFrame)
+    frame.message_id = decoder.read_varint()
+    frame.ts = decoder.read_float()
+    frame.type = decoder.read_varint()
+    frame.ttl = decoder.read_varint()
+    if frame.type in encoded_types:
+        # The metadata is the rest of the payload, it is decoded later by whoever handles the frame
+        frame.metadata = Encoded(bytes(decoder.data[decoder.offset:]))
+        decoder.offset = len(decoder.data)
+    else:
+        frame.metadata = decoder.read_value()
+    return frame
+
+register_type(PeerIdentity, TAG_PEER_IDENTITY, _encode_peer_identity, _decode_peer_identity)
+register_type(GossipFrame, TAG_GOSSIP_FRAME, _encode_gossip_frame, _decode_gossip_frame)
+
+
+# ================= Framing ======================================
+def encode_frame(frame):
+    """Encodes a gossip frame with its header, ready to be sent
+    """
+    encoder = Encoder()
+    encoder.buffer += bytes(FRAME_HEADER.size)
+    _encode_gossip_frame(encoder, frame)
+    FRAME_HEADER.pack_into(encoder.buffer, 0, WIRE_MAGIC, WIRE_VERSION, 0, len(encoder.buffer) - FRAME_HEADER.size)
+    return bytes(encoder.buffer)
+
+def decode_frame_payload(payload, encoded_types=()):
+    """Decodes the payload of a frame (without its header)
+
+    Parameters
+    ----------
+    payload         (bytes or memoryview)   : the payload of the frame
+    encoded_types   (set)                   : frame types whose metadata is left encoded (an Encoded value)
+    """
+    FRAMES_RECEIVED.inc()
+    BYTES_RECEIVED.inc(FRAME_HEADER.size + len(payload))
+    decoder = Decoder(payload)
+    frame = _decode_gossip_frame(decoder, encoded_types)
+    if decoder.offset != len(decoder.data):
+        raise CodecError("Trailing data after frame")
+    return frame
+
+def parse_frame_header(header):
+    """Checks a frame header and returns the payload length
+    """
+    magic, version, _, length = FRAME_HEADER.unpack(header)
+    if magic != WIRE_MAGIC:
+        raise CodecError("Bad frame magic")
+    if version != WIRE_VERSION:
+        raise CodecError(f"Unsupported wire version {version}")
+    if length > MAX_FRAME_SIZE:
+        raise CodecError(f"Frame too big ({length} bytes)")
+    return length
+
+def send_frame(connection, frame):
+    """Encodes and sends a gossip frame through a connection
+    """
+    data = encode_frame(frame)
+    connection.sendall(data)
+    FRAMES_SENT.inc()
+    BYTES_SENT.inc(len(data))
+
+
+class FrameReader():
+    def __init__(self, connection, initial_buffer_size=64*1024, encoded_types=()):
+        """Reads gossip frames from a connection using a reusable buffer
+
+        Parameters
+        ----------
+        connection          (socket)    : the connection to read from
+        initial_buffer_size (int)       : initial size of the receive buffer, it grows when a bigger frame arrives
+        encoded_types       (set)       : frame types whose metadata is left encoded (see decode_frame_payload)
+        """
+        self.connection = connection
+        self.encoded_types = encoded_types
+        self.header = bytearray(FRAME_HEADER.size)
+        self.buffer = bytearray(initial_buffer_size)
+
+    def _read_exactly(self, view):
+        """Fills a memoryview with data from the connection
+        """
+        received = 0
+        size = len(view)
+        while received < size:
+            n = self.connection.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ConnectionError("Connection closed by peer")
+            received += n
+
+    def read_frame(self):
+        """Blocks until a whole frame is received and returns it decoded
+        """
+        self._read_exactly(memoryview(self.header))
+        length = parse_frame_header(self.header)
+        if length > len(self.buffer):
+            self.buffer = bytearray(length)
+        payload = memoryview(self.buffer)[:length]
+        self._read_exactly(payload)
+        return decode_frame_payload(payload, self.encoded_types)
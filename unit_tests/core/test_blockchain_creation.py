@@ -9,6 +9,7 @@ parser = argparse.ArgumentParser()
 parser.add_argument('-n', "--name", default="Miner0")
 parser.add_argument('-a', "--addr", default="127.0.0.1")
 parser.add_argument('-p', "--port", default=44444,type=int)
+parser.add_argument('-t', "--transport", default="threads", choices=["threads", "asyncio"])
 args = parser.parse_args()
 
 
@@ -21,7 +22,8 @@ bc = BlockChainNode(
                         
                         args.name,
                         args.addr,
-                        args.port
+                        args.port,
+                        transport=args.transport
                     )
 # Start loop
 bc.loop()
\ No newline at end of file
@@ -0,0 +1,49 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds blocks following the ledger of a node, with a transaction paying a fee, as if they came from another miner :
+#               one whose coinbase pays the retribution plus the fee, one paying one more coin and one whose coinbase has two outputs
+#               adding up to more than that
+# Expected behaviour : The inflated coinbases are refused, the block paying the retribution plus the fee is accepted
+from blockchain import BlockChainNode
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.crypto_tools import generateKeys
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=46600,type=int)
+args = parser.parse_args()
+
+work_dir = Path(tempfile.mkdtemp())
+with open(work_dir/"nodes.txt","w") as f:
+    f.write("")
+miner_private_key, miner_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+node = BlockChainNode(miner_private_key, miner_public_key, "Node0", args.addr, args.port,
+                      known_nodes_file_name=work_dir/"nodes.txt", ledger_dir=work_dir/"ledger", pending_transactions_file_name=work_dir/"pending.journal")
+
+genesis = node.ledger[0].coinbase
+value = genesis.outputs[0].amount
+fee = 5
+outputs = [Output(receiver_public_key, value - fee)]
+transaction = Transaction(1, time.time(), [Input(miner_private_key, miner_public_key, value, genesis.hash, 0, outputs, fee=fee)], outputs, fee=fee)
+transaction.sign(miner_private_key)
+
+def build_block(amounts):
+    coinbase = Transaction(0, time.time(), [], [Output(miner_public_key, amount) for amount in amounts])
+    block = Block(1, time.time(), coinbase, [transaction], node.block_chain.tip_hash)
+    block.sign(miner_private_key)
+    return block
+
+retribution = node.mining_coinbase_retribution
+print(f"Coinbase paying one more coin accepted : {node.accept_block(build_block([retribution + fee + 1]))} (expected False)")
+print(f"Coinbase with two outputs paying too much accepted : {node.accept_block(build_block([retribution, fee + 1]))} (expected False)")
+print(f"Coinbase paying the retribution and the fee accepted : {node.accept_block(build_block([retribution + fee]))} (expected True)")
+print(f"Ledger height : {node.block_chain.height} (expected 1)")
+node.close()
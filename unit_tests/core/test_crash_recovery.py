@@ -0,0 +1,64 @@
+# Unit test :
+# Author : ParisNeo
+# Description : A node started in a child process validates 70 blocks, then it is closed before the process exits.
+#               The same is done again with a process killed without closing anything (the ledger is only durable up to
+#               its last sync while the unspent outputs journal is written at each block).
+#               Each time the node is then started again on the same ledger folder and validates one more block
+# Expected behaviour : After a close the ledger keeps all the blocks (height 69). After both restarts the unspent outputs are
+#                      at the height of the ledger, the balance of the miner matches the blocks of the ledger, and the next block is accepted
+from blockchain import BlockChainNode
+from blockchain.crypto_tools import generateKeys, privateKey2Text, publicKey2Text, text2PrivateKey, text2PublicKey
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=46300,type=int)
+parser.add_argument('-b', "--blocks", default=70,type=int)
+parser.add_argument("--crash", default=None, help="(child process) folder of the node to run then kill")
+parser.add_argument("--close", action="store_true", help="(child process) close the node before exiting")
+args = parser.parse_args()
+
+def build_node(work_dir, port):
+    with open(work_dir/"keys.txt","rb") as f:
+        private_key, public_key = f.read().split(b"\n")
+    return BlockChainNode(text2PrivateKey(private_key), text2PublicKey(public_key), "Miner", args.addr, port,
+                          known_nodes_file_name=work_dir/"nodes.txt", ledger_dir=work_dir/"ledger", pending_transactions_file_name=work_dir/"pending.journal")
+
+if args.crash is not None:
+    node = build_node(Path(args.crash), args.port)
+    for i in range(args.blocks - 1):
+        node.validate_transactions()
+    print(f"Child : ledger height {node.block_chain.height}, unspent outputs height {node.utxo.height}")
+    if args.close:
+        node.close()
+    sys.stdout.flush()
+    os._exit(0)
+
+def restart(port, close):
+    work_dir = Path(tempfile.mkdtemp())
+    private_key, public_key = generateKeys()
+    with open(work_dir/"keys.txt","wb") as f:
+        f.write(privateKey2Text(private_key) + b"\n" + publicKey2Text(public_key))
+    command = [sys.executable, __file__, "-a", args.addr, "-p", str(port), "-b", str(args.blocks), "--crash", str(work_dir)]
+    print(subprocess.run(command + (["--close"] if close else []), capture_output=True, text=True).stdout)
+
+    node = build_node(work_dir, port+1)
+    height = node.block_chain.height
+    print(f"Ledger height after restart : {node.block_chain.height}, unspent outputs height : {node.utxo.height} (expected the same)")
+    coinbase = node.ledger[0].coinbase.outputs[0].amount
+    print(f"Balance of the miner : {node.utxo.balance(publicKey2Text(public_key))} (expected {coinbase*(node.block_chain.height+1)})")
+    block = node.validate_transactions()
+    print(f"Next block {block.id} accepted : {node.block_chain.height==block.id and node.utxo.height==block.id} (expected True)")
+    node.close()
+    return height
+
+print("Node closed before exiting")
+height = restart(args.port, True)
+print(f"All the blocks kept : {height==args.blocks-1} (expected True)")
+print("Process killed")
+restart(args.port+2, False)
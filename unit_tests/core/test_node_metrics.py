@@ -0,0 +1,65 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Updates counters, gauges and histograms of a registry and checks its Prometheus export,
+#               then builds a node serving its metrics over http, with event spans enabled, connects a second node to it,
+#               pushes a transaction, validates a block and reads the metrics page
+# Expected behaviour : The export follows the Prometheus text format, and the metrics page of the node shows the ledger height,
+#                      the peers, the frames and bytes exchanged, the pending pool operations, the block checks and the event spans
+from blockchain import BlockChainNode
+from blockchain.metrics import Registry
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.crypto_tools import generateKeys
+import argparse
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=46200,type=int)
+args = parser.parse_args()
+
+registry = Registry(prefix="test_")
+frames = registry.counter("frames_total", "Frames")
+frames.inc(event="HELLO")
+frames.inc(2, event="INV")
+registry.gauge("peers", "Peers").set_function(lambda: 3)
+latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+for value in [0.05, 0.5, 5]:
+    latency.observe(value)
+print(registry.export())
+
+work_dir = Path(tempfile.mkdtemp())
+def build_node(i, private_key, public_key, known_nodes, **kwargs):
+    with open(work_dir/f"nodes{i}.txt","w") as f:
+        f.write("\n".join(f"{args.addr}:{port}" for port in known_nodes))
+    return BlockChainNode(private_key, public_key, f"Node{i}", args.addr, args.port+i,
+                          known_nodes_file_name=work_dir/f"nodes{i}.txt", ledger_dir=work_dir/f"ledger{i}", pending_transactions_file_name=work_dir/f"pending{i}.journal",
+                          **kwargs)
+
+miner_private_key, miner_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+miner = build_node(0, miner_private_key, miner_public_key, [], metrics_port=0, trace_events=True)
+node = build_node(1, *generateKeys(), [args.port])
+deadline = time.time() + 20
+while not node.ready and time.time() < deadline:
+    time.sleep(0.05)
+
+coinbase = miner.ledger[0].coinbase
+outputs = [Output(receiver_public_key, coinbase.outputs[0].amount)]
+transaction = Transaction(1, time.time(), [Input(miner_private_key, miner_public_key, coinbase.outputs[0].amount, coinbase.hash, 0, outputs)], outputs)
+miner.push_transaction(transaction)
+block = miner.validate_transactions()
+deadline = time.time() + 20
+while node.block_chain.tip_hash != block.hash and time.time() < deadline:
+    time.sleep(0.05)
+
+page = urllib.request.urlopen(f"http://127.0.0.1:{miner.metrics_server.address[1]}/metrics").read().decode("utf8")
+for expected in ['blockchain_node_ledger_height{node="Node0"} 1', 'blockchain_gossip_peers{node="Node0"} 1',
+                 'blockchain_node_transactions_total{result="accepted"}', 'blockchain_mempool_operations_total{operation="added"}',
+                 'blockchain_block_verify_total{result="valid"}', 'blockchain_wire_bytes_received_total', 'blockchain_ledger_append_seconds_count',
+                 'blockchain_span_seconds_count{event="GET_LEDGER_INFOS",span="gossip_event"}', 'blockchain_node_process_seconds_bucket{event="GET_DATA",le="+Inf"}']:
+    print(f"{'Found' if expected in page else 'MISSING'} : {expected}")
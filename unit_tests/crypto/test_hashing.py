@@ -0,0 +1,39 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Hashes some data one buffer at a time and in one batch, converts the hashes to texts and back,
+#               then builds a transaction and a block, encodes them and loads a transaction saved when hashes were hex texts
+# Expected behaviour : Hashes are raw 32 bytes SHA256 digests, the batch gives the same hashes, the texts are only used to show them,
+#                      and old hex hashes are read back as raw digests
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.codec import encode, decode
+from blockchain.crypto_tools import generateKeys, hash, hash_many, hash2Text, text2Hash
+import hashlib
+import pickle
+import time
+
+buffers = [bytes([i]) * (i * 10) for i in range(20)]
+print(f"Hash : {len(hash(b'data'))} bytes, same as hashlib {hash(b'data') == hashlib.sha256(b'data').digest()} (expected 32, True)")
+print(f"Batch same as one by one : {hash_many(buffers) == [hash(b) for b in buffers]} (expected True)")
+text = hash2Text(hash(b"data"))
+print(f"Text : {text} ({len(text)} characters), back to the hash {text2Hash(text) == hash(b'data')} (expected True)")
+
+private_key, public_key = generateKeys()
+outputs = [Output(public_key, 10)]
+transaction = Transaction(1, time.time(), [Input(private_key, public_key, 10, hash(b"previous"), 0, outputs)], outputs)
+transaction.sign(private_key)
+block = Block(1, time.time(), Transaction(0, time.time(), [], [Output(public_key, 10)]), [transaction], hash(b"genesis"))
+block.sign(private_key)
+print(f"Raw hashes : {all(type(h) is bytes and len(h)==32 for h in [transaction.hash, block.hash, block.prevH, block.merkle_root])} (expected True)")
+decoded = decode(encode(block))
+print(f"Decoded block : same hashes {(decoded.hash, decoded.prevH, decoded.merkle_root) == (block.hash, block.prevH, block.merkle_root)}, valid {decoded.verify()} (expected True, True)")
+
+# A transaction pickled when hashes were hex texts
+state = transaction.__getstate__()
+state["hash"] = transaction.hash.hex()
+old = Transaction.__new__(Transaction)
+old.__setstate__(state)
+old.inputs[0].__setstate__(tuple(transaction.inputs[0].prev_tx_hash.hex() if name=="prev_tx_hash" else getattr(transaction.inputs[0], name) for name in Input.__slots__))
+print(f"Old transaction : hash {old.hash == transaction.hash}, spent output {old.inputs[0].outpoint == transaction.inputs[0].outpoint}, same bytes {old.serialize() == transaction.serialize()} (expected True, True, True)")
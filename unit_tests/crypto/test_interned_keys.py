@@ -0,0 +1,19 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Interns copies of the same public key text, then interns many distinct key texts (like keys decoded from peers)
+#               while one key keeps being used
+# Expected behaviour : Copies of a key share the same text, the table stays bounded and the key in use is never forgotten
+import blockchain.crypto_tools as crypto_tools
+from blockchain.crypto_tools import generateKeys, publicKey2Text, intern_key, interned_keys_count
+
+crypto_tools.INTERNED_KEYS_MAX_SIZE = 100
+private_key, public_key = generateKeys()
+key_text = publicKey2Text(public_key)
+copy = bytes(bytearray(key_text))
+print(f"Copies share the same text : {intern_key(copy) is key_text} (expected True)")
+
+for i in range(1000):
+    intern_key(b"fake key %d" % i)
+    intern_key(bytes(bytearray(key_text)))
+print(f"Interned keys after 1000 new keys : {interned_keys_count()} (expected 100)")
+print(f"Key in use still shared : {intern_key(copy) is key_text} (expected True)")
@@ -0,0 +1,60 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Signs and verifies messages with every signature scheme, converts keys to texts and back,
+#               checks that signatures of one scheme are refused by keys of another, then builds and checks a block signed with Ed25519 keys
+# Expected behaviour : Every scheme signs and verifies, key texts carry the scheme prefix, signatures carry the scheme tag,
+#                      cross scheme signatures and untagged Ed25519 signatures are refused, old untagged RSA signatures are accepted and normalized
+#                      to their tagged form, and the Ed25519 block is valid
+
+from blockchain.crypto_tools import generateKeys, sign, verify, verify_batch, publicKey2Text, privateKey2Text, text2PrivateKey, text2PublicKey, schemes, get_scheme, scheme_of_text, normalize_signature
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.crypto_tools import hash
+from Crypto.Hash import SHA256
+from Crypto.Signature import PKCS1_v1_5
+import time
+
+# The signatures of big batches are verified by worker processes that import this script : the test only runs in the main process
+if __name__ == "__main__":
+    message = b"some message"
+    keys = {}
+    for name in schemes():
+        private_key, public_key = generateKeys(name)
+        keys[name] = (private_key, public_key)
+        signature = sign(private_key, message)
+        key_text = publicKey2Text(public_key)
+        # Keys go through their texts, like keys read from a key store or from the ledger
+        private_key = text2PrivateKey(privateKey2Text(private_key))
+        same_signature = verify(key_text, message, sign(private_key, message))
+        print(f"{name} : tag {signature[0]} (expected {get_scheme(name).tag}), text scheme {scheme_of_text(key_text).name}, "
+              f"key {len(key_text)} chars, signature {len(signature)} bytes, "
+              f"{'valid' if verify(public_key, message, signature) and verify(key_text, message, signature) and same_signature else 'INVALID'}, "
+              f"{'tampered refused' if not verify(key_text, message + b'!', signature) else 'TAMPERED ACCEPTED'}")
+
+    rsa_private_key, rsa_public_key = keys["rsa"]
+    ed_private_key, ed_public_key = keys["ed25519"]
+    print("Cross scheme signature accepted" if verify(publicKey2Text(rsa_public_key), message, sign(ed_private_key, message)) else "Cross scheme signature refused")
+    print("Untagged Ed25519 signature accepted" if verify(publicKey2Text(ed_public_key), message, sign(ed_private_key, message)[1:]) else "Untagged Ed25519 signature refused")
+    # Signatures built before the tags existed
+    legacy_signature = PKCS1_v1_5.new(rsa_private_key).sign(SHA256.new(message))
+    print("Old RSA signature accepted" if verify(publicKey2Text(rsa_public_key), message, legacy_signature) else "Old RSA signature refused")
+    # Both encodings of an RSA signature normalize to the tagged one
+    tagged_signature = normalize_signature(publicKey2Text(rsa_public_key), legacy_signature)
+    print(f"Normalized old RSA signature : tagged {tagged_signature == bytes([get_scheme('rsa').tag]) + legacy_signature}, "
+          f"stable {normalize_signature(publicKey2Text(rsa_public_key), tagged_signature) == tagged_signature} (expected True, True)")
+    print(f"Text of a key : {text2PublicKey(publicKey2Text(ed_public_key)) == ed_public_key} (expected True)")
+
+    # A block of an Ed25519 network
+    miner_private_key, miner_public_key = generateKeys("ed25519")
+    outputs = [Output(miner_public_key, 10)]
+    transactions = [Transaction(i, time.time(), [Input(ed_private_key, ed_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(300)]
+    for transaction in transactions:
+        transaction.sign(miner_private_key)
+    block = Block(1, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, hash(b"genesis"))
+    block.sign(miner_private_key)
+    print("Valid Ed25519 block" if block.verify() else "Invalid Ed25519 block")
+    checks = block.signature_checks()
+    checks[10] = (checks[10][0], checks[10][1] + b"!", checks[10][2])
+    print("Tampered batch accepted" if verify_batch(checks) else "Tampered batch refused")
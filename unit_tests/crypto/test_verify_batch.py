@@ -0,0 +1,32 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Tests verifying many signatures at once with the worker processes pool, then with one bad signature in the batch
+# Expected behaviour : The valid batch is accepted, the batch containing a bad signature is refused, both faster than one by one on multi core machines
+
+from blockchain.crypto_tools import generateKeys, publicKey2Text, sign, verify, text2PublicKey, verify_batch, shutdown_verification_pool, key_cache_stats
+import time
+
+# The signatures of big batches are verified by worker processes that import this script : the test only runs in the main process
+if __name__ == "__main__":
+    keys = [generateKeys() for _ in range(8)]
+    checks = []
+    for i in range(2000):
+        private_key, public_key = keys[i % len(keys)]
+        message = bytes(f"message {i}", "utf8")
+        checks.append((publicKey2Text(public_key), message, sign(private_key, message)))
+
+    start = time.time()
+    valid = all(verify(text2PublicKey(k), m, s) for k, m, s in checks)
+    print(f"One by one : {'Valid' if valid else 'Invalid'} in {time.time()-start:.3f}s")
+
+    start = time.time()
+    print(f"Batch : {'Valid' if verify_batch(checks) else 'Invalid'} in {time.time()-start:.3f}s")
+
+    # Corrupt one signature in the middle of the batch
+    k, m, s = checks[1000]
+    checks[1000] = (k, m + b"!", s)
+    start = time.time()
+    print(f"Batch with a bad signature : {'Valid' if verify_batch(checks) else 'Invalid'} in {time.time()-start:.3f}s")
+    # Only 8 distinct keys were used, they should have been parsed only once each
+    print(f"Public keys cache : {key_cache_stats()}")
+    shutdown_verification_pool()
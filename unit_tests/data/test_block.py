@@ -7,7 +7,9 @@ from blockchain.data.transaction import Transaction
 from blockchain.data.input import Input
 from blockchain.data.output import Output
 from blockchain.data.block import Block
-from blockchain.crypto_tools import generateKeys
+from blockchain.data.block_chain import BlockChain
+from blockchain.crypto_tools import generateKeys, hash
+import tempfile
 import time
 
 
@@ -15,10 +17,10 @@ sender_private_key, sender_public_key = generateKeys()
 receiver_private_key, receiver_public_key = generateKeys()
 miner_private_key, miner_public_key = generateKeys()
 
-inp = Input(sender_private_key, sender_public_key, 100)
-
 outp = Output(receiver_public_key, 100)
 
+inp = Input(sender_private_key, sender_public_key, 100, hash(b"previous"), 0, [outp])
+
 
 
 print(inp)
@@ -34,19 +36,20 @@ block.sign(miner_private_key)
 
 # Show that if someone temper with the transaction, we will detect it
 print("Valid input" if inp.verify() else "Invalid Input")
-print("Valid transaction" if transaction.verify() else "Invalid transaction")
+print("Valid transaction" if transaction.verify(miner_public_key) else "Invalid transaction")
 # Let's save our block
-block.save("./ledgers/ledger")
+block_chain = BlockChain(tempfile.mkdtemp())
+block.save(block_chain)
 print("Valid block" if block.verify() else "Invalid block")
 
 
 
 inp.amount+=1
 print("Valid Input" if inp.verify() else "Invalid Input")
-print("Valid transaction" if transaction.verify() else "Invalid transaction")
+print("Valid transaction" if transaction.verify(miner_public_key) else "Invalid transaction")
 print("Valid block" if block.verify() else "Invalid block")
 
 # Now load the saved block
-block.load("./ledgers/ledger",0)
+block.load(block_chain,0)
 # Retest validity of the block
 print("Valid block" if block.verify() else "Invalid block")
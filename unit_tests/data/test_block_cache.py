@@ -0,0 +1,61 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a ledger of blocks holding many transactions with a small block cache, reads the recent blocks,
+#               then reads random old blocks several times, iterates over the whole ledger and reopens it
+# Expected behaviour : The recent blocks are pinned and never read again from the disk, the cache never grows beyond its size,
+#                      repeated reads are hits, iteration and reopened ledgers give the same blocks as the ones written
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.block_chain import BlockChain
+from blockchain.crypto_tools import generateKeys, hash
+import random
+import tempfile
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+outputs = [Output(miner_public_key, 10)]
+transactions = [Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(20)]
+for transaction in transactions:
+    transaction.sign(miner_private_key)
+
+path = tempfile.mkdtemp()
+block_chain = BlockChain(path, cache_size=200*1024, pinned_blocks=8)
+hashes = []
+prevH = hash(b"")
+for i in range(200):
+    block = Block(i, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, prevH)
+    block.sign(miner_private_key)
+    block_chain.append(block)
+    hashes.append(block.hash)
+    prevH = block.hash
+ledger = block_chain.blocks
+block_size = block_chain._read_index_entry(0)[2]
+
+recent_ok = all(ledger[-i].hash == hashes[-i] for i in range(1, 9))
+stats = ledger.stats()
+print(f"Recent blocks : {'OK' if recent_ok else 'WRONG'}, {stats['pinned_blocks']} pinned, {stats['misses']} read from disk (expected 8 pinned, 0 read)")
+
+random.seed(0)
+old_ids = random.sample(range(0, 150), 10)
+for _ in range(5):
+    for block_id in old_ids:
+        if ledger[block_id].hash != hashes[block_id]:
+            print(f"Wrong block {block_id}")
+stats = ledger.stats()
+print(f"Old blocks : {stats['misses']} misses, hit rate {stats['hit_rate']:.2f} (expected 10 misses)")
+
+for block_id in range(0, 192):
+    ledger[block_id]
+stats = ledger.stats()
+print(f"After reading every block : {stats['cached_blocks']} cached blocks, {stats['size']} bytes (limit {stats['max_size']}, about {stats['max_size'] // block_size} blocks), {stats['evictions']} evictions")
+print("Cache bounded" if stats['size'] <= stats['max_size'] else "Cache NOT bounded")
+
+print("Iteration OK" if [block.hash for block in ledger] == hashes else "Iteration WRONG")
+print(f"Slice : {[block.id for block in ledger[-3:]]} (expected [197, 198, 199])")
+block_chain.close()
+
+with BlockChain(path) as block_chain:
+    print("Reopened ledger OK" if all(block_chain.blocks[i].hash == hashes[i] for i in [0, 100, 199]) else "Reopened ledger WRONG")
@@ -0,0 +1,98 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Tests appending blocks to a segmented ledger, reading them back one by one and sequentially, then reopening the ledger.
+#               Then simulates crashes : a ledger reopened without being closed after blocks were written but not synced, and a ledger
+#               whose index lost the entries written after the last sync while their segments stayed on disk, then appends more blocks
+# Expected behaviour : Every block is read back with the right hash, the tip and the hash index follow the appends, the ledger survives a reopen
+#                      and a block with a wrong id is refused. Written blocks survive a crash, and blocks appended after a crash never
+#                      land after the data of dropped blocks
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.block_chain import BlockChain, TIP, INDEX_ENTRY
+from blockchain.crypto_tools import generateKeys, hash
+import tempfile
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+
+def build_blocks(start, count, prevH):
+    blocks = []
+    for i in range(start, start + count):
+        block = Block(i, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [], prevH)
+        block.sign(miner_private_key)
+        blocks.append(block)
+        prevH = block.hash
+    return blocks
+
+def read_back(block_chain, blocks):
+    return len(block_chain) == len(blocks) and all(block_chain.get_block(b.id).hash == b.hash == block_chain.block_hash(b.id) for b in blocks)
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    # Small segments to force the ledger to roll over multiple segment files
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    prevH = hash(b"")
+    hashes = []
+    for i in range(50):
+        block = Block(i, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [], prevH)
+        block.sign(miner_private_key)
+        block_chain.append(block)
+        hashes.append(block.hash)
+        prevH = block.hash
+
+    print(f"Ledger length : {len(block_chain)}")
+    print("Random read OK" if block_chain.get_block(17).hash==hashes[17] else "Random read FAILED")
+    print("Sequential read OK" if [b.hash for b in block_chain.iter_blocks()]==hashes else "Sequential read FAILED")
+    print("Partial sequential read OK" if [b.hash for b in block_chain.iter_blocks(10, 20)]==hashes[10:20] else "Partial sequential read FAILED")
+    print("Tip OK" if block_chain.height==49 and block_chain.tip_hash==hashes[-1] else "Tip FAILED")
+    print("Hash index OK" if block_chain.height_of(hashes[23])==23 and block_chain.block_hash(23)==hashes[23] else "Hash index FAILED")
+    block_chain.close()
+
+    # Reopen the ledger
+    block_chain = BlockChain(ledger_dir, segment_size=4096)
+    print("Reopen OK" if block_chain.height==49 and block_chain.tip_hash==hashes[49] and block_chain.get_block(49).hash==hashes[49] else "Reopen FAILED")
+    try:
+        block_chain.append(Block(3, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [], prevH))
+        print("Wrong block id accepted")
+    except ValueError as ex:
+        print(f"Wrong block id refused : {ex}")
+    block_chain.close()
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    # Crash after the blocks were written (flushed) but not synced : they are kept
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    blocks = build_blocks(0, 40, hash(b""))
+    for block in blocks:
+        block_chain.append(block)
+    block_chain.flush()
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    print(f"Unsynced blocks kept after a crash : {block_chain.height} (expected 39)")
+    blocks += build_blocks(40, 40, blocks[-1].hash)
+    for block in blocks[40:]:
+        block_chain.append(block)
+    print("Blocks after the crash read back OK" if read_back(block_chain, blocks) else "Blocks after the crash read back FAILED")
+    block_chain.close()
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    # Crash where the index entries after the last sync were lost but the segments were written
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    blocks = build_blocks(0, 40, hash(b""))
+    for block in blocks:
+        block_chain.append(block)
+    block_chain.flush()
+    with open(f"{ledger_dir}/tip.dat", "rb") as f:
+        synced = TIP.unpack(f.read())[0] + 1
+    with open(f"{ledger_dir}/index.dat", "r+b") as f:
+        f.truncate(synced * INDEX_ENTRY.size)
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    print(f"Ledger back to its last sync : {block_chain.height} (expected {synced - 1})")
+    # Blocks appended again (other blocks than the lost ones) must be read back, never the stale records
+    blocks = blocks[:synced] + build_blocks(synced, 80 - synced, blocks[synced - 1].hash)
+    for block in blocks[synced:]:
+        block_chain.append(block)
+    print("Blocks after the lost index read back OK" if read_back(block_chain, blocks) else "Blocks after the lost index read back FAILED")
+    block_chain.close()
+    block_chain = BlockChain(ledger_dir, segment_size=4096, sync_every=8)
+    print("Reopened ledger OK" if read_back(block_chain, blocks) and block_chain.check_integrity(full=True) is None else "Reopened ledger FAILED")
+    block_chain.close()
@@ -0,0 +1,60 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a ledger of blocks holding many transactions, then reads them through the memory mapped block reader :
+#               raw data, lazy blocks (header only, then transactions) and blocks appended after the reader was built.
+#               The time to read the hash of every block lazily is compared with decoding every block
+# Expected behaviour : Raw data matches the ledger records, lazy headers don't decode the transactions, new blocks are readable and lazy headers are faster
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.block_chain import BlockChain
+from blockchain.data.block_reader import BlockReader
+from blockchain.crypto_tools import generateKeys, hash
+import tempfile
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+outputs = [Output(miner_public_key, 10)]
+transactions = [Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(50)]
+for transaction in transactions:
+    transaction.sign(miner_private_key)
+
+def append_blocks(block_chain, count):
+    prevH = block_chain.tip_hash if block_chain.height>=0 else hash(b"")
+    for i in range(len(block_chain), len(block_chain) + count):
+        block = Block(i, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, prevH)
+        block.sign(miner_private_key)
+        block_chain.append(block)
+        prevH = block.hash
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    block_chain = BlockChain(ledger_dir, segment_size=256*1024)
+    append_blocks(block_chain, 100)
+    reader = BlockReader(block_chain)
+
+    print("Raw data OK" if all(bytes(reader.raw(i))==block_chain.read_raw(i) for i in range(len(block_chain))) else "Raw data FAILED")
+
+    lazy_block = reader.get(42)
+    print(f"Lazy block {lazy_block.id} hash {lazy_block.hash}")
+    print("Transactions not decoded" if lazy_block._block is None else "Transactions decoded")
+    print(f"Lazy block transactions : {len(lazy_block.transactions)} (expected 50)")
+    print("Lazy block valid" if lazy_block.verify() and lazy_block.hash==block_chain.block_hash(42) else "Lazy block invalid")
+
+    # Blocks appended after the segments were mapped
+    append_blocks(block_chain, 20)
+    print("New blocks OK" if reader.get(119).hash==block_chain.tip_hash else "New blocks FAILED")
+
+    start = time.perf_counter()
+    hashes = [reader.get(i).hash for i in range(len(block_chain))]
+    lazy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    full_hashes = [block_chain.get_block(i).hash for i in range(len(block_chain))]
+    full_time = time.perf_counter() - start
+    print(f"Block hashes : lazy {lazy_time*1000:.1f}ms, full decode {full_time*1000:.1f}ms ({'same' if hashes==full_hashes else 'DIFFERENT'} hashes)")
+
+    del lazy_block, hashes
+    reader.close()
+    block_chain.close()
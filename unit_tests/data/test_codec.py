@@ -0,0 +1,84 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Encodes a signed block and its compact version, then encodes them again after changing the hash of a transaction,
+#               the hash of the block or the previous block hash (a peer lying about the hashes). Encodes a transaction paying a fee
+#               and a copy with another fee. Then decodes malformed data : fields of the wrong type and deeply nested lists
+# Expected behaviour : The untouched data is decoded with the same hashes, every tampered version is refused when decoded,
+#                      malformed data raises CodecError
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.compact_block import CompactBlock
+from blockchain.data.codec import encode, decode, CodecError, TAG_LIST, TAG_NONE
+from blockchain.crypto_tools import generateKeys, hash
+import copy
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+outputs = [Output(miner_public_key, 10)]
+transaction = Transaction(0, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), 0, outputs)], outputs)
+transaction.sign(miner_private_key)
+block = Block(0, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [transaction])
+block.sign(miner_private_key)
+
+decoded = decode(encode(block))
+print(f"Block decoded with the same hashes : {decoded.hash == block.hash and decoded.transactions[0].hash == transaction.hash}")
+print(f"Decoded block is valid : {decoded.verify(use_signature_cache=False)}")
+
+def refused(value):
+    try:
+        decode(encode(value))
+        return False
+    except CodecError:
+        return True
+
+tampered = copy.deepcopy(block)
+tampered.transactions[0].hash = bytes([0x11]*32)
+print(f"Transaction with a tampered hash refused : {refused(tampered)}")
+
+tampered = copy.deepcopy(block)
+tampered.hash = bytes(32)
+print(f"Block with a tampered hash refused : {refused(tampered)}")
+
+tampered = copy.deepcopy(block)
+tampered.prevH = bytes([0x22]*32)
+print(f"Block with a tampered previous hash refused : {refused(tampered)}")
+
+outputs = [Output(miner_public_key, 8)]
+paying = Transaction(1, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), 1, outputs, fee=2)], outputs, fee=2)
+decoded = decode(encode(paying))
+print(f"Transaction paying a fee decoded : fee {decoded.fee}, same hash {decoded.hash == paying.hash} (expected 2, True)")
+tampered = copy.deepcopy(paying)
+tampered.fee = 5
+print(f"Transaction with a tampered fee refused : {refused(tampered)}")
+
+compact_block = CompactBlock(block)
+print(f"Compact block decoded with the same hash : {decode(encode(compact_block)).hash == block.hash}")
+compact_block.hash = bytes(32)
+print(f"Compact block with a tampered hash refused : {refused(compact_block)}")
+
+def error_of(data):
+    try:
+        decode(data)
+        return None
+    except Exception as ex:
+        return type(ex).__name__
+
+tampered = copy.deepcopy(transaction)
+tampered.inputs[0].prev_tx_hash = 12
+print(f"Input with a number as previous transaction hash : {error_of(encode(tampered))} (expected CodecError)")
+tampered = copy.deepcopy(transaction)
+tampered.inputs[0].public_key = [1, 2]
+print(f"Input with a list as public key : {error_of(encode(tampered))} (expected CodecError)")
+tampered = copy.deepcopy(transaction)
+tampered.outputs[0].amount = "10"
+print(f"Output with a text as amount : {error_of(encode(tampered))} (expected CodecError)")
+tampered = copy.deepcopy(block)
+tampered.hash = "not a hash"
+print(f"Block with a text as hash : {error_of(encode(tampered))} (expected CodecError)")
+print(f"Lists nested 100000 levels deep : {error_of(bytes([TAG_LIST, 1])*100000 + bytes([TAG_NONE]))} (expected CodecError)")
+print(f"Lists nested 10 levels deep : {decode(encode([[[[[[[[[[1]]]]]]]]]]))} (expected [[[[[[[[[[1]]]]]]]]]])")
@@ -0,0 +1,41 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a signed block of 20 transactions and its compact version. A pending pool holding 15 of the transactions rebuilds the block,
+#               the 5 missing transactions are then given to it
+# Expected behaviour : 5 transactions are missing, the rebuilt block is valid and has the hash of the original one, the compact block is much smaller
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.mempool import MemPool
+from blockchain.data.compact_block import CompactBlock
+from blockchain.data.codec import encode, decode
+from blockchain.crypto_tools import generateKeys, hash
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+outputs = [Output(miner_public_key, 10)]
+transactions = [Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(20)]
+mempool = MemPool()
+for transaction in transactions[:15]:
+    mempool.add(transaction)
+
+# The miner signs the transactions it validates
+block = Block(0, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [Transaction(t.id, t.timestamp, t.inputs, t.outputs) for t in transactions])
+for transaction in block.transactions:
+    transaction.sign(miner_private_key)
+block.sign(miner_private_key)
+
+compact_block = decode(encode(CompactBlock(block)))
+print(f"Block size : {len(encode(block))} bytes, compact block size : {len(encode(compact_block))} bytes")
+
+rebuilt_transactions, missing = compact_block.reconstruct(mempool)
+print(f"Missing transactions : {missing} (expected [15, 16, 17, 18, 19])")
+print("Missing transactions accepted" if compact_block.fill(rebuilt_transactions, missing, [decode(encode(block.transactions[i])) for i in missing]) else "Missing transactions refused")
+rebuilt = compact_block.to_block(rebuilt_transactions)
+print("Valid rebuilt block" if rebuilt.verify() and rebuilt.hash==block.hash else "Invalid rebuilt block")
+
+print("Wrong transactions refused" if not compact_block.fill(rebuilt_transactions, missing, [block.transactions[0]]*5) else "Wrong transactions accepted")
@@ -3,11 +3,12 @@
 # Description : Tests building a simple input for a transaction and verifying it and testing it against malicious data change
 
 from blockchain.data.input import Input
-from blockchain.crypto_tools import generateKeys
+from blockchain.data.output import Output
+from blockchain.crypto_tools import generateKeys, hash
 
 private_key, public_key = generateKeys()
 
-inp = Input(private_key, public_key, 100)
+inp = Input(private_key, public_key, 100, hash(b"previous"), 0, [Output(public_key, 100)])
 print(inp)
 print("Valid" if inp.verify() else "Unvalid")
 
@@ -0,0 +1,57 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a ledger of signed blocks and checks its integrity, then adds blocks and checks again (only the new blocks are checked).
+#               Finally a ledger with a tampered block is checked
+# Expected behaviour : The ledger is valid, the second check starts after the checkpoint and the tampered block is reported
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.block_chain import BlockChain
+from blockchain.crypto_tools import generateKeys, hash
+import tempfile
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+def build_blocks(block_chain, count):
+    prevH = block_chain.tip_hash if block_chain.height>=0 else hash(b"")
+    for i in range(len(block_chain), len(block_chain) + count):
+        outputs = [Output(miner_public_key, 10)]
+        transaction = Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], outputs)
+        transaction.sign(miner_private_key)
+        block = Block(i, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [transaction], prevH)
+        block.sign(miner_private_key)
+        block_chain.append(block)
+        prevH = block.hash
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    block_chain = BlockChain(ledger_dir)
+    build_blocks(block_chain, 20)
+    print(f"First check : {block_chain.check_integrity(window=8)} (expected None)")
+    print(f"Verified height : {block_chain.verified_height()} (expected 19)")
+    build_blocks(block_chain, 5)
+    print(f"Second check : {block_chain.check_integrity(window=8)} (expected None)")
+    print(f"Verified height : {block_chain.verified_height()} (expected 24)")
+    block_chain.close()
+
+with tempfile.TemporaryDirectory() as ledger_dir:
+    block_chain = BlockChain(ledger_dir)
+    build_blocks(block_chain, 10)
+    # Tamper with block 6 : the amount is changed and the hashes are recomputed, only the signatures can tell
+    prevH = block_chain.block_hash(5)
+    tampered = BlockChain(tempfile.mkdtemp())
+    for block in block_chain.iter_blocks():
+        if block.id == 6:
+            block.transactions[0].outputs[0].amount = 1000
+            block.transactions[0].inputs[0].amount = 1000
+        block.prevH = prevH if block.id > 6 else block.prevH
+        block.hash = hash(block.serialize())
+        prevH = block.hash
+        tampered.append(block)
+    print(f"Tampered check : {tampered.check_integrity(window=4)} (expected 6)")
+    print(f"Verified height : {tampered.verified_height()} (expected 3)")
+    tampered.close()
+    block_chain.close()
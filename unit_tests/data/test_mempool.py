@@ -0,0 +1,69 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Tests the pending transactions pool. Adds transactions paying different fees, a duplicate and a conflicting spend,
+#               selects the block content, fills a small pool to force evictions and reloads the pool from its journal
+# Expected behaviour : The duplicate and the conflicting spend are refused, the selection is ordered by fee, the lowest fees are evicted
+#                      first, the reloaded pool holds the same transactions and fees, and an older pickled journal is not loaded
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.mempool import MemPool
+from blockchain.crypto_tools import generateKeys, hash
+from pathlib import Path
+import pickle
+import tempfile
+import time
+
+
+sender_private_key, sender_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+
+def build_transaction(id, fee, prev_index=None):
+    # Each transaction spends 100 coins from its own output of a fake previous transaction
+    outputs = [Output(receiver_public_key, 100 - fee)]
+    inp = Input(sender_private_key, sender_public_key, 100, hash(b"previous"), id if prev_index is None else prev_index, outputs, fee=fee)
+    return Transaction(id, time.time(), [inp], outputs, fee=fee)
+
+journal = Path(tempfile.mkdtemp())/"pending.journal"
+mempool = MemPool(journal)
+
+transactions = [build_transaction(i, fee) for i, fee in enumerate([1, 5, 3, 0])]
+print(f"Balanced with their fee : {all(t.verify_amounts() for t in transactions)} (expected True)")
+outputs = [Output(receiver_public_key, 90)]
+unstated = Transaction(20, time.time(), [Input(sender_private_key, sender_public_key, 100, hash(b"previous"), 20, outputs)], outputs)
+print(f"Fee not stated balanced : {unstated.verify_amounts()} (expected False)")
+for transaction in transactions:
+    print(f"Add transaction {transaction.id} : {mempool.add(transaction)}")
+print(f"Add duplicate : {mempool.add(transactions[0])} (expected False)")
+print(f"Add conflicting spend : {mempool.add(build_transaction(10, 2, prev_index=1))} (expected False)")
+
+print(f"Selection order : {[t.id for t in mempool.select()]} (expected [1, 2, 0, 3])")
+print(f"Best two : {[t.id for t in mempool.select(max_count=2)]} (expected [1, 2])")
+
+# Once transaction 1 is in a block it leaves the pool and its output can't be spent by anyone else
+block = Block(0, coinbase=Transaction(0, time.time(), [], []), transactions=[transactions[1]])
+mempool.remove_block(block)
+print(f"Pending after block : {sorted(t.id for t in mempool)} (expected [0, 2, 3])")
+
+# Reload from the journal
+reloaded = MemPool(journal)
+print("Reloaded pool is identical" if set(reloaded.transactions) == set(mempool.transactions) else "Reloaded pool differs")
+mempool.close()
+reloaded = MemPool(journal)
+print("Compacted pool is identical" if set(reloaded.transactions) == set(mempool.transactions) else "Compacted pool differs")
+print(f"Reloaded fees : {sorted(reloaded.get(h).fee for h in reloaded.transactions)} (expected [0, 1, 3])")
+
+# A journal of pickled entries (older versions) is never unpickled, it is set aside
+legacy = Path(tempfile.mkdtemp())/"pending.journal"
+with open(legacy, "wb") as f:
+    pickle.dump(("add", transactions[0], 1), f)
+print(f"Older journal : {len(MemPool(legacy))} transactions loaded, set aside {legacy.with_name(legacy.name + '.legacy').exists()} (expected 0, True)")
+
+# A pool that can only hold two transactions keeps the best ones
+size = mempool.entries[transactions[0].hash][1]
+small = MemPool(max_size=2*size)
+for transaction in transactions:
+    small.add(transaction)
+print(f"Kept after eviction : {sorted(t.id for t in small)} (expected [1, 2])")
@@ -0,0 +1,33 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds blocks with different numbers of transactions, builds the inclusion proof of every transaction and checks it against the block header.
+#               Then checks a proof against the wrong transaction and tampers with a transaction of a signed block
+# Expected behaviour : All proofs are valid and short, the proof of the wrong transaction is refused and the tampered block is invalid
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.crypto_tools import generateKeys, hash
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+outputs = [Output(miner_public_key, 10)]
+transactions = [Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(13)]
+for transaction in transactions:
+    transaction.sign(miner_private_key)
+
+for count in [1, 2, 3, 7, 8, 13]:
+    block = Block(0, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions[:count])
+    proofs = [block.build_proof(i) for i in range(count)]
+    valid = all(block.verify_proof(transactions[i], proofs[i]) for i in range(count))
+    print(f"{count} transactions : {'all proofs valid' if valid else 'INVALID PROOF'}, longest proof {max(len(p) for p in proofs)} hashes")
+
+print("Wrong transaction accepted" if block.verify_proof(transactions[1], proofs[0]) else "Wrong transaction refused")
+
+block.sign(miner_private_key)
+print("Valid block" if block.verify() else "Invalid block")
+block.transactions[3].outputs[0].public_key = block.transactions[3].inputs[0].public_key
+print("Valid block" if block.verify() else "Invalid block (tampered transaction)")
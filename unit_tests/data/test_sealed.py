@@ -0,0 +1,59 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a block of signed transactions, checks that their serialized bytes are built once and reused,
+#               then changes an input, the list of outputs of a transaction and a block field, and saves and decodes the objects
+# Expected behaviour : The cached bytes are reused, every change drops the caches that depend on it and the block becomes invalid,
+#                      restoring the change makes the block valid again, and saved/decoded objects have the same bytes
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.codec import encode, decode
+from blockchain.crypto_tools import generateKeys, hash
+import pickle
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+outputs = [Output(miner_public_key, 10)]
+transactions = [Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], list(outputs)) for i in range(5)]
+for transaction in transactions:
+    transaction.sign(miner_private_key)
+block = Block(1, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, hash(b"genesis"))
+block.sign(miner_private_key)
+block.seal()
+
+print(f"Sealed : {block.sealed and all(t.sealed for t in transactions)} (expected True)")
+print(f"Bytes reused : {transactions[0].serialize() is transactions[0].serialize() and block.serialize() is block.serialize()} (expected True)")
+print("Valid block" if block.verify() else "Invalid block")
+
+# Changing an input drops its cache, the transaction sees it and builds its bytes again
+inp = transactions[2].inputs[0]
+inp.amount += 1
+print(f"After input change : input sealed {inp.sealed}, transaction sealed {transactions[2].sealed} (expected False, False)")
+print("Valid block" if block.verify() else "Invalid block (changed input)")
+inp.amount -= 1
+print("Valid block" if block.verify() else "Invalid block")
+
+# Lists are not watched, the owner is invalidated explicitly
+transactions[3].outputs.append(Output(sender_public_key, 1))
+transactions[3].invalidate()
+print("Valid block" if block.verify() else "Invalid block (changed outputs)")
+transactions[3].outputs.pop()
+transactions[3].invalidate()
+
+# The signature is not part of the bytes, the previous block hash is
+transactions[4].sign(miner_private_key)
+print(f"After signing : transaction sealed {transactions[4].sealed} (expected True)")
+block.prevH = hash(b"other")
+print("Valid block" if block.verify() else "Invalid block (changed header)")
+block.prevH = hash(b"genesis")
+print("Valid block" if block.verify() else "Invalid block")
+
+# Saved and decoded objects don't carry the cache but build the same bytes
+copy = pickle.loads(pickle.dumps(transactions[0]))
+print(f"Pickled transaction : sealed {copy.sealed}, same bytes {copy.serialize() == transactions[0].serialize()} (expected False, True)")
+decoded = decode(encode(block))
+print(f"Decoded block : same bytes {decoded.serialize() == block.serialize()}, {'valid' if decoded.verify() else 'invalid'} (expected True, valid)")
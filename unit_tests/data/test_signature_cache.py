@@ -0,0 +1,78 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a block of signed transactions, remembers some of them as verified (like the admission of the pending pool does)
+#               and checks the block, then changes an input signature of a remembered transaction, then sends a transaction whose content
+#               changed but whose hash field is the one of a remembered transaction, then looks up a remembered transaction whose
+#               input signature lost its RSA tag, then fills a small cache beyond its size. The key of a transaction is looked up twice
+# Expected behaviour : Input signatures of the remembered transactions are left out of the block check, the block stays valid,
+#                      any change of the content or of a signature is checked again and makes the block invalid, both encodings of an RSA signature
+#                      are the same entry, the cache stays bounded and the key is only built once
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.codec import encode, decode
+from blockchain.data.signature_cache import SignatureCache, verified_signatures
+from blockchain.crypto_tools import generateKeys, hash
+import time
+
+miner_private_key, miner_public_key = generateKeys()
+sender_private_key, sender_public_key = generateKeys()
+
+def build_transaction(i):
+    outputs = [Output(miner_public_key, 10)]
+    transaction = Transaction(i, time.time(), [Input(sender_private_key, sender_public_key, 10, hash(b"previous"), i, outputs)], outputs)
+    transaction.sign(miner_private_key)
+    return transaction
+
+def build_block(transactions):
+    block = Block(1, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), transactions, hash(b"genesis"))
+    block.sign(miner_private_key)
+    return block
+
+transactions = [build_transaction(i) for i in range(10)]
+block = build_block(transactions)
+verified_signatures.clear()
+print(f"Checks without cache : {len(block.signature_checks(True))} (expected 21)")
+for transaction in transactions[:6]:
+    verified_signatures.add(transaction)
+print(f"Checks with 6 remembered transactions : {len(block.signature_checks(True))} (expected 15)")
+print("Valid block" if block.verify() else "Invalid block")
+print(f"Full check : {len(block.signature_checks())} checks (expected 21)")
+print(f"Stats : {verified_signatures.stats()}")
+
+# A remembered transaction received again from a peer (decoded) is still found
+received = decode(encode(transactions[0]))
+print(f"Decoded transaction found : {received in verified_signatures} (expected True)")
+
+# The key is kept on the transaction until its bytes or signatures change
+key = SignatureCache.key(transactions[1])
+print(f"Key kept on the transaction : {SignatureCache.key(transactions[1]) is key} (expected True)")
+
+# Other input signature : checked again
+signature = transactions[1].inputs[0].signature
+transactions[1].inputs[0].signature = transactions[7].inputs[0].signature
+print(f"Changed signature found : {transactions[1] in verified_signatures} (expected False)")
+print("Valid block" if block.verify() else "Invalid block (changed signature)")
+transactions[1].inputs[0].signature = signature
+
+# The same input signature without its RSA tag (old encoding) : the same entry
+untagged = decode(encode(transactions[0]))
+untagged.inputs[0].signature = untagged.inputs[0].signature[1:]
+print(f"Untagged signature found : {untagged in verified_signatures} (expected True)")
+
+# Same hash field and signatures but another content : checked again
+forged = decode(encode(transactions[2]))
+forged.inputs[0].amount = 20
+forged.outputs = [Output(sender_public_key, 20)]
+forged.invalidate()
+forged.sign(miner_private_key)
+print(f"Forged transaction found : {forged in verified_signatures} (expected False)")
+forged_block = build_block([forged] + transactions[3:6])
+print("Valid block" if forged_block.verify() else "Invalid block (forged transaction)")
+
+cache = SignatureCache(max_size=4)
+for transaction in transactions:
+    cache.add(transaction)
+print(f"Small cache : {len(cache)} entries, oldest forgotten {transactions[0] not in cache}, newest kept {transactions[-1] in cache} (expected 4, True, True)")
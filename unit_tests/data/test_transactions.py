@@ -1,20 +1,21 @@
 # Unit test :
 # Author : ParisNeo
-# Description : Tests building a simple input for a transaction and verifying it and testing it against malicious data change
+# Description : Tests building a simple input for a transaction and verifying it and testing it against malicious data change,
+#               and against its signed input moved to another transaction
 
 from blockchain.data.transaction import Transaction
 from blockchain.data.input import Input
 from blockchain.data.output import Output
-from blockchain.crypto_tools import generateKeys
+from blockchain.crypto_tools import generateKeys, hash
 import time
 sender_private_key, sender_public_key = generateKeys()
 receiver_private_key, receiver_public_key = generateKeys()
 miner_private_key, miner_public_key = generateKeys()
 
-inp = Input(sender_private_key, sender_public_key, 100)
-
 outp = Output(receiver_public_key, 100)
 
+inp = Input(sender_private_key, sender_public_key, 100, hash(b"previous"), 0, [outp])
+
 
 
 print(inp)
@@ -31,3 +32,10 @@ print("Valid transaction" if transaction.verify(miner_public_key) else "Unvalid
 inp.amount+=1
 print("Valid Input" if inp.verify() else "Unvalid Input")
 print("Valid transaction" if transaction.verify(miner_public_key) else "Unvalid transaction")
+inp.amount-=1
+
+# A relay moves the signed input into a transaction paying itself
+relay_private_key, relay_public_key = generateKeys()
+redirected = Transaction(0, time.time(), [inp], [Output(relay_public_key, 100)])
+redirected.sign(relay_private_key)
+print("Valid redirected transaction" if redirected.verify(relay_public_key) else "Unvalid redirected transaction")
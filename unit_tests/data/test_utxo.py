@@ -0,0 +1,78 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Tests the unspent outputs set. A miner gets a coinbase, spends it to a receiver, then the receiver tries to spend the same output twice.
+#               The last block is rolled back, the set is reloaded from disk then rolled back to a given height or emptied
+# Expected behaviour : Balances follow the blocks, the double spend is refused, the rollback gives the coins back to the miner, the reloaded set is identical
+#                      and a rollback deeper than the undo information is refused
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.utxo import UTXOSet
+from blockchain.crypto_tools import generateKeys, publicKey2Text
+import tempfile
+import time
+
+
+miner_private_key, miner_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+
+path = tempfile.mkdtemp()
+utxo = UTXOSet(path)
+
+# Block 0 : the miner gets 10 coins
+coinbase = Transaction(0, time.time(), [], [Output(miner_public_key, 10)])
+block0 = Block(0, coinbase=coinbase, transactions=[])
+utxo.apply_block(block0)
+print(f"Miner balance after block 0 : {utxo.balance(publicKey2Text(miner_public_key))} (expected 10)")
+
+# Block 1 : the miner gives 7 coins to the receiver and keeps 3
+outputs = [Output(receiver_public_key, 7), Output(miner_public_key, 3)]
+inp = Input(miner_private_key, miner_public_key, 10, coinbase.hash, 0, outputs)
+transaction = Transaction(1, time.time(), [inp], outputs)
+print("Valid inputs" if utxo.check_inputs(transaction.inputs) else "Invalid inputs")
+block1 = Block(1, coinbase=Transaction(0, time.time(), [], []), transactions=[transaction])
+utxo.apply_block(block1)
+print(f"Miner balance after block 1 : {utxo.balance(publicKey2Text(miner_public_key))} (expected 3)")
+print(f"Receiver balance after block 1 : {utxo.balance(publicKey2Text(receiver_public_key))} (expected 7)")
+
+# The miner output of block 0 is spent now
+print("Valid inputs" if utxo.check_inputs(transaction.inputs) else "Invalid inputs (already spent)")
+
+# The receiver tries to spend the same output twice
+outputs = [Output(miner_public_key, 7)]
+inp = Input(receiver_private_key, receiver_public_key, 7, transaction.hash, 0, outputs)
+print("Valid inputs" if utxo.check_inputs([inp, inp]) else "Invalid inputs (double spend)")
+double_spend = Block(2, coinbase=Transaction(0, time.time(), [], []), transactions=[
+    Transaction(2, time.time(), [inp], outputs),
+    Transaction(3, time.time(), [inp], outputs)
+])
+try:
+    utxo.apply_block(double_spend)
+    print("Double spend block accepted")
+except ValueError as ex:
+    print(f"Double spend block refused : {ex}")
+print(f"Receiver balance : {utxo.balance(publicKey2Text(receiver_public_key))} (expected 7)")
+
+# Undo block 1
+utxo.rollback_block()
+print(f"Miner balance after rollback : {utxo.balance(publicKey2Text(miner_public_key))} (expected 10)")
+print(f"Receiver balance after rollback : {utxo.balance(publicKey2Text(receiver_public_key))} (expected 0)")
+utxo.apply_block(block1)
+
+# Reload from the journal
+reloaded = UTXOSet(path)
+print("Reloaded set is identical" if reloaded.outputs == utxo.outputs and reloaded.height == utxo.height else "Reloaded set differs")
+utxo.close()
+reloaded = UTXOSet(path)
+print("Reloaded snapshot is identical" if reloaded.outputs == utxo.outputs and reloaded.height == utxo.height else "Reloaded snapshot differs")
+
+# Back to a lower height (the ledger lost its last blocks), then further than the undo information goes
+print(f"Rolled back to block 0 : {reloaded.rollback_to(0)}, miner balance {reloaded.balance(publicKey2Text(miner_public_key))} (expected True, 10)")
+shallow = UTXOSet(undo_depth=1)
+for block in [block0, block1]:
+    shallow.apply_block(block)
+print(f"Rolled back to block -1 with one undo entry : {shallow.rollback_to(-1)}, height {shallow.height} (expected False, 1)")
+shallow.clear()
+print(f"Cleared set : {len(shallow)} outputs, height {shallow.height} (expected 0, -1)")
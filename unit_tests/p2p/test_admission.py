@@ -0,0 +1,79 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Mines a few blocks, then submits to the admission pipeline of the node (as if they came from peers) transactions
+#               spending the coinbases, mixed with a transaction with a bad signature, one with amounts that don't match,
+#               a double spend, an encoded transaction, two transactions whose hash was changed (decoded and encoded), one whose
+#               input signature has no scheme tag and one whose signed input was moved by a relay into a transaction paying it.
+#               Then floods a pipeline whose threads are not running
+# Expected behaviour : Only the valid transactions reach the pending pool, each refused one is counted in the stage that refused it,
+#                      and submitting to a full pipeline returns right away and drops the transactions
+from blockchain import BlockChainNode
+from blockchain.p2p.admission import AdmissionPipeline
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.codec import Encoded, encode
+from blockchain.crypto_tools import generateKeys
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=46300,type=int)
+parser.add_argument('-n', "--blocks", default=20,type=int)
+args = parser.parse_args()
+
+work_dir = Path(tempfile.mkdtemp())
+with open(work_dir/"nodes.txt","w") as f:
+    f.write("")
+miner_private_key, miner_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+miner = BlockChainNode(miner_private_key, miner_public_key, "Node0", args.addr, args.port,
+                       known_nodes_file_name=work_dir/"nodes.txt", ledger_dir=work_dir/"ledger", pending_transactions_file_name=work_dir/"pending.journal",
+                       admission_batch_size=8)
+coinbases = [miner.ledger[0].coinbase] + [miner.validate_transactions().coinbase for _ in range(args.blocks)]
+
+def spend(coinbase, signer=miner_private_key, amount=None):
+    value = coinbase.outputs[0].amount
+    outputs = [Output(receiver_public_key, value if amount is None else amount)]
+    return Transaction(1, time.time(), [Input(signer, miner_public_key, value, coinbase.hash, 0, outputs)], outputs)
+
+valid = [spend(coinbase) for coinbase in coinbases[:-4]]
+bad_signature = spend(coinbases[-4], signer=receiver_private_key)
+bad_amount = spend(coinbases[-3], amount=1)
+double_spend = spend(coinbases[0])
+encoded = spend(coinbases[-2])
+forged = spend(coinbases[-1])
+forged.hash = bytes(32)
+# Valid signature but without its RSA tag (only accepted in old blocks)
+untagged = spend(coinbases[-1])
+untagged.inputs[0].signature = untagged.inputs[0].signature[1:]
+# The input is signed for the outputs of another transaction
+redirected = spend(coinbases[-1])
+redirected = Transaction(1, time.time(), redirected.inputs, [Output(miner_public_key, redirected.outputs[0].amount)])
+for transaction in valid + [bad_signature, bad_amount, double_spend, forged, untagged, redirected]:
+    miner.submit_transaction(transaction)
+miner.submit_transaction(encode(encoded))
+miner.submit_transaction(Encoded(encode(forged)))
+valid.append(encoded)
+
+deadline = time.time() + 20
+while miner.admission.stats()["insert"]["passed"] < len(valid) and time.time() < deadline:
+    time.sleep(0.05)
+
+print(f"Pending transactions : {len(miner.mempool)} (expected {len(valid)})")
+print("Valid transactions pending" if all(transaction.hash in miner.mempool for transaction in valid) else "Valid transactions NOT pending")
+print("Bad transactions refused" if all(transaction.hash not in miner.mempool for transaction in [bad_signature, bad_amount]) else "Bad transactions accepted")
+stats = miner.admission.stats()
+for name, stage in stats.items():
+    print(f"{name:<7} : {stage}")
+print(f"Refused by decode, check, verify, spend : {stats['decode']['refused']}, {stats['check']['refused']}, {stats['verify']['refused']}, {stats['spend']['refused']+stats['insert']['refused']} (expected 2, 3, 1, 1)")
+
+# No threads : the queues fill up and the next transactions are dropped
+pipeline = AdmissionPipeline(miner, queue_size=4)
+start = time.perf_counter()
+submitted = [pipeline.submit(spend(coinbases[-1])) for _ in range(10)]
+print(f"Queued {sum(submitted)} of 10 in {(time.perf_counter()-start)*1000:.1f}ms (expected 4)")
+print(f"Drop rate : {pipeline.stats()['decode']['drop_rate']} (expected 0.6)")
@@ -0,0 +1,61 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds a small network : a miner and two nodes connected to it that sync its ledger.
+#               The miner receives a transaction and validates it in a new block. The transaction is announced (inventory hash first) then fetched by the other nodes,
+#               the block is sent as a compact block rebuilt from their pending pools. Then a block holding a transaction the other nodes never saw is sent
+# Expected behaviour : The transaction reaches the pending pools of the other nodes, then the blocks reach their ledgers and empty their pools
+from blockchain import BlockChainNode
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.crypto_tools import generateKeys
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=45800,type=int)
+parser.add_argument('-t', "--transport", default="threads", choices=["threads", "asyncio"])
+args = parser.parse_args()
+
+work_dir = Path(tempfile.mkdtemp())
+
+def build_node(i, private_key, public_key, known_nodes):
+    with open(work_dir/f"nodes{i}.txt","w") as f:
+        f.write("\n".join(f"{args.addr}:{port}" for port in known_nodes))
+    return BlockChainNode(private_key, public_key, f"Node{i}", args.addr, args.port+i,
+                          known_nodes_file_name=work_dir/f"nodes{i}.txt", ledger_dir=work_dir/f"ledger{i}", pending_transactions_file_name=work_dir/f"pending{i}.journal",
+                          transport=args.transport)
+
+def wait_for(condition, timeout=20):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+miner_private_key, miner_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+miner = build_node(0, miner_private_key, miner_public_key, [])
+nodes = [build_node(i, *generateKeys(), [args.port]) for i in [1, 2]]
+print("Nodes synced" if wait_for(lambda: all(node.ready for node in nodes)) else "Nodes NOT synced")
+
+# The miner spends its genesis coinbase
+coinbase = miner.ledger[0].coinbase
+outputs = [Output(receiver_public_key, coinbase.outputs[0].amount)]
+transaction = Transaction(1, time.time(), [Input(miner_private_key, miner_public_key, coinbase.outputs[0].amount, coinbase.hash, 0, outputs)], outputs)
+print(f"Transaction accepted by the miner : {miner.push_transaction(transaction)}")
+print("Transaction propagated" if wait_for(lambda: all(transaction.hash in node.mempool for node in nodes)) else "Transaction NOT propagated")
+
+block = miner.validate_transactions()
+print("Block propagated" if wait_for(lambda: all(node.block_chain.tip_hash==block.hash for node in nodes)) else "Block NOT propagated")
+print("Pending pools emptied" if all(len(node.mempool)==0 for node in nodes) else "Pending pools NOT emptied")
+# This transaction is only known by the miner, the other nodes ask for it when they get the compact block
+receiver_coinbase = block.coinbase
+outputs = [Output(receiver_public_key, receiver_coinbase.outputs[0].amount)]
+transaction = Transaction(2, time.time(), [Input(miner_private_key, miner_public_key, receiver_coinbase.outputs[0].amount, receiver_coinbase.hash, 0, outputs)], outputs)
+miner.mempool.add(transaction)
+block = miner.validate_transactions()
+print("Block with unknown transaction propagated" if wait_for(lambda: all(node.block_chain.tip_hash==block.hash for node in nodes)) else "Block with unknown transaction NOT propagated")
+print(f"Gossip stats of node 1 : {nodes[0].gossip_stats()}")
@@ -0,0 +1,55 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds two nodes holding the same ledger of validated blocks, then starts a new node that knows them.
+#               The new node fetches the block hashes then downloads the blocks from both nodes in parallel
+# Expected behaviour : The new node ends up with the same ledger (same tip hash) and is ready. The sync speed is printed
+from blockchain import BlockChainNode
+from blockchain.crypto_tools import generateKeys
+import argparse
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=45500,type=int)
+parser.add_argument('-b', "--blocks", default=300,type=int)
+parser.add_argument('-t', "--transport", default="threads", choices=["threads", "asyncio"])
+args = parser.parse_args()
+
+work_dir = Path(tempfile.mkdtemp())
+
+# The first node builds the ledger
+private_key, public_key = generateKeys()
+node0 = BlockChainNode(private_key, public_key, "Miner0", args.addr, args.port,
+                       known_nodes_file_name=work_dir/"nodes0.txt", ledger_dir=work_dir/"ledger0", pending_transactions_file_name=work_dir/"pending0.journal",
+                       transport=args.transport)
+for i in range(args.blocks):
+    node0.validate_transactions()
+node0.block_chain.sync()
+print(f"Node 0 ledger height : {node0.block_chain.height}")
+
+# The second one holds a copy of it
+shutil.copytree(work_dir/"ledger0", work_dir/"ledger1")
+with open(work_dir/"nodes1.txt","w") as f:
+    f.write(f"{args.addr}:{args.port}")
+node1 = BlockChainNode(private_key, public_key, "Miner1", args.addr, args.port+1,
+                       known_nodes_file_name=work_dir/"nodes1.txt", ledger_dir=work_dir/"ledger1", pending_transactions_file_name=work_dir/"pending1.journal",
+                       transport=args.transport)
+
+# The new node knows both of them
+with open(work_dir/"nodes2.txt","w") as f:
+    f.write(f"{args.addr}:{args.port}\n{args.addr}:{args.port+1}")
+new_private_key, new_public_key = generateKeys()
+node2 = BlockChainNode(new_private_key, new_public_key, "Newcomer", args.addr, args.port+2,
+                       known_nodes_file_name=work_dir/"nodes2.txt", ledger_dir=work_dir/"ledger2", pending_transactions_file_name=work_dir/"pending2.journal",
+                       transport=args.transport)
+
+deadline = time.time() + 60
+while not node2.ready and time.time() < deadline:
+    time.sleep(0.1)
+print(f"New node ledger height : {node2.block_chain.height}")
+print("Sync OK" if node2.ready and node2.block_chain.tip_hash==node0.block_chain.tip_hash else "Sync FAILED")
+print(f"Sync stats : {node2.sync_engine.stats()}")
+print(f"Balance of the miner on the new node : {node2.utxo.balance(node0.ledger[0].coinbase.outputs[0].public_key)}")
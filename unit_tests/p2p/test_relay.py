@@ -0,0 +1,55 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Hands to a gossip node frames broadcast with a ttl, coming from a peer that didn't say hello yet, from a verified
+#               peer (with a huge ttl), and frames the node refuses
+# Expected behaviour : Only the accepted frames of the verified peer are relayed, with their ttl lowered to the node max_ttl minus one
+from blockchain.p2p.gossip_net import GossipNode, GossipFrame, PeerIdentity
+from blockchain.p2p.wire_format import decode_frame_payload, FRAME_HEADER
+from blockchain.crypto_tools import generateKeys
+import argparse
+import tempfile
+from pathlib import Path
+
+parser = argparse.ArgumentParser()
+parser.add_argument('-a', "--addr", default="127.0.0.1")
+parser.add_argument('-p', "--port", default=46500,type=int)
+args = parser.parse_args()
+
+class RecordingConnection():
+    """Keeps the frames sent to a fake peer
+    """
+    def __init__(self):
+        self.frames = []
+
+    def sendall(self, data):
+        self.frames.append(decode_frame_payload(data[FRAME_HEADER.size:]))
+
+    def close(self):
+        pass
+
+class FilteringNode(GossipNode):
+    """Accepts the frames whose content is "good"
+    """
+    def process(self, node, data):
+        return data.metadata=="good"
+
+work_dir = Path(tempfile.mkdtemp())
+with open(work_dir/"nodes.txt","w") as f:
+    f.write("")
+private_key, public_key = generateKeys()
+node = FilteringNode(private_key, public_key, "Relay", args.addr, args.port, known_nodes_file_name=work_dir/"nodes.txt", max_ttl=3)
+
+unknown = PeerIdentity("", "10.0.0.1", 1, socket=RecordingConnection())
+verified = PeerIdentity("Peer", "10.0.0.2", 2, public_key="key", socket=RecordingConnection())
+listener = PeerIdentity("Listener", "10.0.0.3", 3, public_key="key", socket=RecordingConnection())
+for peer in [unknown, verified, listener]:
+    node.add_peer(peer)
+
+node.handle_frame(unknown, GossipFrame(100, "good", ttl=2))
+print(f"Frames relayed from a peer that didn't say hello : {len(listener.socket.frames)} (expected 0)")
+node.handle_frame(verified, GossipFrame(100, "bad", ttl=2))
+print(f"Refused frames relayed : {len(listener.socket.frames)} (expected 0)")
+node.handle_frame(verified, GossipFrame(100, "good", ttl=1000000))
+print(f"Accepted frames relayed : {len(listener.socket.frames)}, ttl {[frame.ttl for frame in listener.socket.frames]} (expected 1, [2])")
+print(f"Frames sent back to their sender : {len(verified.socket.frames)} (expected 0)")
+node.close()
@@ -0,0 +1,19 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Feeds message ids to the seen messages cache, with duplicates, then checks that the cache stays bounded in size and in time
+# Expected behaviour : Duplicates are dropped and counted, the oldest ids are forgotten when the cache is full and ids expire after the ttl
+from blockchain.p2p.seen_cache import SeenCache
+import time
+
+cache = SeenCache(max_size=100, ttl=0.5)
+accepted = [cache.add(i % 50) for i in range(100)]
+print(f"Accepted {sum(accepted)} of 100 messages (expected 50)")
+print(f"Stats : {cache.stats()} (expected 50 duplicates dropped)")
+
+for i in range(1000):
+    cache.add(1000 + i)
+print(f"Cache size after 1000 new ids : {len(cache)} (expected 100)")
+print("Oldest id forgotten" if 0 not in cache else "Oldest id still there")
+
+time.sleep(0.6)
+print("Expired id accepted again" if cache.add(1999) else "Expired id dropped")
@@ -0,0 +1,36 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Builds time keepers with an offset file : a recent offset saved for the same server, an old one, one saved for another server,
+#               then measures the offset in the background with a NTP server that can't be reached
+# Expected behaviour : Only the recent offset of the same server is used, the time keeper starts right away and keeps the saved offset when the server doesn't answer
+from blockchain.p2p.time_keeper import TimeKeeper
+import json
+import tempfile
+import time
+from pathlib import Path
+
+offset_file = Path(tempfile.mkdtemp())/"ntp_offset.json"
+
+def save(server, offset, age):
+    with open(offset_file, "w") as f:
+        json.dump({"server":server, "offset":offset, "measured_at":time.time()-age}, f)
+
+save("ntp.invalid", 1.5, 60)
+keeper = TimeKeeper("ntp.invalid", offset_file)
+print(f"Recent offset : {keeper.offset} from {keeper.source} (expected 1.5 from cached)")
+
+save("ntp.invalid", 1.5, 2*24*3600)
+keeper = TimeKeeper("ntp.invalid", offset_file)
+print(f"Old offset : {keeper.offset} from {keeper.source} (expected 0.0 from None)")
+
+save("other.server", 1.5, 60)
+keeper = TimeKeeper("ntp.invalid", offset_file)
+print(f"Other server offset : {keeper.offset} from {keeper.source} (expected 0.0 from None)")
+
+save("ntp.invalid", -2.0, 60)
+start = time.perf_counter()
+keeper = TimeKeeper("ntp.invalid", offset_file, timeout=1).start()
+print(f"Started in {(time.perf_counter()-start)*1000:.1f}ms")
+print("Offset known" if keeper.wait() else "Offset unknown")
+print(f"Offset after the failed measure : {keeper.offset} from {keeper.source} (expected -2.0 from cached)")
+print("Network time corrected" if abs(keeper.time() - (time.time() - 2.0)) < 0.1 else "Network time not corrected")
@@ -0,0 +1,73 @@
+# Unit test :
+# Author : ParisNeo
+# Description : Tests the binary wire format. Encodes gossip frames carrying a peer identity and a signed block,
+#               sends them through a local socket pair in tiny pieces and decodes them on the other side
+# Expected behaviour : The frames are decoded identical to what was sent, the block is unchanged, the metadata of the encoded frame types
+#                      is left encoded and a corrupted frame is refused, like frames with deeply nested metadata or a malformed peer identity
+
+from blockchain.data.transaction import Transaction
+from blockchain.data.input import Input
+from blockchain.data.output import Output
+from blockchain.data.block import Block
+from blockchain.data.codec import CodecError, Encoded, decode, TAG_LIST, TAG_NONE
+from blockchain.p2p.gossip_frame import GossipFrame, PeerIdentity
+from blockchain.p2p.wire_format import encode_frame, decode_frame_payload, FrameReader, FRAME_HEADER
+from blockchain.crypto_tools import generateKeys, publicKey2Text, sign, hash
+import socket
+import threading
+import time
+
+sender_private_key, sender_public_key = generateKeys()
+receiver_private_key, receiver_public_key = generateKeys()
+miner_private_key, miner_public_key = generateKeys()
+
+outputs = [Output(receiver_public_key, 100)]
+transaction = Transaction(0, time.time(), [Input(sender_private_key, sender_public_key, 100, hash(b"previous"), 0, outputs)], outputs)
+transaction.sign(miner_private_key)
+block = Block(0, time.time(), Transaction(0, time.time(), [], [Output(miner_public_key, 10)]), [transaction])
+block.sign(miner_private_key)
+
+identity = PeerIdentity("Miner0", "127.0.0.1", 44444, publicKey2Text(miner_public_key), sign(miner_private_key, b"hello"))
+
+frames = [GossipFrame(0, identity), GossipFrame(2, 1234), GossipFrame(4, block), GossipFrame(1, "")]
+data = b"".join(encode_frame(f) for f in frames)
+
+a, b = socket.socketpair()
+def send_slowly():
+    # Send the frames in small pieces to simulate frames spread over many TCP segments
+    for i in range(0, len(data), 7):
+        a.sendall(data[i:i+7])
+threading.Thread(target=send_slowly).start()
+
+reader = FrameReader(b, initial_buffer_size=16)
+received = [reader.read_frame() for _ in frames]
+print("Message ids OK" if [f.message_id for f in received]==[f.message_id for f in frames] else "Message ids FAILED")
+print("Peer identity OK" if received[0].metadata.nick_name=="Miner0" and received[0].metadata.signature==identity.signature else "Peer identity FAILED")
+print("Metadata OK" if received[1].metadata==1234 and received[3].metadata=="" else "Metadata FAILED")
+print("Block OK" if received[2].metadata.serialize()==block.serialize() and received[2].metadata.signature==block.signature else "Block FAILED")
+
+# Frames of the encoded types keep their metadata as bytes, decoded later
+frame = decode_frame_payload(encode_frame(GossipFrame(9, transaction))[FRAME_HEADER.size:], encoded_types={9})
+print("Encoded metadata OK" if isinstance(frame.metadata, Encoded) and decode(frame.metadata.data).hash==transaction.hash else "Encoded metadata FAILED")
+
+# A corrupted frame must be refused, never decoded
+a.sendall(b"XX" + encode_frame(frames[1])[2:])
+try:
+    reader.read_frame()
+    print("Corrupted frame accepted")
+except CodecError as ex:
+    print(f"Corrupted frame refused : {ex}")
+a.close()
+b.close()
+
+def refused(payload):
+    try:
+        decode_frame_payload(payload)
+        return False
+    except CodecError:
+        return True
+
+payload = encode_frame(GossipFrame(2, None))[FRAME_HEADER.size:]
+print(f"Frame with deeply nested metadata refused : {refused(payload[:-1] + bytes([TAG_LIST, 1])*100000 + bytes([TAG_NONE]))} (expected True)")
+bad_identity = PeerIdentity("Miner0", "127.0.0.1", "44444", publicKey2Text(miner_public_key), identity.signature)
+print(f"Hello with a text as port refused : {refused(encode_frame(GossipFrame(0, bad_identity))[FRAME_HEADER.size:])} (expected True)")